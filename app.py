@@ -1,16 +1,17 @@
 """
 Основной файл приложения с общими настройками
 """
+import logging
 import streamlit as st
 from dotenv import load_dotenv
-import os
-import psycopg2
-from psycopg2 import OperationalError
-import pandas as pd
+from datasets.profiling import profile_run
+from db_connection import DB_CONFIG, get_db_connection
 
 # Загрузка переменных окружения
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 def init_app():
     """
     Инициализация основных настроек приложения
@@ -36,40 +37,35 @@ def display_header():
 
 def connect_to_db(host, dbname, user, password, port, sslmode='require'):
     """
-    Подключение к базе данных
+    Подключение к базе данных: создает (или переиспользует) пул соединений
+    и возвращает конфигурацию подключения
     """
     try:
-        st.write("Debug: Attempting to connect to DB with params:", {  # Отладочная информация
-            "host": host,
-            "dbname": dbname,
-            "user": user,
-            "port": port
-        })
-        conn = psycopg2.connect(
-            host=host,
-            port=int(port),
-            user=user,
-            password=password,
-            dbname=dbname,
-            sslmode=sslmode
-        )
-        st.write("Debug: Connection successful")  # Отладочная информация
-        return conn
+        config = {
+            'host': host,
+            'port': int(port),
+            'user': user,
+            'password': password,
+            'dbname': dbname,
+            'sslmode': sslmode
+        }
+        with get_db_connection(config):
+            pass
+        return config
     except Exception as e:
         st.error(f"Ошибка подключения: {e}")
         return None
 
-def check_connection(conn):
+def check_connection(config):
     """
-    Проверка соединения с БД
+    Проверка соединения с БД (соединение проверяется пулом при выдаче)
     """
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        st.write("Debug: Connection check successful")  # Отладочная информация
+        with get_db_connection(config):
+            pass
         return True
     except Exception as e:
-        st.write(f"Debug: Connection check failed: {e}")  # Отладочная информация
+        logger.warning("Проверка соединения с БД не прошла: %s", e)
         return False
 
 def display_db_connection():
@@ -82,18 +78,17 @@ def display_db_connection():
         # Кнопка для использования .env
         if st.button("Использовать .env"):
             try:
-                st.write("Debug: Using .env credentials")  # Отладочная информация
-                conn = connect_to_db(
-                    host=os.getenv('DB_HOST'),
-                    dbname=os.getenv('DB_NAME'),
-                    user=os.getenv('DB_USER'),
-                    password=os.getenv('DB_PASSWORD'),
-                    port=os.getenv('DB_PORT', '5432')
+                config = connect_to_db(
+                    host=DB_CONFIG['host'],
+                    dbname=DB_CONFIG['dbname'],
+                    user=DB_CONFIG['user'],
+                    password=DB_CONFIG['password'],
+                    port=DB_CONFIG['port'],
+                    sslmode=DB_CONFIG['sslmode']
                 )
-                if conn:
-                    st.session_state["conn"] = conn
+                if config:
+                    st.session_state["db_config"] = config
                     st.success("Подключение установлено!")
-                    st.write("Debug: Connection stored in session_state")  # Отладочная информация
             except Exception as e:
                 st.error(f"Ошибка при подключении через .env: {e}")
         
@@ -108,23 +103,21 @@ def display_db_connection():
         connect_button = st.button("Подключиться")
         
         if connect_button:
-            conn = connect_to_db(host, dbname, user, password, port)
-            if conn:
-                st.session_state["conn"] = conn
+            config = connect_to_db(host, dbname, user, password, port)
+            if config:
+                st.session_state["db_config"] = config
                 st.success("Подключение установлено!")
-                st.write("Debug: Connection stored in session_state")  # Отладочная информация
             else:
-                st.session_state["conn"] = None
+                st.session_state["db_config"] = None
         
         # Отображение статуса подключения
-        conn = st.session_state.get("conn", None)
-        if conn and check_connection(conn):
+        config = st.session_state.get("db_config", None)
+        if config and check_connection(config):
             st.success("Статус: Подключено")
-            st.write("Debug: Connection is valid")  # Отладочная информация
-        elif conn:
+        elif config:
             st.error("Статус: Отключено")
-            st.session_state.pop("conn")
-            conn = None
+            st.session_state.pop("db_config")
+            config = None
         else:
             st.warning("Статус: Не подключено")
 
@@ -133,7 +126,7 @@ def check_auth():
     Проверка авторизации пользователя
     """
     # Проверяем наличие подключения к БД
-    if "conn" not in st.session_state or not st.session_state["conn"]:
+    if "db_config" not in st.session_state or not st.session_state["db_config"]:
         display_db_connection()
         return False
     return True
@@ -146,41 +139,39 @@ def main():
     display_header()
     
     if check_auth():
-<<<<<<< HEAD
         tabs = st.tabs(["Moving Status", "Shifts", "Measurment"])
-=======
-        tabs = st.tabs(["Moving Status", "Shifts"])
->>>>>>> 59fb1d1 (разделен дашборд и апп)
         with tabs[0]:
             try:
-                if "conn" in st.session_state and st.session_state["conn"]:
+                if "db_config" in st.session_state and st.session_state["db_config"]:
                     from dashboards.fleet_status import run_dashboard
-                    run_dashboard()
+                    with profile_run("Moving Status"):
+                        run_dashboard()
                 else:
                     st.warning("Нет подключения к базе данных")
             except Exception as e:
                 st.error(f"Ошибка в Moving Status: {e}")
         with tabs[1]:
             try:
-                if "conn" in st.session_state and st.session_state["conn"]:
+                if "db_config" in st.session_state and st.session_state["db_config"]:
                     from dashboards.shifts import run_shifts_dashboard
-                    run_shifts_dashboard()
+                    with profile_run("Shifts"):
+                        run_shifts_dashboard()
                 else:
                     st.warning("Нет подключения к базе данных")
             except Exception as e:
                 st.error(f"Ошибка в Shifts: {e}")
-<<<<<<< HEAD
         with tabs[2]:
             try:
-                if "conn" in st.session_state and st.session_state["conn"]:
+                if "db_config" in st.session_state and st.session_state["db_config"]:
                     from dashboards.measurment import run_measurment_dashboard
-                    run_measurment_dashboard()
+                    with profile_run("Measurment"):
+                        run_measurment_dashboard()
                 else:
                     st.warning("Нет подключения к базе данных")
             except Exception as e:
                 st.error(f"Ошибка в Measurment: {e}")
-=======
->>>>>>> 59fb1d1 (разделен дашборд и апп)
+        from dashboards.performance import display_performance_panel
+        display_performance_panel()
     else:
         st.info("Пожалуйста, подключитесь к базе данных для продолжения")
 
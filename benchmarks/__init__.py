@@ -0,0 +1,3 @@
+"""
+Бенчмарки этапов обработки данных дашборда
+"""
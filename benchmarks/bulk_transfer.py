@@ -0,0 +1,74 @@
+"""
+Сверка и сравнение выгрузки сырых точек и inputs: pd.read_sql, построчная
+выборка (Query.execute) и COPY TO STDOUT (Query.execute_bulk)
+
+Запуск: python -m benchmarks.bulk_transfer --days 1 --hours 24 --repeat 3
+Параметры подключения берутся из переменных окружения PG* (как у psycopg2).
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import pandas as pd
+import psycopg2
+from datasets.measurment import INPUTS_WINDOW
+from datasets.shifts import SHIFTS_POINTS_QUERIES
+
+def _read_sql(conn, query, params):
+    return pd.read_sql(query.sql, conn, params=params)
+
+LOADERS = {
+    'read_sql': _read_sql,
+    'execute': lambda conn, query, params: query.execute(conn, params),
+    'copy': lambda conn, query, params: query.execute_bulk(conn, params)
+}
+
+def measure(conn, query, params, repeat=3):
+    """
+    Выгружает результат запроса каждым способом и проверяет совпадение
+
+    Returns:
+        dict: Лучшее время (с) и пик памяти Python (МБ) по способам и число строк
+    """
+    results = {}
+    frames = {}
+    for name, load in LOADERS.items():
+        load(conn, query, params)  # прогрев: PREPARE, типы колонок, кэш страниц
+        seconds = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            load(conn, query, params)
+            seconds.append(time.perf_counter() - started)
+        tracemalloc.start()
+        frames[name] = load(conn, query, params)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {'seconds': min(seconds), 'peak_mb': peak / 2 ** 20}
+    for name in ('execute', 'copy'):
+        pd.testing.assert_frame_equal(frames['read_sql'], frames[name], check_dtype=False)
+    return {'rows': len(frames['copy']), **results}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=float, default=1, help='Период точек треков, дней')
+    parser.add_argument('--hours', type=int, default=24, help='Период inputs, часов')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    end_date = datetime.now()
+    cases = {
+        'tracking_data_core': (SHIFTS_POINTS_QUERIES[''], {'start_date': end_date - timedelta(days=args.days), 'end_date': end_date}),
+        'inputs': (INPUTS_WINDOW, {'hours': args.hours})
+    }
+    conn = psycopg2.connect('')
+    try:
+        for case, (query, params) in cases.items():
+            result = measure(conn, query, params, args.repeat)
+            print(f"{case}: rows={result['rows']} (результаты совпадают)")
+            for name in LOADERS:
+                print(f"  {name:<9} {result[name]['seconds']:8.3f} s  peak {result[name]['peak_mb']:8.1f} MB")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Бенчмарк калибровки: построчный apply против CalibrationTable
+
+Запуск: python -m benchmarks.calibration --rows 20000 --sensors 500
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from datasets.calibration import CalibrationTable
+
+def calibrate_rowwise(agg, df_calib):
+    """
+    Прежняя построчная калибровка из get_measurment_data (эталон для сравнения)
+    """
+    def calibrate(row, val_col):
+        sid = row['sensor_id']
+        val = row[val_col]
+        calib = df_calib[df_calib['sensor_id'] == sid]
+        if calib.empty:
+            return val
+        below = calib[calib['cal_value'] <= val]
+        above = calib[calib['cal_value'] >= val]
+        if below.empty or above.empty:
+            return val
+        low = below.iloc[below['cal_value'].argmax()]
+        high = above.iloc[above['cal_value'].argmin()]
+        if high['cal_value'] == low['cal_value']:
+            return low['cal_volume']
+        return low['cal_volume'] + ((val - low['cal_value']) / (high['cal_value'] - low['cal_value'])) * (high['cal_volume'] - low['cal_volume'])
+
+    return np.column_stack([
+        agg.apply(lambda r: calibrate(r, col), axis=1).to_numpy(dtype=float)
+        for col in ('value_avg', 'value_min', 'value_max')
+    ])
+
+def calibrate_vectorized(agg, df_calib):
+    """
+    Калибровка через CalibrationTable (включая построение таблиц)
+    """
+    calibration = CalibrationTable(df_calib)
+    return calibration.interpolate(agg['sensor_id'], agg[['value_avg', 'value_min', 'value_max']])
+
+def make_data(rows, sensors, points, seed=0):
+    """
+    Синтетические часовые агрегаты и калибровочные таблицы
+    """
+    rng = np.random.default_rng(seed)
+    calib = []
+    # Каждый десятый сенсор без таблицы, у части таблиц повторяются cal_value
+    for sensor_id in range(sensors):
+        if sensor_id % 10 == 9:
+            continue
+        cal_value = np.sort(rng.uniform(0, 1000, points))
+        cal_volume = np.cumsum(rng.uniform(1, 50, points))
+        calib.append(pd.DataFrame({'sensor_id': sensor_id, 'cal_value': cal_value, 'cal_volume': cal_volume}))
+        if sensor_id % 7 == 0:
+            calib.append(pd.DataFrame({'sensor_id': [sensor_id], 'cal_value': [cal_value[points // 2]], 'cal_volume': [-1.0]}))
+    df_calib = pd.concat(calib, ignore_index=True).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+    avg = rng.uniform(-100, 1100, rows)
+    spread = rng.uniform(0, 50, rows)
+    agg = pd.DataFrame({
+        'sensor_id': rng.integers(0, sensors, rows).astype(float),
+        'value_avg': avg,
+        'value_min': avg - spread,
+        'value_max': avg + spread
+    })
+    agg.loc[agg.sample(frac=0.01, random_state=seed).index, 'value_avg'] = np.nan
+    return agg, df_calib
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000, help='Число часовых агрегатов')
+    parser.add_argument('--sensors', type=int, default=500, help='Число сенсоров')
+    parser.add_argument('--points', type=int, default=20, help='Точек в калибровочной таблице')
+    args = parser.parse_args()
+
+    agg, df_calib = make_data(args.rows, args.sensors, args.points)
+    vectorized, vectorized_time = timed(calibrate_vectorized, agg, df_calib)
+    rowwise, rowwise_time = timed(calibrate_rowwise, agg, df_calib)
+
+    if not np.allclose(rowwise, vectorized, equal_nan=True):
+        raise SystemExit("Результаты построчной и векторной калибровки расходятся")
+
+    print(f"rows={args.rows} sensors={args.sensors} calib_rows={len(df_calib)}")
+    print(f"rowwise:    {rowwise_time:8.3f} s")
+    print(f"vectorized: {vectorized_time:8.3f} s  (x{rowwise_time / vectorized_time:.0f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Размер данных линейного графика: полная сводная таблица против top-N серий
+с огибающей по бакетам (datasets.downsampling)
+
+Запуск: python -m benchmarks.downsampling --series 1000 --points 2000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from datasets.downsampling import DEFAULT_BUCKETS, DEFAULT_MAX_SERIES, downsample_series
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--series', type=int, default=1000)
+    parser.add_argument('--points', type=int, default=2000, help='Точек на серию')
+    parser.add_argument('--max-series', type=int, default=DEFAULT_MAX_SERIES)
+    parser.add_argument('--buckets', type=int, default=DEFAULT_BUCKETS)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'hour_bucket': np.tile(pd.date_range('2026-01-01', periods=args.points, freq='min'), args.series),
+        'series': np.repeat([f'object {i:05d} / sensor' for i in range(args.series)], args.points),
+        'value': rng.normal(0, 1, args.series * args.points).cumsum()
+    })
+
+    started = time.perf_counter()
+    wide = df.pivot_table(index='hour_bucket', columns='series', values='value')
+    pivot_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    chart, shown, total = downsample_series(df, 'hour_bucket', 'value', 'series', args.max_series, 'range', args.buckets)
+    downsample_seconds = time.perf_counter() - started
+    assert shown <= args.max_series and chart.groupby('series').size().max() <= 4 * args.buckets
+
+    print(f"rows={len(df)} series={total}")
+    print(f"pivot:      {wide.size:>10} cells {len(wide.to_json()) / 2 ** 20:8.1f} MB json {pivot_seconds:8.3f} s")
+    print(f"downsample: {len(chart):>10} rows  {len(chart.to_json()) / 2 ** 20:8.1f} MB json {downsample_seconds:8.3f} s ({shown} series)")
+
+if __name__ == '__main__':
+    main()
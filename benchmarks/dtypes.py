@@ -0,0 +1,68 @@
+"""
+Память и скорость группировок: типы по умолчанию против компактной схемы (datasets.schema)
+
+Запуск: python -m benchmarks.dtypes --devices 2000 --points-per-device 500
+"""
+import argparse
+import time
+import pandas as pd
+from benchmarks.synthetic import generate_fleet
+from datasets.measurment import INPUTS_WINDOW, _hourly_rollup, _scale_inputs
+from datasets.schema import SENSOR_META_SCHEMA, apply_schema
+from datasets.shifts import SHIFTS_POINTS_QUERIES, _aggregate_tracks, _segment_points
+
+def _megabytes_per_million(df):
+    return df.memory_usage(deep=True).sum() / 2 ** 20 / len(df) * 1e6
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, default=2000)
+    parser.add_argument('--points-per-device', type=int, default=500)
+    args = parser.parse_args()
+
+    tables = generate_fleet(args.devices, args.points_per_device)
+    points = tables['raw_telematics_data.tracking_data_core'].sort_values(['device_id', 'device_time'], kind='stable')
+    inputs = tables['raw_telematics_data.inputs']
+    inputs = inputs.drop(columns='value').assign(raw_value=inputs['value'].astype(float))
+    meta = tables['raw_business_data.sensor_description'].set_index(['device_id', 'input_label'], drop=False).drop(columns='device_id')
+
+    variants = {
+        'default': (points.reset_index(drop=True), inputs.reset_index(drop=True), meta),
+        'compact': (
+            apply_schema(points.reset_index(drop=True), SHIFTS_POINTS_QUERIES[''].schema),
+            apply_schema(inputs.reset_index(drop=True), INPUTS_WINDOW.schema),
+            apply_schema(meta.copy(), SENSOR_META_SCHEMA)
+        )
+    }
+    results = {}
+    for name, (df_points, df_inputs, df_meta) in variants.items():
+        segmented, segment_seconds = _timed(_segment_points, df_points.copy(), 3, 300)
+        tracks, tracks_seconds = _timed(_aggregate_tracks, segmented)
+        scaled, scale_seconds = _timed(_scale_inputs, df_inputs, df_meta)
+        rollup, rollup_seconds = _timed(_hourly_rollup, scaled)
+        results[name] = {
+            'points MB/1M': _megabytes_per_million(df_points),
+            'inputs MB/1M': _megabytes_per_million(df_inputs),
+            'scaled MB/1M': _megabytes_per_million(scaled),
+            'segment s': segment_seconds,
+            'track groupby s': tracks_seconds,
+            'scale s': scale_seconds,
+            'hourly groupby s': rollup_seconds
+        }
+        results[name + '_frames'] = (tracks, rollup)
+
+    pd.testing.assert_frame_equal(results['default_frames'][0], results['compact_frames'][0], check_dtype=False)
+    default_rollup, compact_rollup = results['default_frames'][1], results['compact_frames'][1]
+    compact_rollup = compact_rollup.astype({column: object for column in compact_rollup.select_dtypes('category')})
+    pd.testing.assert_frame_equal(default_rollup, compact_rollup, check_dtype=False)
+
+    print(f"points={len(points)} inputs={len(inputs)} (результаты совпадают)")
+    print(pd.DataFrame({name: results[name] for name in variants}).round(3).to_string())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Бенчмарк и сверка геозон: сеточный индекс против полного перебора и PostGIS
+
+Запуск: python -m benchmarks.geozones --points 5000 --zones 300
+        python -m benchmarks.geozones --postgis  (сверка с ST_DWithin, параметры PG* из окружения)
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from datasets.geozones import GeozoneIndex, haversine
+
+# Допустимое расхождение со сфероидом PostGIS у границы зоны (доля радиуса)
+DEFAULT_TOLERANCE = 0.005
+
+POSTGIS_QUERY = '''
+    SELECT p.point, z.zone
+    FROM unnest(%(point_lat)s::float8[], %(point_lon)s::float8[]) WITH ORDINALITY AS p(lat, lon, point)
+    JOIN unnest(%(zone_lat)s::float8[], %(zone_lon)s::float8[], %(radius)s::float8[]) WITH ORDINALITY AS z(lat, lon, radius, zone)
+    ON ST_DWithin(
+        ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326)::geography,
+        ST_SetSRID(ST_MakePoint(z.lon, z.lat), 4326)::geography,
+        z.radius
+    )
+'''
+
+def make_data(points, zones, seed=0):
+    """
+    Случайные круговые зоны и точки вокруг Москвы
+    """
+    rng = np.random.default_rng(seed)
+    df_zones = pd.DataFrame({
+        'zone_label': [f'Z{i}' for i in range(zones)],
+        'zone_type': 'circle',
+        'circle_center_latitude': rng.uniform(55.5, 56.0, zones),
+        'circle_center_longitude': rng.uniform(37.2, 38.0, zones),
+        'radius': rng.uniform(100, 3000, zones)
+    })
+    lat = rng.uniform(55.5, 56.0, points)
+    lon = rng.uniform(37.2, 38.0, points)
+    return df_zones, lat, lon
+
+def match_bruteforce(index, lat, lon):
+    """
+    Эталон: проверка каждой точки против каждой зоны
+    """
+    distance = haversine(lat[:, None], lon[:, None], index.lat[None, :], index.lon[None, :])
+    return np.nonzero(distance <= index.radius[None, :])
+
+def match_postgis(conn, index, lat, lon):
+    """
+    Попадания по ST_DWithin на geography (сфероид WGS84)
+    """
+    pairs = pd.read_sql(POSTGIS_QUERY, conn, params={
+        'point_lat': lat.tolist(), 'point_lon': lon.tolist(),
+        'zone_lat': index.lat.tolist(), 'zone_lon': index.lon.tolist(), 'radius': index.radius.tolist()
+    })
+    return pairs['point'].to_numpy() - 1, pairs['zone'].to_numpy() - 1
+
+def boundary_mismatches(index, lat, lon, expected, actual, tolerance):
+    """
+    Расхождения в парах точка-зона вне допуска у границы зоны
+
+    Returns:
+        tuple: (число расхождений, число расхождений вне допуска)
+    """
+    expected = set(zip(*expected))
+    actual = set(zip(*actual))
+    diff = np.array(sorted(expected ^ actual), dtype=np.int64).reshape(-1, 2)
+    if not len(diff):
+        return 0, 0
+    distance = haversine(lat[diff[:, 0]], lon[diff[:, 0]], index.lat[diff[:, 1]], index.lon[diff[:, 1]])
+    radius = index.radius[diff[:, 1]]
+    return len(diff), int((np.abs(distance - radius) > tolerance * radius).sum())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--zones', type=int, default=300)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--postgis', action='store_true', help='Сверить с ST_DWithin в PostgreSQL')
+    args = parser.parse_args()
+
+    df_zones, lat, lon = make_data(args.points, args.zones)
+
+    started = time.perf_counter()
+    index = GeozoneIndex(df_zones)
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    indexed = index.match(lat, lon)
+    index.assign(lat, lon)
+    indexed_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    expected = match_bruteforce(index, lat, lon)
+    brute_seconds = time.perf_counter() - started
+
+    mismatches, _ = boundary_mismatches(index, lat, lon, expected, indexed, 0)
+    print(f"points={args.points} zones={args.zones} hits={len(indexed[0])}")
+    print(f"index build: {build_seconds:.4f}s, match+assign: {indexed_seconds:.4f}s, bruteforce: {brute_seconds:.4f}s")
+    print(f"index vs bruteforce mismatches: {mismatches}")
+    assert mismatches == 0
+
+    if args.postgis:
+        import psycopg2
+        conn = psycopg2.connect('')
+        try:
+            started = time.perf_counter()
+            postgis = match_postgis(conn, index, lat, lon)
+            postgis_seconds = time.perf_counter() - started
+        finally:
+            conn.close()
+        total, outside = boundary_mismatches(index, lat, lon, postgis, indexed, args.tolerance)
+        print(f"postgis: {postgis_seconds:.4f}s, mismatches: {total}, outside tolerance {args.tolerance:.3%}: {outside}")
+        assert outside == 0
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Бенчмарк конвейеров дашборда по стадиям (fetch, transform, aggregate) на синтетическом парке
+
+Запуск: python -m benchmarks.pipelines --scales 100,1000,10000,50000 --output benchmark_results.json
+        python -m benchmarks.pipelines --backend postgres --replace  (локальная БД из PG*, таблицы очищаются)
+
+Backend memory - стенд в памяти: результаты запросов строятся из
+сгенерированных таблиц, справочники подставляются в DimensionCache, а
+transform/aggregate выполняются теми же функциями, что и в дашборде.
+"""
+import argparse
+import json
+import platform
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from benchmarks.synthetic import SIGNIFICANT_EVENTS, generate_fleet, load_postgres
+from datasets.dimensions import DIMENSION_QUERIES, DimensionCache, DimensionTable
+from datasets.measurment import INPUTS_WINDOW, _finalize_measurments, _hourly_rollup, _scale_inputs
+from datasets.queries import CURRENT_STATUS
+from datasets.schema import apply_schema
+from datasets.shifts import SHIFTS_POINTS_QUERIES, _aggregate_tracks, _finalize_tracks, _segment_points, _summarize_tracks
+from datasets.status import assign_geozones, classify_status
+
+STATUS_WINDOW = timedelta(minutes=15)
+
+class FrameDimensionCache(DimensionCache):
+    """
+    Кэш справочников, читающий таблицы из сгенерированных DataFrame вместо БД
+    """
+
+    _RENAMES = {'sensor_calibration_data': {'value': 'cal_value', 'volume': 'cal_volume'}}
+
+    def __init__(self, tables):
+        super().__init__(ttl=float('inf'))
+        for name, (table, _) in DIMENSION_QUERIES.items():
+            frame = tables[table].rename(columns=self._RENAMES.get(name, {}))
+            self._tables[name] = DimensionTable(frame, 'synthetic')
+
+    def get(self, conn, name):
+        return self._tables[name]
+
+class MemorySource:
+    """
+    Стенд в памяти: эквиваленты запросов над сгенерированными таблицами
+    """
+
+    def __init__(self, tables, now):
+        self.tables = tables
+        self.now = pd.Timestamp(now)
+        self.conn = None
+        self.dims = FrameDimensionCache(tables)
+
+    def shift_points(self, start_date, end_date):
+        points = self.tables['raw_telematics_data.tracking_data_core']
+        points = points[
+            (points['device_time'] >= start_date) & (points['device_time'] < end_date)
+            & points['event_id'].isin(SIGNIFICANT_EVENTS)
+        ]
+        points = points.sort_values(['device_id', 'device_time'], kind='stable').reset_index(drop=True)
+        return apply_schema(points, SHIFTS_POINTS_QUERIES[''].schema)
+
+    def inputs(self, hours):
+        inputs = self.tables['raw_telematics_data.inputs']
+        inputs = inputs[inputs['device_time'] >= self.now - timedelta(hours=hours)]
+        inputs = inputs.drop(columns='value').assign(raw_value=inputs['value'].astype(float)).reset_index(drop=True)
+        return apply_schema(inputs, INPUTS_WINDOW.schema)
+
+    def status(self):
+        points = self.tables['raw_telematics_data.tracking_data_core']
+        latest = points[points['device_time'] >= self.now - STATUS_WINDOW]
+        latest = latest.sort_values('device_time', kind='stable').drop_duplicates('device_id', keep='last')
+        frame = latest.join(self.dims.fleet_objects(None), on='device_id', how='inner').sort_values('device_id')
+        frame = frame.assign(
+            speed=frame['speed'] // 100,
+            latitude=frame['latitude'] / 1e7,
+            longitude=frame['longitude'] / 1e7,
+            last_connect=(self.now - frame['device_time']).dt.total_seconds(),
+            last_connect_formatted=frame['device_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        )
+        return frame[[
+            'object_id', 'device_id', 'object_label', 'first_name', 'last_name', 'speed',
+            'latitude', 'longitude', 'device_time', 'last_connect', 'last_connect_formatted'
+        ]].reset_index(drop=True)
+
+class PostgresSource:
+    """
+    Запросы дашборда к PostgreSQL с отдельным (не общим) кэшем справочников
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.dims = DimensionCache()
+
+    def shift_points(self, start_date, end_date):
+        return SHIFTS_POINTS_QUERIES[''].execute(self.conn, {'start_date': start_date, 'end_date': end_date})
+
+    def inputs(self, hours):
+        return INPUTS_WINDOW.execute(self.conn, {'hours': int(hours)})
+
+    def status(self):
+        return CURRENT_STATUS.execute(self.conn)
+
+def _timed(stages, stage, func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    stages[stage] = time.perf_counter() - started
+    return result
+
+def bench_dimensions(source):
+    stages = {}
+    for name in DIMENSION_QUERIES:
+        _timed(stages, name, source.dims.get, source.conn, name)
+    _timed(stages, 'derived', lambda: (
+        source.dims.sensor_meta(source.conn), source.dims.calibration(source.conn),
+        source.dims.objects(source.conn), source.dims.geozones(source.conn)
+    ))
+    return stages, sum(len(source.dims.get(source.conn, name).frame) for name in DIMENSION_QUERIES)
+
+def bench_shifts(source, start_date, end_date, min_speed=3, max_time_diff=300):
+    stages = {}
+    points = _timed(stages, 'fetch', source.shift_points, start_date, end_date)
+    points = _timed(stages, 'transform', _segment_points, points, min_speed, max_time_diff)
+    tracks = _timed(stages, 'aggregate', lambda: _finalize_tracks(_aggregate_tracks(points), min_speed))
+    _timed(stages, 'summary', _summarize_tracks, tracks, source.dims.objects(source.conn))
+    return stages, len(tracks)
+
+def bench_measurment(source, hours):
+    stages = {}
+    inputs = _timed(stages, 'fetch', source.inputs, hours)
+    scaled = _timed(stages, 'transform', _scale_inputs, inputs, source.dims.sensor_meta(source.conn))
+    agg = _timed(stages, 'aggregate', _hourly_rollup, scaled)
+    result = _timed(stages, 'finalize', _finalize_measurments, source.conn, agg, dims=source.dims)
+    return stages, len(result)
+
+def bench_status(source):
+    stages = {}
+    frame = _timed(stages, 'fetch', source.status)
+    frame = _timed(stages, 'transform', lambda: classify_status(assign_geozones(source.conn, frame, dims=source.dims)))
+    _timed(stages, 'aggregate', lambda: (
+        frame['connection_status'].value_counts(), frame['moving_status'].value_counts()
+    ))
+    return stages, len(frame)
+
+def run_scale(source, devices, points, span_hours, end_date):
+    """
+    Все конвейеры на одном масштабе
+
+    Returns:
+        list: Записи {devices, points, pipeline, stages, total, rows}
+    """
+    start_date = end_date - timedelta(hours=span_hours)
+    benches = {
+        'dimensions': lambda: bench_dimensions(source),
+        'shifts': lambda: bench_shifts(source, start_date, end_date),
+        'measurment': lambda: bench_measurment(source, span_hours),
+        'status': lambda: bench_status(source)
+    }
+    results = []
+    for pipeline, bench in benches.items():
+        stages, rows = bench()
+        results.append({
+            'devices': devices, 'points': points, 'pipeline': pipeline,
+            'stages': stages, 'total': sum(stages.values()), 'rows': rows
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scales', default='100,1000,10000,50000', help='Размеры парка через запятую')
+    parser.add_argument('--points-per-device', type=int, default=100)
+    parser.add_argument('--span-hours', type=float, default=24)
+    parser.add_argument('--backend', choices=['memory', 'postgres'], default='memory')
+    parser.add_argument('--replace', action='store_true', help='Разрешить очистку таблиц PostgreSQL перед загрузкой')
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+    if args.backend == 'postgres' and not args.replace:
+        parser.error('--backend postgres очищает таблицы raw_*: подтвердите флагом --replace')
+
+    conn = None
+    if args.backend == 'postgres':
+        import psycopg2
+        conn = psycopg2.connect('')
+
+    results = []
+    try:
+        for devices in (int(scale) for scale in args.scales.split(',')):
+            if conn is not None:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT LOCALTIMESTAMP')
+                    end_date = cursor.fetchone()[0]
+                conn.rollback()
+            else:
+                end_date = datetime.now()
+            tables = generate_fleet(devices, args.points_per_device, args.span_hours, end=end_date)
+            points = len(tables['raw_telematics_data.tracking_data_core'])
+            if conn is not None:
+                load_postgres(conn, tables, replace=True)
+                source = PostgresSource(conn)
+            else:
+                source = MemorySource(tables, end_date)
+            del tables
+            for record in run_scale(source, devices, points, args.span_hours, end_date):
+                results.append(record)
+                stages = ', '.join(f"{stage}={seconds:.3f}s" for stage, seconds in record['stages'].items())
+                print(f"{devices:>6} devices {record['pipeline']:<11} rows={record['rows']:<8} {stages}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'backend': args.backend,
+            'points_per_device': args.points_per_device,
+            'span_hours': args.span_hours,
+            'created_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'results': results
+        }, f, indent=2)
+    print(f"saved {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Одновременные одинаковые загрузки из нескольких сессий: без кэша каждая
+сессия выполняет загрузку сама, через ResultCache - одна загрузка на всех
+(каждая сессия получает копию результата)
+
+Запуск: python -m benchmarks.result_cache --sessions 20 --load-seconds 0.5
+"""
+import argparse
+import threading
+import time
+import numpy as np
+import pandas as pd
+from datasets.result_cache import ResultCache
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sessions', type=int, default=20, help='Одновременных сессий')
+    parser.add_argument('--load-seconds', type=float, default=0.5, help='Длительность одной загрузки')
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    loads = []
+    lock = threading.Lock()
+
+    def load():
+        with lock:
+            loads.append(1)
+        # Ожидание БД: поток отпускает GIL, как при выполнении запроса
+        time.sleep(args.load_seconds)
+        return pd.DataFrame({'value': np.arange(args.rows, dtype=np.float64)})
+
+    def run(fetch):
+        loads.clear()
+        results = [None] * args.sessions
+        start = threading.Barrier(args.sessions)
+
+        def session(i):
+            start.wait()
+            results[i] = fetch()
+
+        threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, len(loads), results
+
+    direct_seconds, direct_loads, _ = run(load)
+    cache = ResultCache(max_age=60)
+    cached_seconds, cached_loads, results = run(lambda: cache.get(('benchmark', args.rows), load))
+    # Одна загрузка, каждая сессия получает свою копию результата
+    assert cached_loads == 1 and all(result.equals(results[0]) and result is not results[0] for result in results[1:])
+
+    print(f"sessions={args.sessions} load={args.load_seconds} s rows={args.rows}")
+    print(f"direct: {direct_loads:>4} loads {direct_seconds:8.3f} s")
+    print(f"cached: {cached_loads:>4} loads {cached_seconds:8.3f} s")
+    print(cache.stats_frame().to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Сверка и сравнение скорости backend='pandas' и backend='sql' для get_shifts_data
+
+Запуск: python -m benchmarks.shift_backends --days 7 --min-speed 3 --max-time-diff 300
+Параметры подключения берутся из переменных окружения PG* (как у psycopg2).
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+import psycopg2
+from datasets.shifts import get_shifts_data
+
+def compare_backends(conn, start_date, end_date, min_speed=3, max_time_diff=300):
+    """
+    Считает треки обоими backend и проверяет, что результаты совпадают
+
+    Returns:
+        dict: Время каждого backend в секундах и число треков
+    """
+    timings = {}
+    results = {}
+    for backend in ('pandas', 'sql'):
+        start = time.perf_counter()
+        results[backend] = get_shifts_data(
+            conn, start_date, end_date, min_speed=min_speed, max_time_diff=max_time_diff, backend=backend
+        ).reset_index(drop=True)
+        timings[backend] = time.perf_counter() - start
+    pd.testing.assert_frame_equal(results['pandas'], results['sql'], check_dtype=False, rtol=1e-9)
+    return {'tracks': len(results['pandas']), **timings}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=float, default=1, help='Длина периода, дней')
+    parser.add_argument('--min-speed', type=int, default=3)
+    parser.add_argument('--max-time-diff', type=int, default=300)
+    args = parser.parse_args()
+
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=args.days)
+    conn = psycopg2.connect('')
+    try:
+        result = compare_backends(conn, start_date, end_date, args.min_speed, args.max_time_diff)
+    finally:
+        conn.close()
+    print(f"tracks={result['tracks']} (результаты совпадают)")
+    print(f"pandas: {result['pandas']:8.3f} s")
+    print(f"sql:    {result['sql']:8.3f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Сверка и сравнение скорости сводки по сменам: полный пересчет, хранилище
+треков и хранилище сводок по дням (холодное и прогретое)
+
+Запуск: python -m benchmarks.shift_summary --days 30 --min-speed 3 --max-time-diff 300
+Параметры подключения берутся из переменных окружения PG* (как у psycopg2).
+Хранилища создаются во временном каталоге.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+import pandas as pd
+import psycopg2
+from datasets.shifts import get_shifts_summary
+from datasets.summary_store import ShiftSummaryStore
+from datasets.track_store import TrackStore
+
+def compare_summaries(conn, start_date, end_date, directory, min_speed=3, max_time_diff=300):
+    """
+    Считает сводку каждым способом и проверяет, что с хранилищем сводок
+    результат совпадает с расчетом по хранилищу треков
+
+    Returns:
+        dict: Время каждого способа в секундах и число строк сводки
+    """
+    store = TrackStore(os.path.join(directory, 'tracks.sqlite3'))
+    summary_store = ShiftSummaryStore(os.path.join(directory, 'summary.sqlite3'))
+    variants = {
+        'full': {},
+        'track store': {'store': store},
+        'day cache (cold)': {'store': store, 'summary_store': summary_store},
+        'day cache (warm)': {'store': store, 'summary_store': summary_store}
+    }
+    timings = {}
+    results = {}
+    for name, kwargs in variants.items():
+        start = time.perf_counter()
+        results[name] = get_shifts_summary(conn, start_date, end_date, min_speed=min_speed, max_time_diff=max_time_diff, **kwargs)
+        timings[name] = time.perf_counter() - start
+    for name in ('day cache (cold)', 'day cache (warm)'):
+        pd.testing.assert_frame_equal(results['track store'], results[name])
+    return {'rows': len(results['track store']), **timings}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, default=30, help='Длина периода, полных дней до сегодняшнего включительно')
+    parser.add_argument('--min-speed', type=int, default=3)
+    parser.add_argument('--max-time-diff', type=int, default=300)
+    args = parser.parse_args()
+
+    end_date = date.today() + timedelta(days=1)
+    start_date = end_date - timedelta(days=args.days + 1)
+    conn = psycopg2.connect('')
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            result = compare_summaries(conn, start_date, end_date, directory, args.min_speed, args.max_time_diff)
+    finally:
+        conn.close()
+    print(f"rows={result.pop('rows')} (результаты совпадают)")
+    for name, seconds in result.items():
+        print(f"{name:<17} {seconds:8.3f} s")
+
+if __name__ == "__main__":
+    main()
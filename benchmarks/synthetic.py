@@ -0,0 +1,229 @@
+"""
+Генератор синтетической телематики для бенчмарков
+
+Создает согласованные таблицы tracking_data_core, inputs, sensor_description,
+sensor_calibration_data, objects, devices, employees, zones и
+description_parametrs и при необходимости загружает их в PostgreSQL.
+
+Запуск: python -m benchmarks.synthetic --devices 1000 --points-per-device 200 --span-hours 24 --load --replace
+Параметры подключения берутся из переменных окружения PG* (как у psycopg2).
+Загрузка с --replace очищает таблицы: используйте только локальную тестовую БД.
+"""
+import argparse
+import csv
+import io
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+SIGNIFICANT_EVENTS = [2, 802, 803, 804, 811]
+CENTER_LATITUDE = 55.75
+CENTER_LONGITUDE = 37.62
+# Сенсоры каждого устройства: (input_label, sensor_type, sensor_units, divider, multiplier)
+SENSORS = [
+    ('fuel1', 'fuel', '', 10.0, 1.0),
+    ('fuel2', 'fuel', 'l', 0.0, 1.0),
+    ('temp', 'temperature', 'C', 0.0, 1.0)
+]
+DESCRIPTIONS = pd.DataFrame({
+    'key': [1, 2, 1, 2],
+    'type': ['sensor_description_units_type'] * 2 + ['sensor_description_group_type'] * 2,
+    'description': ['liters', 'degrees', 'fuel', 'climate']
+})
+
+TABLE_DDL = {
+    'raw_telematics_data.tracking_data_core': '''
+        device_id bigint, device_time timestamp without time zone, speed integer,
+        latitude bigint, longitude bigint, altitude bigint, event_id integer
+    ''',
+    'raw_telematics_data.inputs': '''
+        device_id bigint, sensor_name text, event_id integer,
+        device_time timestamp without time zone, value text
+    ''',
+    'raw_business_data.sensor_description': '''
+        device_id bigint, input_label text, sensor_id bigint, sensor_label text, sensor_type text,
+        sensor_units text, divider double precision, multiplier double precision,
+        units_type integer, group_type integer
+    ''',
+    'raw_business_data.sensor_calibration_data': 'sensor_id bigint, value double precision, volume double precision',
+    'raw_business_data.objects': 'object_id bigint, device_id bigint, object_label text',
+    'raw_business_data.devices': 'device_id bigint',
+    'raw_business_data.employees': 'object_id bigint, first_name text, last_name text',
+    'raw_business_data.zones': '''
+        zone_label text, zone_type text, circle_center_longitude double precision,
+        circle_center_latitude double precision, radius double precision
+    ''',
+    'raw_business_data.description_parametrs': 'key integer, type text, description text'
+}
+
+TABLE_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS tracking_data_core_device_time ON raw_telematics_data.tracking_data_core (device_time)',
+    'CREATE INDEX IF NOT EXISTS tracking_data_core_device ON raw_telematics_data.tracking_data_core (device_id, device_time)',
+    'CREATE INDEX IF NOT EXISTS inputs_device_time ON raw_telematics_data.inputs (device_time)'
+]
+
+def _tracking_points(rng, devices, points_per_device, span, end):
+    """
+    Точки треков: чередование движения и стоянок, редкие разрывы связи
+    """
+    n = devices * points_per_device
+    device_id = np.repeat(np.arange(1, devices + 1), points_per_device)
+    # Равномерная сетка по времени со сдвигом и дрожанием для каждого устройства
+    step = span.total_seconds() / points_per_device
+    offsets = (np.tile(np.arange(points_per_device), devices) + rng.uniform(0, 0.9, n)) * step
+    offsets += np.repeat(rng.uniform(0, step, devices), points_per_device)
+    device_time = pd.Timestamp(end) - span + pd.to_timedelta(np.minimum(offsets, span.total_seconds() - 1e-3), unit='s')
+
+    # Движение участками: в каждом участке устройство либо едет, либо стоит
+    segment = np.tile(np.arange(points_per_device) // 20, devices) + device_id * 1000
+    moving = rng.random(segment.max() + 1) < 0.6
+    speed = np.where(moving[segment], rng.normal(4500, 1500, n).clip(300, 12000), rng.uniform(0, 250, n)).astype(np.int32)
+
+    heading = rng.uniform(0, 2 * np.pi, n)
+    distance = speed / 100 / 3600 * step / 111.0
+    start_lat = np.repeat(CENTER_LATITUDE + rng.normal(0, 0.2, devices), points_per_device)
+    start_lon = np.repeat(CENTER_LONGITUDE + rng.normal(0, 0.3, devices), points_per_device)
+    walk_lat = pd.Series(distance * np.sin(heading)).groupby(device_id).cumsum().to_numpy()
+    walk_lon = pd.Series(distance * np.cos(heading)).groupby(device_id).cumsum().to_numpy()
+
+    events = rng.choice(SIGNIFICANT_EVENTS + [0, 1], n, p=[0.6, 0.1, 0.1, 0.05, 0.05, 0.05, 0.05])
+    return pd.DataFrame({
+        'device_id': device_id,
+        'device_time': device_time,
+        'speed': speed,
+        'latitude': ((start_lat + walk_lat) * 1e7).astype(np.int64),
+        'longitude': ((start_lon + walk_lon) * 1e7).astype(np.int64),
+        'altitude': (rng.normal(150, 20, n) * 1e7).astype(np.int64),
+        'event_id': events
+    })
+
+def generate_fleet(devices=100, points_per_device=100, span_hours=24, end=None, seed=0):
+    """
+    Генерирует согласованный набор таблиц для парка устройств
+
+    Args:
+        devices (int): Число устройств
+        points_per_device (int): Точек трека на устройство (столько же
+            показаний на каждый сенсор)
+        span_hours (float): Период данных, часов, заканчивающийся в end
+        end (datetime): Конец периода (по умолчанию текущее время)
+        seed (int): Зерно генератора случайных чисел
+
+    Returns:
+        dict: Таблицы по полному имени ('raw_business_data.objects' и т.д.)
+    """
+    rng = np.random.default_rng(seed)
+    end = end or datetime.now()
+    span = timedelta(hours=span_hours)
+    tracking = _tracking_points(rng, devices, points_per_device, span, end)
+    device_ids = np.arange(1, devices + 1)
+
+    sensors = pd.DataFrame(SENSORS, columns=['input_label', 'sensor_type', 'sensor_units', 'divider', 'multiplier'])
+    description = sensors.merge(pd.DataFrame({'device_id': device_ids}), how='cross')
+    description['sensor_id'] = np.arange(1, len(description) + 1)
+    description['sensor_label'] = description['input_label'] + ' #' + description['device_id'].astype(str)
+    description['units_type'] = np.where(description['sensor_type'] == 'fuel', 1, 2)
+    description['group_type'] = description['units_type']
+    description = description[[
+        'device_id', 'input_label', 'sensor_id', 'sensor_label', 'sensor_type',
+        'sensor_units', 'divider', 'multiplier', 'units_type', 'group_type'
+    ]]
+
+    # Калибровка топливных сенсоров: 10 точек монотонной таблицы
+    fuel = description.loc[description['sensor_type'] == 'fuel', 'sensor_id'].to_numpy()
+    calibration = pd.DataFrame({
+        'sensor_id': np.repeat(fuel, 10),
+        'value': np.tile(np.linspace(0, 1000, 10), len(fuel)),
+        'volume': (np.tile(np.linspace(0, 1, 10) ** 1.3, len(fuel)) * np.repeat(rng.uniform(200, 600, len(fuel)), 10)).round(2)
+    })
+
+    # Показания сенсоров в моменты точек трека
+    readings = tracking[['device_id', 'device_time', 'event_id']].merge(sensors[['input_label']], how='cross')
+    readings = readings.rename(columns={'input_label': 'sensor_name'})
+    readings['value'] = rng.uniform(0, 1000, len(readings)).round(1).astype(str)
+    inputs = readings[['device_id', 'sensor_name', 'event_id', 'device_time', 'value']]
+
+    objects = pd.DataFrame({
+        'object_id': device_ids + 100000,
+        'device_id': device_ids,
+        'object_label': [f'Vehicle {i:05d}' for i in device_ids]
+    })
+    staffed = objects.sample(frac=0.8, random_state=seed)
+    employees = pd.DataFrame({
+        'object_id': staffed['object_id'].to_numpy(),
+        'first_name': [f'Name{i}' for i in range(len(staffed))],
+        'last_name': [f'Surname{i}' for i in range(len(staffed))]
+    })
+
+    zone_count = max(10, devices // 20)
+    zones = pd.DataFrame({
+        'zone_label': [f'Zone {i}' for i in range(zone_count)],
+        'zone_type': np.where(rng.random(zone_count) < 0.9, 'circle', 'polygon'),
+        'circle_center_longitude': CENTER_LONGITUDE + rng.normal(0, 0.3, zone_count),
+        'circle_center_latitude': CENTER_LATITUDE + rng.normal(0, 0.2, zone_count),
+        'radius': rng.uniform(200, 5000, zone_count)
+    })
+
+    return {
+        'raw_telematics_data.tracking_data_core': tracking,
+        'raw_telematics_data.inputs': inputs,
+        'raw_business_data.sensor_description': description,
+        'raw_business_data.sensor_calibration_data': calibration,
+        'raw_business_data.objects': objects,
+        'raw_business_data.devices': pd.DataFrame({'device_id': device_ids}),
+        'raw_business_data.employees': employees,
+        'raw_business_data.zones': zones,
+        'raw_business_data.description_parametrs': DESCRIPTIONS.copy()
+    }
+
+def load_postgres(conn, tables, replace=False):
+    """
+    Создает недостающие таблицы и загружает данные через COPY
+
+    Args:
+        conn: Соединение psycopg2
+        tables (dict): Результат generate_fleet
+        replace (bool): Очистить таблицы перед загрузкой
+    """
+    with conn.cursor() as cursor:
+        for table, columns in TABLE_DDL.items():
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {table.split(".")[0]}')
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+            if replace:
+                cursor.execute(f'TRUNCATE {table}')
+        for index in TABLE_INDEXES:
+            cursor.execute(index)
+        for table, frame in tables.items():
+            buffer = io.StringIO()
+            # Строки в кавычках, чтобы пустые строки не превращались в NULL
+            frame.to_csv(buffer, index=False, header=False, quoting=csv.QUOTE_NONNUMERIC)
+            buffer.seek(0)
+            cursor.copy_expert(f'COPY {table} ({", ".join(frame.columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+        for table in tables:
+            cursor.execute(f'ANALYZE {table}')
+    conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--points-per-device', type=int, default=100)
+    parser.add_argument('--span-hours', type=float, default=24)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--load', action='store_true', help='Загрузить в PostgreSQL')
+    parser.add_argument('--replace', action='store_true', help='Очистить таблицы перед загрузкой')
+    args = parser.parse_args()
+
+    tables = generate_fleet(args.devices, args.points_per_device, args.span_hours, seed=args.seed)
+    for table, frame in tables.items():
+        print(f"{table}: {len(frame)} rows")
+    if args.load:
+        import psycopg2
+        conn = psycopg2.connect('')
+        try:
+            load_postgres(conn, tables, replace=args.replace)
+        finally:
+            conn.close()
+        print("loaded")
+
+if __name__ == '__main__':
+    main()
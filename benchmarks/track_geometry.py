@@ -0,0 +1,55 @@
+"""
+Упрощение полилиний треков на синтетических точках: сверка отбора по
+бюджету с полным деревом Дугласа-Пекера, время и число точек для карты
+
+Запуск: python -m benchmarks.track_geometry --devices 100 --points-per-device 20000 --max-points 200
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import generate_fleet
+from datasets import track_geometry
+from datasets.schema import TRACKING_POINTS_SCHEMA, apply_schema
+from datasets.shifts import _segment_points
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--points-per-device', type=int, default=20000)
+    parser.add_argument('--span-hours', type=float, default=48)
+    parser.add_argument('--tolerance', type=float, default=track_geometry.DEFAULT_TOLERANCE)
+    parser.add_argument('--max-points', type=int, default=track_geometry.DEFAULT_MAX_POINTS)
+    args = parser.parse_args()
+
+    tables = generate_fleet(args.devices, args.points_per_device, args.span_hours)
+    points = tables['raw_telematics_data.tracking_data_core'].sort_values(['device_id', 'device_time'], kind='stable')
+    points = _segment_points(apply_schema(points.reset_index(drop=True), TRACKING_POINTS_SCHEMA), 3, 300)
+    track = points.groupby(['device_id', 'temp_track_id'], sort=False).ngroup().to_numpy()
+    latitude = points['latitude'].to_numpy(dtype=float) / 1e7
+    longitude = points['longitude'].to_numpy(dtype=float) / 1e7
+
+    started = time.perf_counter()
+    geometry = track_geometry.simplify_tracks(latitude, longitude, track, args.tolerance, args.max_points)
+    seconds = time.perf_counter() - started
+
+    # Без отсечения по бюджету строится все дерево упрощения
+    pruned = track_geometry._importance
+    track_geometry._importance = lambda x, y, starts, ends, tolerance, max_inner=None: pruned(x, y, starts, ends, tolerance)
+    try:
+        started = time.perf_counter()
+        full = track_geometry.simplify_tracks(latitude, longitude, track, args.tolerance, args.max_points)
+        full_seconds = time.perf_counter() - started
+    finally:
+        track_geometry._importance = pruned
+    pd.testing.assert_frame_equal(geometry, full)
+    assert (geometry['path_points'] <= max(args.max_points, 2)).all()
+
+    print(f"points={len(points)} tracks={len(geometry)} (результаты совпадают)")
+    print(f"points on map: {int(geometry['path_points'].sum())} (max per track {int(geometry['path_points'].max())})")
+    print(f"distance: {geometry['distance_m'].sum() / 1000:.1f} km, mean per track {np.mean(geometry['distance_m']) / 1000:.2f} km")
+    print(f"budget pruning: {seconds:8.3f} s")
+    print(f"full tree:      {full_seconds:8.3f} s")
+
+if __name__ == '__main__':
+    main()
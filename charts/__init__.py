@@ -3,5 +3,7 @@
 """
 
 from .movement_status_chart import display_movement_status_chart
+from .connection_status_chart import display_connection_status_chart
+from .track_map_chart import display_track_map
 
-__all__ = ['display_movement_status_chart'] 
\ No newline at end of file
+__all__ = ['display_movement_status_chart', 'display_connection_status_chart', 'display_track_map'] 
\ No newline at end of file
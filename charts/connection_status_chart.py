@@ -0,0 +1,39 @@
+"""
+Модуль для отображения графика статуса подключения
+"""
+import streamlit as st
+import plotly.express as px
+
+def display_connection_status_chart(df):
+    """
+    Отображает круговую диаграмму статуса подключения
+    
+    Args:
+        df (pd.DataFrame): Снимок текущего статуса (колонка connection_status)
+    """
+    try:
+        fig = px.pie(
+            # В график передаются только счетчики по статусам, а не строки снимка
+            df['connection_status'].value_counts().rename_axis('connection_status').reset_index(name='count'),
+            names='connection_status',
+            values='count',
+            title="Connection Status Distribution",
+            color='connection_status',
+            color_discrete_map={
+                'active': '#2ecc71',  # green
+                'idle': '#f1c40f',    # yellow
+                'offline': '#95a5a6'  # gray
+            }
+        )
+        
+        # Настраиваем внешний вид
+        fig.update_layout(
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            margin=dict(t=30, b=0, l=0, r=0)
+        )
+        
+        st.plotly_chart(fig, use_container_width=True)
+        
+    except Exception as e:
+        st.error(f"Ошибка при создании графика: {str(e)}")
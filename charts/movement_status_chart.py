@@ -2,27 +2,22 @@
 Модуль для отображения графика статуса движения
 """
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-from datasets.queries import get_current_status_query
-from db_connection import get_sqlalchemy_engine
 
-def display_movement_status_chart(params=None):
+def display_movement_status_chart(df):
     """
     Отображает круговую диаграмму статуса движения
     
     Args:
-        params (dict): Параметры фильтрации
+        df (pd.DataFrame): Снимок текущего статуса (колонка moving_status)
     """
     try:
-        # Получаем данные с учетом параметров фильтрации
-        query = get_current_status_query(params)
-        df = pd.read_sql(query, get_sqlalchemy_engine())
-        
         # Создаем круговую диаграмму
         fig = px.pie(
-            df,
+            # В график передаются только счетчики по статусам, а не строки снимка
+            df['moving_status'].value_counts().rename_axis('moving_status').reset_index(name='count'),
             names='moving_status',
+            values='count',
             title="Movement Status Distribution",
             color='moving_status',
             color_discrete_map={
@@ -47,5 +42,8 @@ def display_movement_status_chart(params=None):
 
 if __name__ == "__main__":
     # Для тестирования
+    from datasets.status import load_status_snapshot
+    from db_connection import get_db_connection
     st.set_page_config(layout="wide")
-    display_movement_status_chart() 
\ No newline at end of file
+    with get_db_connection() as conn:
+        display_movement_status_chart(load_status_snapshot(conn).classify()) 
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""
+Модуль для отображения треков на карте
+"""
+import streamlit as st
+import pydeck as pdk
+
+def display_track_map(df):
+    """
+    Отображает упрощенные полилинии треков на карте
+
+    Args:
+        df (pd.DataFrame): Результат get_track_geometry (колонки path,
+            track_id, distance_m, path_points)
+    """
+    try:
+        tracks = df[df['path_points'] >= 2].copy()
+        if tracks.empty:
+            st.info("Нет треков для отображения")
+            return
+        tracks['distance_km'] = (tracks['distance_m'] / 1000).round(2)
+        tracks['track_start_time'] = tracks['track_start_time'].astype(str)
+
+        # Центр карты по началам треков
+        starts = tracks['path'].str[0]
+        view_state = pdk.ViewState(
+            longitude=float(starts.str[0].mean()),
+            latitude=float(starts.str[1].mean()),
+            zoom=9
+        )
+        layer = pdk.Layer(
+            'PathLayer',
+            data=tracks[['track_id', 'track_start_time', 'distance_km', 'path']],
+            get_path='path',
+            get_color=[46, 204, 113],
+            width_min_pixels=2,
+            pickable=True
+        )
+        st.pydeck_chart(pdk.Deck(
+            layers=[layer],
+            initial_view_state=view_state,
+            map_style=None,
+            tooltip={'text': '{track_id}\n{track_start_time}\n{distance_km} км'}
+        ))
+
+    except Exception as e:
+        st.error(f"Ошибка при отображении карты: {str(e)}")
@@ -1,35 +1,66 @@
 """
 Дашборд для мониторинга движения объектов
 """
+import os
+import time
+from datetime import datetime
 import streamlit as st
 import pandas as pd
-from charts import display_movement_status_chart
-from datasets.queries import get_current_status_query
+from charts import display_movement_status_chart, display_connection_status_chart
+from datasets.live_state import get_live_state
+from datasets.profiling import profile_run
+from datasets.result_cache import get_result_cache
+from datasets.status import diff_snapshots, load_status_snapshot
 from filters import display_control_params
+from db_connection import config_key, get_db_connection
 
-@st.cache_data(ttl=300)  # Кэширование на 5 минут
-def load_current_status(params):
+# Сколько секунд снимок статуса раздается сессиям без повторной загрузки
+STATUS_MAX_AGE = float(os.getenv('STATUS_CACHE_MAX_AGE', '5'))
+# Сколько изменений показывать за цикл живого режима
+LIVE_CHANGES_MAX_ROWS = int(os.getenv('LIVE_CHANGES_MAX_ROWS', '50'))
+
+def load_current_status():
     """
-    Загружает данные с учетом параметров фильтрации
+    Загружает снимок последних точек устройств (не зависит от параметров управления)
+
+    Снимок берется из живой таблицы процесса, которую обновляет фоновый опрос,
+    поэтому обновление не сканирует телеметрию; если опрос отключен, статус
+    читается запросом к БД. Снимок общий для сессий: одновременные обновления
+    ждут одну загрузку, а в течение STATUS_MAX_AGE получают готовый снимок.
     """
-    query = get_current_status_query(params)
-    return pd.read_sql(query, st.session_state["conn"])
+    config = st.session_state["db_config"]
+
+    def load():
+        live_state = get_live_state(config)
+        with get_db_connection(config) as conn:
+            if live_state is None:
+                return load_status_snapshot(conn)
+            return live_state.snapshot(conn)
 
-def display_metrics(df):
+    return get_result_cache().get(('status.snapshot', config_key(config)), load, max_age=STATUS_MAX_AGE)
+
+def display_metrics(df, previous=None):
     """
-    Отображение основных метрик
+    Отображение основных метрик (с изменением относительно previous, если задан)
     """
+    def counts(frame):
+        return (
+            frame['device_id'].nunique(),
+            int((frame['connection_status'] == 'active').sum()),
+            int((frame['connection_status'] == 'offline').sum())
+        )
+
+    current = counts(df)
+    deltas = [None] * 3 if previous is None else [now - before for now, before in zip(current, counts(previous))]
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Total Devices", len(df['device_id'].unique()))
+        st.metric("Total Devices", current[0], delta=deltas[0])
     with col2:
-        active_count = (df['connection_status'] == 'active').sum()
-        st.metric("Active Devices", active_count)
+        st.metric("Active Devices", current[1], delta=deltas[1])
     with col3:
-        offline_count = (df['connection_status'] == 'offline').sum()
-        st.metric("Offline Devices", offline_count)
+        st.metric("Offline Devices", current[2], delta=deltas[2], delta_color="inverse")
 
-def display_charts():
+def display_charts(df):
     """
     Отображение графиков
     """
@@ -37,41 +68,175 @@ def display_charts():
     
     with col1:
         st.subheader("Movement Status")
-        display_movement_status_chart()
+        display_movement_status_chart(df)
     
     with col2:
         st.subheader("Connection Status")
-        # TODO: Добавить график статуса подключения
+        display_connection_status_chart(df)
 
-def display_data_table(df):
+# Колонки таблицы статуса и их подписи
+STATUS_TABLE_COLUMNS = {
+    'device_id': 'Device ID',
+    'object_label': 'Vehicle',
+    'first_name': 'First Name',
+    'last_name': 'Last Name',
+    'speed': 'Speed (km/h)',
+    'moving_status': 'Movement Status',
+    'connection_status': 'Connection Status',
+    'geozones': 'Geozones',
+    'last_connect_formatted': 'Last Connection'
+}
+
+# Сортировка по типизированным колонкам: Last Connection - по device_time
+STATUS_SORT_KEYS = {
+    'Last Connection': 'device_time',
+    'Device ID': 'device_id',
+    'Vehicle': 'object_label',
+    'Last Name': 'last_name',
+    'Speed (km/h)': 'speed'
+}
+
+def display_data_table(snapshot, df):
     """
     Отображение таблицы с данными
+
+    Поиск, фильтры по статусам и сортировка выполняются по снимку на сервере,
+    в браузер передается только текущая страница (в постраничном режиме).
+
+    Args:
+        snapshot (StatusSnapshot): Снимок, по которому построен df
+        df (pd.DataFrame): Классифицированные строки снимка
     """
     st.subheader("Current Status")
-    display_df = df[[
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        search = st.text_input("Поиск (устройство, объект, сотрудник, геозона)", key="status_table_search")
+    with col2:
+        moving_statuses = st.multiselect("Movement Status", ['moving', 'stopped', 'parked'], key="status_table_moving")
+    with col3:
+        connection_statuses = st.multiselect("Connection Status", ['active', 'idle', 'offline'], key="status_table_connection")
+    col4, col5, col6, col7 = st.columns(4)
+    with col4:
+        sort_label = st.selectbox("Сортировка", list(STATUS_SORT_KEYS), key="status_table_sort")
+    with col5:
+        descending = st.toggle("По убыванию", value=False, key="status_table_descending")
+    with col6:
+        paged = st.toggle("Постранично", value=True, key="status_table_paged")
+    with col7:
+        page_size = st.selectbox("Строк на странице", [25, 50, 100, 500], index=1, key="status_table_page_size", disabled=not paged)
+
+    page = 1
+    if paged:
+        page = st.number_input("Страница", min_value=1, value=1, step=1, key="status_table_page")
+    rows, total = snapshot.page(
+        df, STATUS_SORT_KEYS[sort_label], descending, search, moving_statuses, connection_statuses,
+        page, page_size if paged else None
+    )
+    if paged:
+        pages = max((total - 1) // page_size + 1, 1)
+        page = min(page, pages)
+        first = (page - 1) * page_size
+        st.caption(f"Строки {min(first + 1, total)}-{first + len(rows)} из {total} (страница {page} из {pages})")
+
+    # Переименовываем колонки для отображения
+    display_df = rows[list(STATUS_TABLE_COLUMNS)].rename(columns=STATUS_TABLE_COLUMNS)
+    st.dataframe(display_df, use_container_width=True, hide_index=True)
+
+def display_changes(diff, max_rows=LIVE_CHANGES_MAX_ROWS):
+    """
+    Отображение изменений с предыдущего обновления (не больше max_rows строк)
+    """
+    st.subheader(f"Changes since last refresh: {len(diff)}")
+    if not len(diff):
+        return
+    changes = diff.to_frame()[[
+        'change',
         'device_id',
         'object_label',
-        'first_name',
-        'last_name',
         'speed',
         'moving_status',
         'connection_status',
+        'geozones',
         'last_connect_formatted'
-    ]].sort_values('last_connect_formatted')
-    
-    # Переименовываем колонки для отображения
-    display_df.columns = [
+    ]]
+    if len(changes) > max_rows:
+        st.caption(f"Показаны первые {max_rows} из {len(changes)}")
+        changes = changes.head(max_rows)
+    changes.columns = [
+        'Change',
         'Device ID',
         'Vehicle',
-        'First Name',
-        'Last Name',
         'Speed (km/h)',
         'Movement Status',
         'Connection Status',
+        'Geozones',
         'Last Connection'
     ]
-    
-    st.dataframe(display_df, use_container_width=True)
+    st.dataframe(changes, use_container_width=True, hide_index=True)
+
+def display_live_status(params):
+    """
+    Один цикл живого режима: новый снимок, разница с предыдущим, метрики,
+    графики и изменения
+
+    Полная таблица в цикле не отправляется: ее показывает display_live_table
+    по снимку последнего цикла.
+    """
+    try:
+        # Фрагмент перезапускается без основного прогона страницы: свой прогон профилировщика
+        with profile_run("Moving Status (live)"):
+            snapshot = load_current_status()
+            df = snapshot.classify(params)
+    except Exception as e:
+        # Фрагмент перезапускается отдельно от run_dashboard: ошибку показываем здесь
+        st.error(f"Ошибка при загрузке данных: {str(e)}")
+        return
+    previous = st.session_state.get("live_status_frame")
+    st.session_state["live_status_snapshot"] = snapshot
+    st.session_state["live_status_frame"] = df
+
+    st.caption(f"Live mode: updated {datetime.now():%H:%M:%S}, every {params['refresh_seconds']} s")
+    display_metrics(df, previous)
+    display_charts(df)
+    if previous is None:
+        # Первый цикл: сравнивать не с чем, весь парк в таблицу изменений не выводим
+        st.subheader("Changes since last refresh")
+        st.caption("Изменения появятся после следующего обновления")
+    else:
+        display_changes(diff_snapshots(previous, df))
+
+def display_live_table():
+    """
+    Полная таблица живого режима по снимку последнего цикла
+
+    Перестраивается только по действию пользователя (кнопка, поиск,
+    фильтры, страница), а не на каждом цикле живого режима.
+    """
+    snapshot = st.session_state.get("live_status_snapshot")
+    if snapshot is None:
+        return
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        st.button("Обновить таблицу", key="live_table_refresh")
+    with col2:
+        st.caption(f"Таблица на {snapshot.fetched_at:%H:%M:%S}")
+    display_data_table(snapshot, st.session_state["live_status_frame"])
+
+def run_live_mode(params):
+    """
+    Живой режим: по таймеру перезапускается только фрагмент со статусом,
+    а не вся страница; таблица - отдельный фрагмент без таймера
+    """
+    fragment = getattr(st, 'fragment', None)
+    if fragment is not None:
+        fragment(run_every=params['refresh_seconds'])(display_live_status)(params)
+        fragment(display_live_table)()
+    else:
+        # Старые версии Streamlit без фрагментов: перезапуск всей страницы
+        display_live_status(params)
+        display_live_table()
+        time.sleep(params['refresh_seconds'])
+        st.rerun()
 
 def run_dashboard():
     """
@@ -80,13 +245,22 @@ def run_dashboard():
     try:
         # Отображаем параметры управления
         params = display_control_params()
+
+        if params['live_mode']:
+            run_live_mode(params)
+            return
         
-        # Загружаем данные только если нажата кнопка Update
+        # Загружаем данные только если нажата кнопка Update, при изменении
+        # слайдеров переклассифицируем уже загруженный снимок
         if params['update_button']:
-            df = load_current_status(params)
+            st.session_state["status_snapshot"] = load_current_status()
+        snapshot = st.session_state.get("status_snapshot")
+
+        if snapshot is not None:
+            df = snapshot.classify(params)
             display_metrics(df)
-            display_charts()
-            display_data_table(df)
+            display_charts(df)
+            display_data_table(snapshot, df)
         else:
             st.info("Настройте параметры фильтрации и нажмите 'Update' для обновления данных")
 
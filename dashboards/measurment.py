@@ -1,10 +1,41 @@
 import streamlit as st
 import pandas as pd
-from datasets.measurment import get_measurment_data
+from datasets.downsampling import DEFAULT_MAX_SERIES, SERIES_RANKINGS, downsample_series
+from datasets.measurment import get_measurment_data, get_measurment_filter_options
+from datasets.profiling import profile_stage
+from datasets.result_cache import get_result_cache
+from datasets.rollup_store import get_rollup_store
+from db_connection import config_key, get_db_connection
+
+# Подписи способов отбора серий для графика
+RANKING_LABELS = {
+    'range': 'Наибольший размах',
+    'mean': 'Наибольшее среднее',
+    'last': 'Наибольшее последнее значение'
+}
 
-@st.cache_data(ttl=300)
 def load_data(hours, object_labels, sensor_labels):
-    return get_measurment_data(st.session_state["conn"], hours, object_labels, sensor_labels)
+    """
+    Данные измерений через общий кэш: одновременные одинаковые запросы из
+    разных сессий выполняются один раз (результат общий, только для чтения)
+    """
+    config = st.session_state["db_config"]
+
+    def load():
+        with get_db_connection(config) as conn:
+            return get_measurment_data(conn, hours, object_labels, sensor_labels, store=get_rollup_store(config))
+
+    key = ('measurment.data', config_key(config), hours, tuple(object_labels), tuple(sensor_labels))
+    return get_result_cache().get(key, load, max_age=300)
+
+def load_filter_options(hours):
+    config = st.session_state["db_config"]
+
+    def load():
+        with get_db_connection(config) as conn:
+            return get_measurment_filter_options(conn, hours)
+
+    return get_result_cache().get(('measurment.filters', config_key(config), hours), load, max_age=600)
 
 def run_measurment_dashboard():
     st.header("Measurment Dashboard")
@@ -13,15 +44,14 @@ def run_measurment_dashboard():
         error_msg = None
         all_objects, all_sensors = [], []
         try:
-            df_all = get_measurment_data(st.session_state["conn"], 72)
-            if not df_all.empty:
-                all_objects = sorted(df_all['object_label'].dropna().unique())
-                all_sensors = sorted(df_all['sensor_label'].dropna().unique())
+            all_objects, all_sensors = load_filter_options(72)
         except Exception as e:
             error_msg = str(e)
         object_labels = st.multiselect("Объекты (object_label)", all_objects, default=all_objects)
         sensor_labels = st.multiselect("Сенсоры (sensor_label)", all_sensors, default=all_sensors)
         hours = st.slider("Период (часы)", 1, 72, 24)
+        max_series = st.slider("Серий на графике", 1, 50, DEFAULT_MAX_SERIES)
+        ranking = st.selectbox("Отбор серий", SERIES_RANKINGS, format_func=RANKING_LABELS.get)
         refresh = st.button("Обновить данные", key="measurment_refresh")
         if error_msg:
             st.error(f"Ошибка при загрузке фильтров: {error_msg}")
@@ -34,8 +64,14 @@ def run_measurment_dashboard():
             st.warning("Нет данных по выбранным фильтрам")
             return
         st.subheader("Динамика по сенсорам")
-        chart_df = df.pivot_table(index='hour_bucket', columns=['object_label','sensor_label'], values='calibrated_volume_avg')
-        st.line_chart(chart_df)
+        # Не больше max_series серий и ограниченное число точек на серию
+        with profile_stage('measurment.chart') as stage:
+            labeled = df.dropna(subset=['object_label', 'sensor_label'])
+            labeled = labeled.assign(series=labeled['object_label'].astype(str) + ' / ' + labeled['sensor_label'].astype(str))
+            chart_df, shown, total = downsample_series(labeled, 'hour_bucket', 'calibrated_volume_avg', 'series', max_series, ranking)
+            stage.record(chart_df)
+        st.line_chart(chart_df, x='hour_bucket', y='calibrated_volume_avg', color='series')
+        st.caption(f"Показано серий: {shown} из {total} ({RANKING_LABELS[ranking].lower()})")
         st.subheader("Детализированные данные")
         st.dataframe(df, use_container_width=True)
     else:
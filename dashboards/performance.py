@@ -0,0 +1,73 @@
+"""
+Панель производительности: стадии последних прогонов, суммарная статистика и экспорт
+"""
+import streamlit as st
+from datasets.profiling import get_profiler
+from datasets.queries import get_query_stats
+from datasets.result_cache import get_result_cache
+
+def summarize_run(run):
+    """
+    Стадии прогона, сгруппированные по имени (потоковые порции и повторные
+    вызовы складываются), в порядке первого появления
+
+    Returns:
+        pd.DataFrame: stage, calls, seconds, rows, memory_mb, share (доля времени прогона)
+    """
+    frame = run.to_frame()
+    # Вложенные стадии уже учтены во времени внешних: доля считается от прогона
+    summary = frame.groupby('stage', sort=False).agg(
+        depth=('depth', 'min'),
+        calls=('seconds', 'size'),
+        seconds=('seconds', 'sum'),
+        rows=('rows', lambda rows: rows.sum(min_count=1)),
+        memory_mb=('memory_bytes', 'max')
+    ).reset_index()
+    summary['memory_mb'] = summary['memory_mb'] / 2 ** 20
+    summary['share'] = summary['seconds'] / run.seconds if run.seconds else None
+    summary['stage'] = summary['depth'].map(lambda depth: '  ' * depth) + summary['stage']
+    return summary.drop(columns='depth')
+
+def display_performance_panel():
+    """
+    Отображает панель производительности в боковой панели (если включена)
+    """
+    with st.sidebar:
+        if not st.toggle("Performance panel", value=False, key="performance_panel"):
+            return
+        profiler = get_profiler()
+        st.subheader("Производительность")
+        if not profiler.enabled:
+            st.info("Профилирование отключено (PROFILING=0)")
+            return
+
+        runs = profiler.runs()
+        if runs:
+            options = list(range(len(runs) - 1, -1, -1))
+            selected = st.selectbox(
+                "Прогон",
+                options,
+                format_func=lambda i: f"{runs[i].started_at:%H:%M:%S} {runs[i].label} ({runs[i].seconds:.2f} s)"
+            )
+            run = runs[selected]
+            if run.error:
+                st.error(run.error)
+            st.dataframe(summarize_run(run), use_container_width=True, hide_index=True)
+        else:
+            st.info("Прогонов пока нет")
+
+        with st.expander("Все стадии процесса"):
+            st.dataframe(profiler.totals_frame(), use_container_width=True, hide_index=True)
+        with st.expander("Запросы к БД"):
+            st.dataframe(get_query_stats(), use_container_width=True, hide_index=True)
+        with st.expander("Кэш результатов"):
+            st.dataframe(get_result_cache().stats_frame(), use_container_width=True, hide_index=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("JSON", profiler.to_json(), file_name="profile.json", mime="application/json")
+        with col2:
+            st.download_button("Prometheus", profiler.to_prometheus() + get_result_cache().to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        if st.button("Сбросить", key="performance_reset"):
+            profiler.reset()
+            get_result_cache().reset_stats()
@@ -2,14 +2,34 @@
 Дашборд по сменам (shifts)
 """
 import streamlit as st
+from charts import display_track_map
+from datasets.dimensions import get_dimension_cache
+from datasets.result_cache import get_result_cache
 from datasets.shifts import get_shifts_summary
+from datasets.summary_store import get_summary_store
+from datasets.track_geometry import DEFAULT_MAX_POINTS, DEFAULT_TOLERANCE, get_track_geometry
+from datasets.track_store import get_track_store
+from db_connection import config_key, get_db_connection
 from datetime import datetime, timedelta
 
+def load_track_geometry(start_date, end_date, device_id, min_speed, max_time_diff):
+    """
+    Геометрия треков объекта через общий кэш: повторные прогоны страницы с
+    теми же параметрами не размечают точки заново (результат только для чтения)
+    """
+    config = st.session_state["db_config"]
+
+    def load():
+        with get_db_connection(config) as conn:
+            return get_track_geometry(conn, start_date, end_date, device_id, min_speed, max_time_diff)
+
+    key = (
+        'shifts.geometry', config_key(config), int(device_id), start_date, end_date,
+        min_speed, max_time_diff, DEFAULT_TOLERANCE, DEFAULT_MAX_POINTS
+    )
+    return get_result_cache().get(key, load, max_age=300)
+
 def run_shifts_dashboard():
-<<<<<<< HEAD
-=======
-    st.header("Shifts Summary Dashboard")
->>>>>>> 59fb1d1 (разделен дашборд и апп)
     # Фильтры по дате и параметрам
     col1, col2 = st.columns(2)
     with col1:
@@ -22,15 +42,33 @@ def run_shifts_dashboard():
     with col4:
         max_time_diff = st.slider("Максимальный разрыв между точками (сек)", 60, 600, 300, step=10)
     # TODO: фильтр по объекту (device_id/object_label) при необходимости
-<<<<<<< HEAD
-    if st.button("refresh", key="shifts_refresh"):
-=======
-    if st.button("Обновить сводную таблицу"):
->>>>>>> 59fb1d1 (разделен дашборд и апп)
-        df = get_shifts_summary(st.session_state["conn"], start_date, end_date, min_speed=min_speed, max_time_diff=max_time_diff)
+    if st.button("Обновить сводную таблицу", key="shifts_refresh"):
+        config = st.session_state["db_config"]
+        with get_db_connection(config) as conn:
+            df = get_shifts_summary(
+                conn, start_date, end_date, min_speed=min_speed, max_time_diff=max_time_diff,
+                store=get_track_store(config), summary_store=get_summary_store(config)
+            )
         st.dataframe(df, use_container_width=True)
         # Можно добавить plotly/bar chart по активности
         st.subheader("Activity by Object and Date")
         st.bar_chart(df, x="device_id", y="average_speed")
     else:
-        st.info("Выберите диапазон дат и параметры, затем нажмите 'Обновить сводную таблицу'") 
\ No newline at end of file
+        st.info("Выберите диапазон дат и параметры, затем нажмите 'Обновить сводную таблицу'")
+
+    # Треки одного объекта на карте: упрощенные полилинии с ограниченным числом точек
+    if st.toggle("Треки на карте", value=False, key="shifts_map"):
+        with get_db_connection(st.session_state["db_config"]) as conn:
+            objects = get_dimension_cache().objects(conn)['object_label'].astype(object)
+            objects = objects[~objects.index.duplicated()]
+            device_id = st.selectbox(
+                "Объект", objects.index, format_func=lambda d: f"{objects[d]} ({d})", key="shifts_map_device"
+            )
+        if device_id is None:
+            return
+        geometry = load_track_geometry(start_date, end_date, device_id, min_speed, max_time_diff)
+        display_track_map(geometry)
+        st.caption(
+            f"Треков: {len(geometry)}, пройдено {geometry['distance_m'].sum() / 1000:.1f} км, "
+            f"точек на карте {int(geometry['path_points'].sum())} из {int(geometry['points_in_track'].sum())}"
+        ) 
\ No newline at end of file
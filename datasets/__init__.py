@@ -2,6 +2,6 @@
 SQL пакет для дашборда мониторинга движения
 """
 
-from .queries import CURRENT_STATUS_QUERY
+from .queries import register_query, run_query, get_query_stats
 
-__all__ = ['CURRENT_STATUS_QUERY'] 
\ No newline at end of file
+__all__ = ['register_query', 'run_query', 'get_query_stats']
@@ -0,0 +1,68 @@
+"""
+Калибровка значений сенсоров по таблицам sensor_calibration_data
+"""
+import numpy as np
+import pandas as pd
+
+class CalibrationTable:
+    """
+    Калибровочные таблицы, один раз отсортированные по sensor_id и cal_value
+
+    Повторяет поведение прежней построчной калибровки: линейная интерполяция
+    между ближайшими точками таблицы, значения вне диапазона таблицы (и для
+    сенсоров без таблицы) возвращаются без изменений.
+    """
+
+    def __init__(self, df_calib):
+        """
+        Args:
+            df_calib (pd.DataFrame): Колонки sensor_id, cal_value, cal_volume
+        """
+        calib = df_calib.dropna(subset=['sensor_id', 'cal_value'])
+        # При повторяющихся cal_value построчная версия брала первую строку
+        calib = calib.drop_duplicates(['sensor_id', 'cal_value'], keep='first')
+        calib = calib.sort_values(['sensor_id', 'cal_value'], kind='stable')
+        self._tables = {
+            sensor_id: (
+                group['cal_value'].to_numpy(dtype=float),
+                group['cal_volume'].to_numpy(dtype=float)
+            )
+            for sensor_id, group in calib.groupby('sensor_id', sort=False)
+        }
+
+    def __len__(self):
+        return len(self._tables)
+
+    def __contains__(self, sensor_id):
+        return sensor_id in self._tables
+
+    def interpolate(self, sensor_ids, values):
+        """
+        Калибрует значения для всех строк за один проход по сенсорам
+
+        Args:
+            sensor_ids (array-like): sensor_id для каждой строки
+            values (array-like): Значения формы (n,) или (n, k), например
+                сразу avg, min и max
+
+        Returns:
+            np.ndarray: Откалиброванные значения той же формы, что и values
+        """
+        values = np.asarray(values, dtype=float)
+        result = values.copy()
+        if not len(values) or not self._tables:
+            return result
+
+        positions = pd.Series(np.arange(len(values))).groupby(np.asarray(sensor_ids)).indices
+        for sensor_id, idx in positions.items():
+            table = self._tables.get(sensor_id)
+            if table is None:
+                continue
+            cal_value, cal_volume = table
+            chunk = values[idx]
+            # Вне диапазона таблицы (и NaN) значения остаются как есть
+            inside = (chunk >= cal_value[0]) & (chunk <= cal_value[-1])
+            calibrated = chunk.copy()
+            calibrated[inside] = np.interp(chunk[inside], cal_value, cal_volume)
+            result[idx] = calibrated
+        return result
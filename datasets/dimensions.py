@@ -0,0 +1,224 @@
+"""
+Общий для процесса кэш справочных таблиц (sensor_description, калибровки,
+объекты, устройства, сотрудники, геозоны, описания параметров)
+"""
+import os
+import threading
+import time
+import pandas as pd
+from datasets.calibration import CalibrationTable
+from datasets.geozones import GeozoneIndex
+from datasets.profiling import profile_stage
+from datasets.schema import OBJECT_LABELS_SCHEMA, SENSOR_META_SCHEMA, apply_schema
+from db_connection import connection_key
+
+DIMENSION_QUERIES = {
+    'sensor_description': (
+        'raw_business_data.sensor_description',
+        '''
+            SELECT device_id, input_label, sensor_id, sensor_label, sensor_type, sensor_units, divider, multiplier, units_type, group_type
+            FROM raw_business_data.sensor_description
+        '''
+    ),
+    'sensor_calibration_data': (
+        'raw_business_data.sensor_calibration_data',
+        '''
+            SELECT sensor_id, value as cal_value, volume as cal_volume
+            FROM raw_business_data.sensor_calibration_data
+        '''
+    ),
+    'objects': (
+        'raw_business_data.objects',
+        '''
+            SELECT object_id, device_id, object_label
+            FROM raw_business_data.objects
+        '''
+    ),
+    'devices': (
+        'raw_business_data.devices',
+        '''
+            SELECT device_id
+            FROM raw_business_data.devices
+        '''
+    ),
+    'employees': (
+        'raw_business_data.employees',
+        '''
+            SELECT object_id, first_name, last_name
+            FROM raw_business_data.employees
+        '''
+    ),
+    'zones': (
+        'raw_business_data.zones',
+        '''
+            SELECT zone_label, zone_type, circle_center_latitude, circle_center_longitude, radius
+            FROM raw_business_data.zones
+        '''
+    ),
+    'description_parametrs': (
+        'raw_business_data.description_parametrs',
+        '''
+            SELECT key, type, description
+            FROM raw_business_data.description_parametrs
+        '''
+    )
+}
+
+DEFAULT_TTL = int(os.getenv('DIMENSION_CACHE_TTL', '300'))
+
+class DimensionTable:
+    """
+    Загруженная справочная таблица с отпечатком и производными структурами
+    """
+
+    def __init__(self, frame, fingerprint):
+        self.frame = frame
+        self.fingerprint = fingerprint
+        self.checked_at = time.monotonic()
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def derived(self, name, build):
+        """
+        Возвращает производную структуру (индекс, таблицу калибровки),
+        построенную один раз на загруженную версию таблицы
+        """
+        with self._lock:
+            if name not in self._derived:
+                with profile_stage(f'dimension.derived.{name}'):
+                    self._derived[name] = build(self.frame)
+            return self._derived[name]
+
+class DimensionCache:
+    """
+    Кэш справочных таблиц с TTL и дешевой проверкой изменений
+
+    После истечения TTL таблица не перечитывается целиком: сначала
+    сравнивается отпечаток (число строк и максимальный xmin), и только при
+    его изменении таблица загружается заново. Таблицы хранятся отдельно для
+    каждой конфигурации подключения (см. connection_key), поэтому сессии
+    разных БД не получают чужие справочники.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        """
+        Args:
+            ttl (int): Время в секундах, в течение которого таблица считается актуальной без проверки
+        """
+        self.ttl = ttl
+        self._tables = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _table_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _fingerprint(self, conn, name):
+        table, _ = DIMENSION_QUERIES[name]
+        query_fingerprint = f'''
+            SELECT count(*) AS row_count, max(xmin::text::bigint) AS max_xmin
+            FROM {table}
+        '''
+        with profile_stage(f'sql.dimension_fingerprint.{name}'):
+            row = pd.read_sql(query_fingerprint, conn).iloc[0]
+        return f"{row['row_count']}:{row['max_xmin']}"
+
+    def get(self, conn, name):
+        """
+        Возвращает актуальную справочную таблицу
+
+        Args:
+            conn: Соединение с БД
+            name (str): Имя таблицы из DIMENSION_QUERIES
+
+        Returns:
+            DimensionTable: Таблица с отпечатком
+        """
+        _, query = DIMENSION_QUERIES[name]
+        key = (connection_key(conn), name)
+        with self._table_lock(key):
+            with self._lock:
+                cached = self._tables.get(key)
+            if cached is not None and time.monotonic() - cached.checked_at < self.ttl:
+                return cached
+            fingerprint = self._fingerprint(conn, name)
+            if cached is not None and cached.fingerprint == fingerprint:
+                cached.checked_at = time.monotonic()
+                return cached
+            with profile_stage(f'sql.dimension.{name}') as stage:
+                table = DimensionTable(stage.record(pd.read_sql(query, conn)), fingerprint)
+            with self._lock:
+                self._tables[key] = table
+            return table
+
+    def invalidate(self, name=None):
+        """
+        Сбрасывает одну или все таблицы (для всех конфигураций подключения)
+        """
+        with self._lock:
+            for key in [key for key in self._tables if name is None or key[1] == name]:
+                del self._tables[key]
+
+    def sensor_meta(self, conn):
+        """
+        sensor_description с индексом по (device_id, input_label)
+        """
+        return self.get(conn, 'sensor_description').derived(
+            'by_device_input',
+            lambda df: apply_schema(df.set_index(['device_id', 'input_label'], drop=False).drop(columns='device_id'), SENSOR_META_SCHEMA)
+        )
+
+    def calibration(self, conn):
+        """
+        Калибровочные таблицы по sensor_id
+        """
+        return self.get(conn, 'sensor_calibration_data').derived('calibration', CalibrationTable)
+
+    def objects(self, conn):
+        """
+        objects с индексом по device_id
+        """
+        return self.get(conn, 'objects').derived(
+            'by_device',
+            lambda df: apply_schema(df.set_index('device_id')[['object_label']].copy(), OBJECT_LABELS_SCHEMA)
+        )
+
+    def fleet_objects(self, conn):
+        """
+        Объекты с устройствами и сотрудниками, индекс по device_id
+
+        Повторяет соединения запроса текущего статуса: объект должен быть
+        привязан к существующему устройству, сотрудник необязателен; при
+        нескольких совпадениях остается первое.
+        """
+        objects = self.get(conn, 'objects').frame
+        devices = self.get(conn, 'devices').frame
+        employees = self.get(conn, 'employees').frame
+        fleet = objects[objects['device_id'].isin(devices['device_id'])]
+        fleet = fleet.merge(employees, on='object_id', how='left')
+        return fleet.drop_duplicates('device_id').set_index('device_id')[['object_id', 'object_label', 'first_name', 'last_name']]
+
+    def geozones(self, conn):
+        """
+        Сеточный индекс круговых геозон
+        """
+        return self.get(conn, 'zones').derived('index', GeozoneIndex)
+
+    def descriptions(self, conn, description_type):
+        """
+        Описания параметров заданного типа с индексом по key
+        """
+        return self.get(conn, 'description_parametrs').derived(
+            description_type,
+            lambda df: df[df['type'] == description_type].set_index('key')[['description']]
+        )
+
+_cache = DimensionCache()
+
+def get_dimension_cache():
+    """
+    Возвращает общий для всех сессий кэш справочных таблиц (таблицы
+    разделены по конфигурациям подключения)
+    """
+    return _cache
@@ -0,0 +1,85 @@
+"""
+Прореживание временных рядов для графиков: отбор серий и огибающая по бакетам времени
+"""
+import os
+import numpy as np
+import pandas as pd
+from datasets.profiling import profiled
+
+# Число бакетов по оси времени (порядка ширины графика в пикселях / 2)
+DEFAULT_BUCKETS = int(os.getenv('CHART_BUCKETS', '500'))
+# Сколько серий показывать на одном графике
+DEFAULT_MAX_SERIES = int(os.getenv('CHART_MAX_SERIES', '12'))
+
+# Способы ранжирования серий при отборе top-N
+SERIES_RANKINGS = ('range', 'mean', 'last')
+
+def top_series(df, series, value, limit=DEFAULT_MAX_SERIES, by='range'):
+    """
+    Отбирает limit серий с наибольшим показателем
+
+    Args:
+        df (pd.DataFrame): Данные в длинном формате, упорядоченные по времени
+        series (str): Колонка с идентификатором серии
+        value (str): Колонка значения
+        limit (int): Максимум серий
+        by (str): 'range' - размах max - min, 'mean' - среднее,
+            'last' - последнее значение
+
+    Returns:
+        tuple: (строки отобранных серий, общее число серий)
+    """
+    if by not in SERIES_RANKINGS:
+        raise ValueError(f"Неизвестный способ отбора серий: {by}")
+    stats = df.groupby(series, observed=True, sort=False)[value].agg(['min', 'max', 'mean', 'last'])
+    stats['range'] = stats['max'] - stats['min']
+    # При равенстве показателя порядок по имени серии
+    ranked = stats[by].fillna(-np.inf).sort_index(kind='stable').sort_values(ascending=False, kind='stable')
+    selected = ranked.index[:limit]
+    return df[df[series].isin(selected)], len(stats)
+
+@profiled('chart.envelope')
+def minmax_envelope(df, x, y, series, buckets=DEFAULT_BUCKETS):
+    """
+    Огибающая серий по бакетам времени (M4): в каждом бакете каждой серии
+    остаются первая, последняя, минимальная и максимальная точки
+
+    Бакеты общие для всех серий (равные интервалы от минимума до максимума x),
+    поэтому на серию приходится не больше 4 * buckets точек, а экстремумы и
+    форма линии сохраняются. Строки без значения отбрасываются.
+
+    Args:
+        df (pd.DataFrame): Данные в длинном формате
+        x (str): Колонка времени
+        y (str): Колонка значения
+        series (str): Колонка с идентификатором серии
+        buckets (int): Число бакетов
+
+    Returns:
+        pd.DataFrame: Подмножество строк df в исходном порядке
+    """
+    df = df[df[y].notna()].reset_index(drop=True)
+    if df.empty:
+        return df
+    ticks = df[x].to_numpy().astype('datetime64[ns]').astype(np.int64)
+    start = ticks.min()
+    span = ticks.max() - start + 1
+    bucket = np.floor((ticks - start) / span * buckets).astype(np.int64)
+    groups = df[y].groupby([df[series], bucket], observed=True, sort=False)
+    keep = np.zeros(len(df), dtype=bool)
+    for rows in (groups.idxmin(), groups.idxmax(), groups.head(1).index, groups.tail(1).index):
+        keep[np.asarray(rows, dtype=np.int64)] = True
+    return df[keep].reset_index(drop=True)
+
+def downsample_series(df, x, y, series, limit=DEFAULT_MAX_SERIES, by='range', buckets=DEFAULT_BUCKETS):
+    """
+    Данные для линейного графика ограниченного размера: top-N серий и их
+    огибающая по бакетам времени
+
+    Returns:
+        tuple: (строки x, y, series не больше limit * 4 * buckets, число
+            показанных серий, общее число серий)
+    """
+    selected, total = top_series(df, series, y, limit, by)
+    chart = minmax_envelope(selected[[x, y, series]], x, y, series, buckets)
+    return chart, chart[series].nunique(), total
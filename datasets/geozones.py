@@ -0,0 +1,156 @@
+"""
+Определение геозон по координатам в процессе приложения (без PostGIS)
+"""
+import os
+import numpy as np
+
+# Средний радиус Земли, м (сфера PostGIS при use_spheroid => false)
+EARTH_RADIUS = 6371008.8
+# Размер ячейки сетки индекса, градусов
+DEFAULT_CELL_DEGREES = float(os.getenv('GEOZONE_CELL_DEGREES', '0.1'))
+# Зоны, покрывающие больше ячеек, проверяются для всех точек без индекса
+MAX_CELLS_PER_ZONE = 4096
+# Относительный запас при отборе ячеек, чтобы не потерять точки у границы зоны
+_CELL_MARGIN = 1.01
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Расстояние по большому кругу в метрах (векторно)
+
+    Args:
+        lat1, lon1, lat2, lon2 (array-like): Координаты в градусах
+
+    Returns:
+        np.ndarray: Расстояния в метрах
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+class GeozoneIndex:
+    """
+    Сеточный индекс круговых геозон
+
+    Каждая зона заносится во все ячейки сетки, пересекающие ее ограничивающий
+    прямоугольник, поэтому для точки проверяются только зоны ее ячейки.
+    Попадание проверяется haversine-расстоянием до центра (включительно, как
+    ST_DWithin). PostGIS по умолчанию считает расстояния на сфероиде, поэтому
+    для точек у самой границы зоны (в пределах ~0.5% радиуса) результаты
+    могут расходиться.
+    """
+
+    def __init__(self, zones, cell_degrees=DEFAULT_CELL_DEGREES):
+        """
+        Args:
+            zones (pd.DataFrame): Колонки zone_label, zone_type,
+                circle_center_latitude, circle_center_longitude, radius (м)
+            cell_degrees (float): Размер ячейки сетки, градусов
+        """
+        circles = zones[zones['zone_type'] == 'circle'].dropna(
+            subset=['zone_label', 'circle_center_latitude', 'circle_center_longitude', 'radius']
+        )
+        self.labels = circles['zone_label'].to_numpy(dtype=object)
+        # Ранги меток в порядке сортировки для склейки без сортировки строк
+        self._label_names, self._label_ranks = np.unique(self.labels.astype(str), return_inverse=True)
+        self.lat = circles['circle_center_latitude'].to_numpy(dtype=float)
+        self.lon = circles['circle_center_longitude'].to_numpy(dtype=float)
+        self.radius = circles['radius'].to_numpy(dtype=float)
+        self.cell_degrees = cell_degrees
+        self._columns = int(np.ceil(360 / cell_degrees))
+
+        cell_keys = []
+        cell_zones = []
+        global_zones = []
+        for zone, (lat, lon, radius) in enumerate(zip(self.lat, self.lon, self.radius)):
+            dlat = np.degrees(radius * _CELL_MARGIN / EARTH_RADIUS)
+            max_lat = min(abs(lat) + dlat, 90)
+            dlon = dlat / np.cos(np.radians(max_lat)) if max_lat < 90 else np.inf
+            lat_cells = np.arange(self._lat_cell(lat - dlat), self._lat_cell(lat + dlat) + 1)
+            if dlon >= 180:
+                lon_cells = np.arange(self._columns)
+            else:
+                first = self._lon_cell(lon - dlon)
+                span = int(np.floor((lon + dlon + 180) / cell_degrees)) - int(np.floor((lon - dlon + 180) / cell_degrees))
+                lon_cells = (first + np.arange(span + 1)) % self._columns
+            if len(lat_cells) * len(lon_cells) > MAX_CELLS_PER_ZONE:
+                global_zones.append(zone)
+                continue
+            keys = (lat_cells[:, None] * self._columns + lon_cells[None, :]).ravel()
+            cell_keys.append(keys)
+            cell_zones.append(np.full(len(keys), zone))
+
+        keys = np.concatenate(cell_keys) if cell_keys else np.empty(0, dtype=np.int64)
+        zones_in_cells = np.concatenate(cell_zones) if cell_zones else np.empty(0, dtype=np.int64)
+        order = np.argsort(keys, kind='stable')
+        self._cell_keys = keys[order].astype(np.int64)
+        self._cell_zones = zones_in_cells[order].astype(np.int64)
+        self._global_zones = np.asarray(global_zones, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _lat_cell(self, lat):
+        return np.floor((np.clip(lat, -90, 90) + 90) / self.cell_degrees).astype(np.int64)
+
+    def _lon_cell(self, lon):
+        return (np.floor((np.asarray(lon) + 180) / self.cell_degrees).astype(np.int64)) % self._columns
+
+    def _candidates(self, points, lat, lon):
+        """
+        Пары (точка, зона) из ячеек точек плюс зоны без индекса
+        """
+        keys = self._lat_cell(lat[points]) * self._columns + self._lon_cell(lon[points])
+        lo = np.searchsorted(self._cell_keys, keys, side='left')
+        counts = np.searchsorted(self._cell_keys, keys, side='right') - lo
+        pair_points = np.repeat(points, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_zones = self._cell_zones[np.repeat(lo, counts) + offsets]
+        if len(self._global_zones):
+            pair_points = np.concatenate([pair_points, np.repeat(points, len(self._global_zones))])
+            pair_zones = np.concatenate([pair_zones, np.tile(self._global_zones, len(points))])
+        return pair_points, pair_zones
+
+    def match(self, latitude, longitude):
+        """
+        Все попадания точек в зоны
+
+        Args:
+            latitude (array-like): Широты точек, градусов
+            longitude (array-like): Долготы точек, градусов
+
+        Returns:
+            tuple: (позиции точек, позиции зон) для каждой пары точка-зона
+        """
+        lat = np.asarray(latitude, dtype=float)
+        lon = np.asarray(longitude, dtype=float)
+        points = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        if not len(points) or not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        pair_points, pair_zones = self._candidates(points, lat, lon)
+        distance = haversine(lat[pair_points], lon[pair_points], self.lat[pair_zones], self.lon[pair_zones])
+        inside = distance <= self.radius[pair_zones]
+        return pair_points[inside], pair_zones[inside]
+
+    def assign(self, latitude, longitude):
+        """
+        Подписи геозон для точек, как string_agg(DISTINCT zone_label, ', ')
+
+        Returns:
+            np.ndarray: Отсортированные уникальные метки через ', ' или None
+                для точек вне зон
+        """
+        result = np.full(len(np.asarray(latitude)), None, dtype=object)
+        pair_points, pair_zones = self.match(latitude, longitude)
+        if not len(pair_points):
+            return result
+        ranks = self._label_ranks[pair_zones]
+        order = np.lexsort((ranks, pair_points))
+        pair_points, ranks = pair_points[order], ranks[order]
+        unique = np.ones(len(order), dtype=bool)
+        unique[1:] = (pair_points[1:] != pair_points[:-1]) | (ranks[1:] != ranks[:-1])
+        pair_points, ranks = pair_points[unique], ranks[unique]
+        starts = np.flatnonzero(np.r_[True, pair_points[1:] != pair_points[:-1]])
+        labels = self._label_names[ranks].tolist()
+        bounds = starts.tolist() + [len(labels)]
+        result[pair_points[starts]] = [', '.join(labels[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        return result
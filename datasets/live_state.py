@@ -0,0 +1,264 @@
+"""
+Живая таблица последних точек устройств, обновляемая фоновым опросом БД
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from datasets.dimensions import get_dimension_cache
+from datasets.profiling import profile_stage
+from datasets.queries import register_query
+from datasets.status import StatusSnapshot, assign_geozones
+from db_connection import DB_CONFIG, config_key, get_db_connection
+
+# Период опроса в секундах (0 - без фоновой таблицы, статус читается запросом)
+POLL_SECONDS = float(os.getenv('LIVE_STATE_POLL_SECONDS', '5'))
+# Окно актуальности точек, как в запросе текущего статуса
+WINDOW_MINUTES = int(os.getenv('LIVE_STATE_WINDOW_MINUTES', '15'))
+# Насколько раньше водяного знака перечитываются точки (опоздавшие данные)
+LATE_SECONDS = int(os.getenv('LIVE_STATE_LATE_SECONDS', '60'))
+# Таблица без обращений дольше этого времени останавливается и удаляется, с
+IDLE_SECONDS = float(os.getenv('LIVE_STATE_IDLE_SECONDS', '600'))
+# После стольких ошибок опроса подряд таблица останавливается и удаляется
+MAX_FAILURES = int(os.getenv('LIVE_STATE_MAX_FAILURES', '5'))
+
+LIVE_STATE_COLUMNS = ['device_id', 'device_time', 'speed', 'latitude', 'longitude']
+# Типы колонок таблицы (для пустой таблицы, когда в окне нет ни одной точки)
+LIVE_STATE_DTYPES = {
+    'device_id': 'int64', 'device_time': 'datetime64[ns]', 'speed': 'float64', 'latitude': 'float64', 'longitude': 'float64'
+}
+
+LIVE_STATE_POLL = register_query('live_state_poll', '''
+    WITH clock AS (
+        SELECT LOCALTIMESTAMP AS db_now
+    )
+    SELECT c.db_now, p.device_id, p.device_time, p.speed, p.latitude, p.longitude
+    FROM clock c
+    LEFT JOIN LATERAL (
+        SELECT DISTINCT ON (t.device_id)
+            t.device_id,
+            t.device_time,
+            t.speed / 100 AS speed,
+            t.latitude / 1e7 AS latitude,
+            t.longitude / 1e7 AS longitude
+        FROM raw_telematics_data.tracking_data_core t
+        WHERE t.device_time >= GREATEST(%(since)s::timestamp, c.db_now - make_interval(mins => %(window)s))
+        ORDER BY t.device_id, t.device_time DESC
+    ) p ON TRUE
+''')
+
+logger = logging.getLogger(__name__)
+
+class LiveStateTable:
+    """
+    Последняя точка каждого устройства в памяти процесса
+
+    Опрос читает только точки после водяного знака (минус окно опоздавших
+    данных) и обновляет строки по device_id, поэтому стоимость обновления
+    статуса не зависит ни от объема телеметрии, ни от числа зрителей
+    дашборда. Устройства без точек за последние window_minutes минут
+    удаляются из таблицы.
+
+    Фоновый опрос останавливается, если к таблице не обращались дольше
+    idle_seconds или опрос завершился ошибкой max_failures раз подряд (между
+    неудачными попытками пауза растет вдвое); остановленная таблица
+    удаляется из общего реестра, и следующее обращение создает новую.
+    """
+
+    def __init__(self, config=None, interval=POLL_SECONDS, window_minutes=WINDOW_MINUTES, late_seconds=LATE_SECONDS,
+                 idle_seconds=IDLE_SECONDS, max_failures=MAX_FAILURES):
+        """
+        Args:
+            config (dict): Параметры подключения (по умолчанию DB_CONFIG)
+            interval (float): Период фонового опроса, секунд
+            window_minutes (int): Окно актуальности точек, минут
+            late_seconds (int): Окно перечитывания опоздавших точек, секунд
+            idle_seconds (float): Время без обращений до остановки, секунд
+            max_failures (int): Число ошибок опроса подряд до остановки
+        """
+        self.config = config
+        self.key = config_key(config or DB_CONFIG)
+        self.interval = interval
+        self.window_minutes = window_minutes
+        self.late_seconds = late_seconds
+        self.idle_seconds = idle_seconds
+        self.max_failures = max_failures
+        self._accessed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._latest = None
+        self._watermark = None
+        self._db_now = None
+        self._polled_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def watermark(self):
+        return self._watermark
+
+    def touch(self):
+        """
+        Отмечает обращение к таблице (откладывает остановку по простою)
+        """
+        self._accessed_at = time.monotonic()
+
+    def idle(self):
+        """
+        Не обращались ли к таблице дольше idle_seconds
+        """
+        return time.monotonic() - self._accessed_at > self.idle_seconds
+
+    def poll(self, conn):
+        """
+        Читает новые точки и обновляет таблицу
+
+        Returns:
+            int: Число устройств с новыми точками
+        """
+        since = self._watermark - timedelta(seconds=self.late_seconds) if self._watermark is not None else None
+        rows = LIVE_STATE_POLL.execute(conn, {'since': since, 'window': self.window_minutes})
+        db_now = pd.Timestamp(rows['db_now'].iat[0])
+        fresh = rows.dropna(subset=['device_id'])[LIVE_STATE_COLUMNS]
+        with self._lock:
+            latest = self._latest
+            if not fresh.empty:
+                fresh = fresh.astype({'device_id': 'int64'})
+                latest = fresh if latest is None else pd.concat([latest, fresh], ignore_index=True)
+                latest = latest.sort_values('device_time', kind='stable').drop_duplicates('device_id', keep='last')
+            if latest is not None:
+                latest = latest[latest['device_time'] >= db_now - timedelta(minutes=self.window_minutes)]
+                self._latest = latest.sort_values('device_id').reset_index(drop=True)
+                if not latest.empty:
+                    newest = latest['device_time'].max()
+                    self._watermark = newest if self._watermark is None else max(self._watermark, newest)
+            self._db_now = db_now
+            self._polled_at = time.monotonic()
+        return len(fresh)
+
+    def snapshot(self, conn):
+        """
+        Снимок текущего статуса из таблицы в формате запроса текущего статуса
+
+        Если таблица еще ни разу не опрашивалась, опрос выполняется сразу.
+
+        Args:
+            conn: Соединение с БД (для справочников)
+
+        Returns:
+            StatusSnapshot: Снимок статуса
+        """
+        self.touch()
+        if self._polled_at is None:
+            self.poll(conn)
+        with self._lock:
+            latest = self._latest
+            # Время БД на момент снимка: время последнего опроса плюс прошедшее с него
+            db_now = self._db_now + timedelta(seconds=time.monotonic() - self._polled_at)
+        if latest is None:
+            latest = pd.DataFrame(columns=LIVE_STATE_COLUMNS).astype(LIVE_STATE_DTYPES)
+        latest = latest[latest['device_time'] >= db_now - timedelta(minutes=self.window_minutes)]
+
+        fleet = get_dimension_cache().fleet_objects(conn)
+        with profile_stage('status.live_join') as stage:
+            frame = stage.record(latest.join(fleet, on='device_id', how='inner'))
+        frame = assign_geozones(conn, frame)
+        frame['last_connect'] = (db_now - frame['device_time']).dt.total_seconds()
+        frame['last_connect_formatted'] = frame['device_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        frame = frame[[
+            'object_id', 'device_id', 'object_label', 'first_name', 'last_name',
+            'speed', 'latitude', 'longitude', 'device_time', 'last_connect',
+            'last_connect_formatted', 'geozones'
+        ]].reset_index(drop=True)
+        return StatusSnapshot(frame, datetime.now())
+
+    def start(self):
+        """
+        Запускает фоновый опрос (если еще не запущен)
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='live-state-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Останавливает фоновый опрос
+        """
+        self._stop.set()
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            if _evict_idle(self):
+                logger.info("Живая таблица статуса остановлена: нет обращений %.0f с", self.idle_seconds)
+                break
+            try:
+                with get_db_connection(self.config) as conn:
+                    self.poll(conn)
+                failures = 0
+            except Exception:
+                failures += 1
+                logger.exception("Ошибка опроса живой таблицы статуса (%d подряд)", failures)
+                if failures >= self.max_failures:
+                    _evict(self)
+                    logger.error("Живая таблица статуса остановлена после %d ошибок опроса подряд", failures)
+                    break
+            # Пауза после ошибок растет вдвое, но не больше 64 периодов
+            self._stop.wait(self.interval * 2 ** min(failures, 6))
+        with self._lock:
+            self._latest = None
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+def _evict(table):
+    """
+    Останавливает таблицу и удаляет ее из реестра (если она еще там)
+    """
+    table.stop()
+    with _tables_lock:
+        if _tables.get(table.key) is table:
+            del _tables[table.key]
+
+def _evict_idle(table):
+    """
+    Удаляет таблицу из реестра, если к ней давно не обращались
+
+    Проверка под блокировкой реестра: get_live_state отмечает обращение под
+    той же блокировкой, поэтому выданная таблица не может быть удалена.
+
+    Returns:
+        bool: Таблица удалена
+    """
+    with _tables_lock:
+        if not table.idle():
+            return False
+        table.stop()
+        if _tables.get(table.key) is table:
+            del _tables[table.key]
+        return True
+
+def get_live_state(config=None):
+    """
+    Возвращает общую для процесса живую таблицу для конфигурации подключения,
+    запуская ее фоновый опрос при первом обращении (или после остановки
+    по простою и ошибкам)
+
+    Returns:
+        LiveStateTable: Таблица или None, если опрос отключен (LIVE_STATE_POLL_SECONDS=0)
+    """
+    if POLL_SECONDS <= 0:
+        return None
+    key = config_key(config or DB_CONFIG)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            table = LiveStateTable(config)
+            _tables[key] = table
+        table.touch()
+        table.start()
+    return table
@@ -1,123 +1,251 @@
 import pandas as pd
 import numpy as np
-from typing import Optional, List
+from typing import Optional, List, Tuple
 import logging
-import traceback
-logging.basicConfig(filename='measurment_debug.log', level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+from datasets.dimensions import get_dimension_cache
+from datasets.profiling import profile_stage, profiled
+from datasets.queries import register_query
+from datasets.schema import INPUTS_SCHEMA, ROLLUP_SCHEMA, apply_schema
 
-def get_measurment_data(conn, hours: int = 24, object_labels: Optional[List[str]] = None, sensor_labels: Optional[List[str]] = None) -> pd.DataFrame:
-    try:
-        logging.info(f"get_measurment_data: hours={hours}, object_labels={object_labels}, sensor_labels={sensor_labels}")
-        print(f"[DEBUG] get_measurment_data: hours={hours}, object_labels={object_labels}, sensor_labels={sensor_labels}")
-        # 1. Сырые данные inputs
-        query_inputs = f'''
-            SELECT device_id, sensor_name, event_id, device_time, value::FLOAT as raw_value
-            FROM raw_telematics_data.inputs
-            WHERE device_time >= NOW() - INTERVAL '{hours} hours'
-        '''
-        df_inputs = pd.read_sql(query_inputs, conn)
-        logging.info(f"inputs shape: {df_inputs.shape}")
-        print(f"[DEBUG] inputs shape: {df_inputs.shape}")
-
-        # 2. sensor_description
-        query_meta = '''
-            SELECT device_id, input_label, sensor_id, sensor_label, sensor_type, sensor_units, divider, multiplier, units_type, group_type
-            FROM raw_business_data.sensor_description
-        '''
-        df_meta = pd.read_sql(query_meta, conn)
-        logging.info(f"meta shape: {df_meta.shape}")
-        print(f"[DEBUG] meta shape: {df_meta.shape}")
-
-        # 3. calibration_data
-        query_calib = '''
-            SELECT sensor_id, value as cal_value, volume as cal_volume
-            FROM raw_business_data.sensor_calibration_data
-        '''
-        df_calib = pd.read_sql(query_calib, conn)
-        logging.info(f"calib shape: {df_calib.shape}")
-        print(f"[DEBUG] calib shape: {df_calib.shape}")
-
-        # 4. objects
-        query_objects = '''
-            SELECT device_id, object_label
-            FROM raw_business_data.objects
-        '''
-        df_objects = pd.read_sql(query_objects, conn)
-        logging.info(f"objects shape: {df_objects.shape}")
-        print(f"[DEBUG] objects shape: {df_objects.shape}")
-
-        # 5. description_parametrs
-        query_desc = '''
-            SELECT key, type, description
-            FROM raw_business_data.description_parametrs
-        '''
-        df_desc = pd.read_sql(query_desc, conn)
-        logging.info(f"desc shape: {df_desc.shape}")
-        print(f"[DEBUG] desc shape: {df_desc.shape}")
-
-        # --- JOINs ---
-        df = df_inputs.merge(df_meta, left_on=['device_id', 'sensor_name'], right_on=['device_id', 'input_label'], how='left')
-        df['value'] = np.where(df['divider'].fillna(0) != 0, (df['raw_value'] / df['divider']) * df['multiplier'].fillna(1), df['raw_value'])
-        df['hour_bucket'] = df['device_time'].dt.floor('H')
-
-        # --- Агрегация по часу ---
-        agg = df.groupby([
-            'hour_bucket', 'device_id', 'sensor_name', 'event_id', 'sensor_id', 'input_label',
-            'sensor_label', 'sensor_type', 'sensor_units', 'units_type', 'group_type'
-        ]).agg(
-            value_avg = ('value', 'mean'),
-            value_min = ('value', 'min'),
-            value_max = ('value', 'max')
-        ).reset_index()
-
-        # --- Калибровка ---
-        def calibrate(row, val_col):
-            sid = row['sensor_id']
-            val = row[val_col]
-            calib = df_calib[df_calib['sensor_id'] == sid]
-            if calib.empty:
-                return val
-            below = calib[calib['cal_value'] <= val]
-            above = calib[calib['cal_value'] >= val]
-            if below.empty or above.empty:
-                return val
-            low = below.iloc[below['cal_value'].argmax()]
-            high = above.iloc[above['cal_value'].argmin()]
-            if high['cal_value'] == low['cal_value']:
-                return low['cal_volume']
-            return low['cal_volume'] + ((val - low['cal_value']) / (high['cal_value'] - low['cal_value'])) * (high['cal_volume'] - low['cal_volume'])
-
-        agg['calibrated_volume_avg'] = agg.apply(lambda r: calibrate(r, 'value_avg'), axis=1)
-        agg['calibrated_volume_min'] = agg.apply(lambda r: calibrate(r, 'value_min'), axis=1)
-        agg['calibrated_volume_max'] = agg.apply(lambda r: calibrate(r, 'value_max'), axis=1)
+logger = logging.getLogger(__name__)
+
+HOURLY_GROUP_KEYS = [
+    'hour_bucket', 'device_id', 'sensor_name', 'event_id', 'sensor_id', 'input_label',
+    'sensor_label', 'sensor_type', 'sensor_units', 'units_type', 'group_type'
+]
+
+INPUTS_WINDOW = register_query('measurment_inputs', '''
+    SELECT device_id, sensor_name, event_id, device_time, value::FLOAT as raw_value
+    FROM raw_telematics_data.inputs
+    WHERE device_time >= NOW() - make_interval(hours => %(hours)s)
+''', INPUTS_SCHEMA)
+
+def _rollup_sql(time_filter: str) -> str:
+    """
+    Запрос часовых агрегатов на стороне PostgreSQL с условием на i.device_time
+    """
+    # Внутренний JOIN и IS NOT NULL повторяют отбрасывание строк с пустыми
+    # ключами группировки в pandas-версии
+    return f'''
+        SELECT
+            date_trunc('hour', i.device_time) AS hour_bucket,
+            i.device_id, i.sensor_name, i.event_id,
+            sd.sensor_id, sd.input_label, sd.sensor_label, sd.sensor_type, sd.sensor_units, sd.units_type, sd.group_type,
+            AVG(v.value) AS value_avg,
+            MIN(v.value) AS value_min,
+            MAX(v.value) AS value_max
+        FROM raw_telematics_data.inputs AS i
+        JOIN raw_business_data.sensor_description AS sd
+            ON sd.device_id = i.device_id AND sd.input_label = i.sensor_name
+        CROSS JOIN LATERAL (
+            SELECT CASE
+                WHEN COALESCE(sd.divider, 0) <> 0 THEN (i.value::FLOAT / sd.divider) * COALESCE(sd.multiplier, 1)
+                ELSE i.value::FLOAT
+            END AS value
+        ) AS v
+        WHERE ({time_filter})
+            AND i.event_id IS NOT NULL
+            AND sd.sensor_id IS NOT NULL AND sd.sensor_label IS NOT NULL AND sd.sensor_type IS NOT NULL
+            AND sd.sensor_units IS NOT NULL AND sd.units_type IS NOT NULL AND sd.group_type IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11
+    '''
+
+ROLLUP_WINDOW = register_query(
+    'measurment_rollup_window',
+    _rollup_sql('i.device_time >= NOW() - make_interval(hours => %(hours)s)'),
+    ROLLUP_SCHEMA
+)
+ROLLUP_INCREMENTAL = register_query(
+    'measurment_rollup_incremental',
+    _rollup_sql('(i.device_time >= %(window_start)s AND i.device_time < %(first_hour)s) OR i.device_time >= %(refresh_from)s'),
+    ROLLUP_SCHEMA
+)
+ROLLUP_BOUNDS = register_query('measurment_rollup_bounds', '''
+    SELECT
+        NOW() - make_interval(hours => %(hours)s) AS window_start,
+        date_trunc('hour', NOW()) AS current_hour
+''')
+FILTER_PAIRS = register_query('measurment_filter_pairs', '''
+    SELECT DISTINCT device_id, sensor_name
+    FROM raw_telematics_data.inputs
+    WHERE device_time >= NOW() - make_interval(hours => %(hours)s)
+''')
+
+def _rollup_client(conn, hours: int) -> pd.DataFrame:
+    """
+    Часовые агрегаты в pandas: выгружает сырые inputs и соединяет их с sensor_description
+    """
+    # 1. Сырые данные inputs
+    df_inputs = INPUTS_WINDOW.execute_bulk(conn, {'hours': int(hours)})
+    return _hourly_rollup(_scale_inputs(df_inputs, get_dimension_cache().sensor_meta(conn)))
+
+@profiled('measurment.merge')
+def _scale_inputs(df_inputs: pd.DataFrame, df_meta: pd.DataFrame) -> pd.DataFrame:
+    """
+    Соединяет сырые inputs с sensor_description, применяет divider/multiplier
+    и определяет часовой бакет
+    """
+    df = df_inputs.join(df_meta, on=['device_id', 'sensor_name'])
+    # join возвращает ключ строками: восстанавливаем тип ключа из inputs
+    df['sensor_name'] = df['sensor_name'].astype(df_inputs['sensor_name'].dtype)
+    df['value'] = np.where(df['divider'].fillna(0) != 0, (df['raw_value'] / df['divider']) * df['multiplier'].fillna(1), df['raw_value'])
+    df['hour_bucket'] = df['device_time'].dt.floor('H')
+    return df
+
+@profiled('measurment.groupby')
+def _hourly_rollup(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Агрегация по часу: avg/min/max по HOURLY_GROUP_KEYS
+    """
+    # observed=True: группы только по встречающимся сочетаниям категорий
+    agg = df.groupby(HOURLY_GROUP_KEYS, observed=True).agg(
+        value_avg = ('value', 'mean'),
+        value_min = ('value', 'min'),
+        value_max = ('value', 'max')
+    ).reset_index()
+    return agg
+
+def _rollup_server(conn, query, params: dict) -> pd.DataFrame:
+    """
+    Часовые агрегаты на стороне PostgreSQL: date_trunc, divider/multiplier и
+    avg/min/max считаются в БД, клиент получает только готовые часовые строки
+
+    Args:
+        query (Query): ROLLUP_WINDOW или ROLLUP_INCREMENTAL
+        params (dict): Параметры условия на i.device_time
+    """
+    return query.execute(conn, params)
+
+def _wall_time(value):
+    """
+    Время без часового пояса (локальное время сессии БД) для сравнения часов
+    """
+    if isinstance(value, pd.Series):
+        return value.dt.tz_localize(None) if value.dt.tz is not None else value
+    value = pd.Timestamp(value)
+    return value.tz_localize(None) if value.tzinfo is not None else value
+
+def _rollup_incremental(conn, hours: int, store) -> pd.DataFrame:
+    """
+    Часовые агрегаты из хранилища закрытых часов плюс свежие данные из БД
+
+    Из БД читаются только неполный первый час окна и часы начиная с
+    watermark хранилища минус окно опоздавших данных.
+    """
+    store.validate(get_dimension_cache().get(conn, 'sensor_description').fingerprint)
+    bounds = ROLLUP_BOUNDS.execute(conn, {'hours': int(hours)}).iloc[0]
+    bounds_tz = pd.Timestamp(bounds['window_start']).tzinfo
+    window_start = _wall_time(bounds['window_start'])
+    current_hour = _wall_time(bounds['current_hour'])
+    first_hour = window_start.ceil('h')
+    refresh_from = store.refresh_start(first_hour)
+
+    def db_time(value):
+        return (value.tz_localize(bounds_tz) if bounds_tz is not None else value).to_pydatetime()
 
+    fresh = _rollup_server(
+        conn,
+        ROLLUP_INCREMENTAL,
+        params={
+            'window_start': db_time(window_start),
+            'first_hour': db_time(first_hour),
+            'refresh_from': db_time(refresh_from)
+        }
+    )
+    tz = fresh['hour_bucket'].dt.tz if not fresh.empty else None
+    fresh['hour_bucket'] = _wall_time(pd.to_datetime(fresh['hour_bucket']))
+
+    closed = fresh[(fresh['hour_bucket'] >= refresh_from) & (fresh['hour_bucket'] < current_hour)]
+    store.save(closed, refresh_from, current_hour)
+    cached = store.load(first_hour, refresh_from)
+
+    # Хранилище возвращает строки, а категории свежих часов отличаются: приводим заново
+    agg = apply_schema(pd.concat([cached, fresh], ignore_index=True), ROLLUP_SCHEMA)
+    if tz is not None:
+        agg['hour_bucket'] = agg['hour_bucket'].dt.tz_localize(tz)
+    return agg
+
+def _finalize_measurments(conn, agg: pd.DataFrame, object_labels: Optional[List[str]] = None, sensor_labels: Optional[List[str]] = None, dims=None) -> pd.DataFrame:
+    """
+    Калибровка часовых агрегатов, подписи объектов и единиц, фильтры и итоговые колонки
+
+    Args:
+        dims (DimensionCache): Кэш справочников (по умолчанию общий для процесса)
+    """
+    if dims is None:
+        dims = get_dimension_cache()
+
+    # --- Калибровка ---
+    calibration = dims.calibration(conn)
+    with profile_stage('measurment.calibrate') as stage:
+        calibrated = calibration.interpolate(agg['sensor_id'], agg[['value_avg', 'value_min', 'value_max']])
+        agg['calibrated_volume_avg'] = calibrated[:, 0]
+        agg['calibrated_volume_min'] = calibrated[:, 1]
+        agg['calibrated_volume_max'] = calibrated[:, 2]
+        stage.record(agg)
+
+    objects = dims.objects(conn)
+    units = dims.descriptions(conn, 'sensor_description_units_type')
+    groups = dims.descriptions(conn, 'sensor_description_group_type')
+    with profile_stage('measurment.labels') as stage:
         # --- Добавляем object_label ---
-        agg = agg.merge(df_objects, on='device_id', how='left')
+        agg = agg.join(objects, on='device_id')
 
         # --- description_parametrs для sensor_units_final ---
-        units_desc = df_desc[df_desc['type'] == 'sensor_description_units_type'][['key', 'description']]
-        group_desc = df_desc[df_desc['type'] == 'sensor_description_group_type'][['key', 'description']]
-        agg = agg.merge(units_desc, left_on='units_type', right_on='key', how='left', suffixes=('', '_units'))
-        agg = agg.merge(group_desc, left_on='group_type', right_on='key', how='left', suffixes=('', '_group'))
-        agg['sensor_units_final'] = agg['sensor_units'].replace('', np.nan).fillna(agg['description'])
-
-        # --- Фильтрация по object_label и sensor_label ---
-        if object_labels:
-            agg = agg[agg['object_label'].isin(object_labels)]
-        if sensor_labels:
-            agg = agg[agg['sensor_label'].isin(sensor_labels)]
-
-        # --- Итоговые колонки ---
-        columns = [
-            'object_label', 'sensor_label', 'sensor_name', 'hour_bucket', 'sensor_type',
-            'sensor_units_final', 'calibrated_volume_min', 'calibrated_volume_max', 'calibrated_volume_avg'
-        ]
-        result = agg[columns].sort_values(['hour_bucket', 'object_label', 'sensor_label'])
-        logging.info(f"result shape: {result.shape}")
-        print(f"[DEBUG] result shape: {result.shape}")
-        return result
-    except Exception as e:
-        logging.error(f"Exception in get_measurment_data: {e}")
-        print(f"[ERROR] Exception in get_measurment_data: {e}")
-        traceback.print_exc()
-        return pd.DataFrame() 
\ No newline at end of file
+        agg = agg.join(units, on='units_type')
+        agg = agg.join(groups, on='group_type', rsuffix='_group')
+        agg['sensor_units_final'] = agg['sensor_units'].astype(object).replace('', np.nan).fillna(agg['description'])
+        stage.record(agg)
+
+    # --- Фильтрация по object_label и sensor_label ---
+    if object_labels:
+        agg = agg[agg['object_label'].isin(object_labels)]
+    if sensor_labels:
+        agg = agg[agg['sensor_label'].isin(sensor_labels)]
+    if object_labels or sensor_labels:
+        # Категории по всему парку не нужны в отфильтрованном результате
+        agg = agg.assign(**{column: agg[column].cat.remove_unused_categories() for column in agg.select_dtypes('category')})
+
+    # --- Итоговые колонки ---
+    columns = [
+        'object_label', 'sensor_label', 'sensor_name', 'hour_bucket', 'sensor_type',
+        'sensor_units_final', 'calibrated_volume_min', 'calibrated_volume_max', 'calibrated_volume_avg'
+    ]
+    return agg[columns].sort_values(['hour_bucket', 'object_label', 'sensor_label'])
+
+def get_measurment_data(conn, hours: int = 24, object_labels: Optional[List[str]] = None, sensor_labels: Optional[List[str]] = None, pushdown: bool = False, store=None) -> pd.DataFrame:
+    """
+    Часовые показания сенсоров с калибровкой и подписями объектов
+
+    При pushdown=True почасовая агрегация выполняется в PostgreSQL, и из БД
+    передаются только часовые avg/min/max вместо всех сырых inputs. Если
+    передан store (RollupStore), закрытые часы берутся из него, а из БД
+    агрегируются только новые данные.
+    """
+    try:
+        # 1-2. Часовые агрегаты inputs с учетом sensor_description
+        if store is not None:
+            agg = _rollup_incremental(conn, hours, store)
+        elif pushdown:
+            agg = _rollup_server(conn, ROLLUP_WINDOW, {'hours': int(hours)})
+        else:
+            agg = _rollup_client(conn, hours)
+
+        return _finalize_measurments(conn, agg, object_labels, sensor_labels)
+    except Exception:
+        logger.exception("Ошибка расчета данных measurment")
+        return pd.DataFrame()
+
+def get_measurment_filter_options(conn, hours: int = 72) -> Tuple[List[str], List[str]]:
+    """
+    Доступные object_label и sensor_label для фильтров дашборда
+
+    Вместо полного расчета get_measurment_data читает только пары
+    (device_id, sensor_name) с данными за период и подписывает их из кэша
+    справочников.
+    """
+    pairs = FILTER_PAIRS.execute(conn, {'hours': int(hours)})
+    dims = get_dimension_cache()
+    sensors = pairs.join(dims.sensor_meta(conn), on=['device_id', 'sensor_name'], how='inner')
+    objects = sensors.join(dims.objects(conn), on='device_id')
+    return sorted(objects['object_label'].dropna().unique()), sorted(sensors['sensor_label'].dropna().unique())
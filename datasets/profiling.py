@@ -0,0 +1,289 @@
+"""
+Профилирование стадий загрузки и обработки данных: время, строки и объем результата
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+
+# Запись стадий (PROFILING=0 отключает профилирование)
+PROFILING = os.getenv('PROFILING', '1') != '0'
+# Сколько последних прогонов хранится в памяти
+MAX_RUNS = int(os.getenv('PROFILING_MAX_RUNS', '50'))
+
+METRIC_PREFIX = 'fleet_dashboard'
+
+STAGE_COLUMNS = ['stage', 'depth', 'started_at', 'seconds', 'rows', 'memory_bytes']
+
+def _frame_size(result):
+    """
+    Число строк и объем в памяти (без учета содержимого строк) для DataFrame/Series
+    """
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        memory = result.memory_usage(index=True)
+        return len(result), int(memory.sum() if isinstance(memory, pd.Series) else memory)
+    return None, None
+
+class StageRecord:
+    """
+    Одна выполненная стадия: запрос к БД или шаг pandas
+    """
+
+    def __init__(self, name, depth, started_at):
+        self.name = name
+        self.depth = depth
+        self.started_at = started_at
+        self.seconds = None
+        self.rows = None
+        self.memory_bytes = None
+
+    def record(self, result):
+        """
+        Запоминает размер результата стадии
+
+        Returns:
+            Переданный результат без изменений
+        """
+        self.rows, self.memory_bytes = _frame_size(result)
+        return result
+
+    def to_dict(self):
+        return {
+            'stage': self.name,
+            'depth': self.depth,
+            'started_at': self.started_at.isoformat(),
+            'seconds': self.seconds,
+            'rows': self.rows,
+            'memory_bytes': self.memory_bytes
+        }
+
+class ProfileRun:
+    """
+    Прогон (например, обновление вкладки дашборда) со списком его стадий
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.started_at = datetime.now()
+        self.seconds = None
+        self.error = None
+        self.stages = []
+
+    def to_dict(self):
+        return {
+            'run': self.label,
+            'started_at': self.started_at.isoformat(),
+            'seconds': self.seconds,
+            'error': self.error,
+            'stages': [stage.to_dict() for stage in self.stages]
+        }
+
+    def to_frame(self):
+        """
+        Returns:
+            pd.DataFrame: Стадии прогона в порядке начала
+        """
+        return pd.DataFrame([stage.to_dict() for stage in self.stages], columns=STAGE_COLUMNS)
+
+class Profiler:
+    """
+    Накопитель стадий по прогонам и суммарно по процессу
+
+    Текущий прогон и вложенность стадий хранятся в threading.local, поэтому
+    сессии Streamlit (каждая в своем потоке) и фоновые потоки не смешивают
+    стадии. Стадии вне прогона (фоновый опрос и т.п.) учитываются только в
+    суммарной статистике, прогоны без стадий не сохраняются.
+    """
+
+    def __init__(self, max_runs=MAX_RUNS, enabled=PROFILING):
+        """
+        Args:
+            max_runs (int): Сколько последних прогонов хранить
+            enabled (bool): Записывать ли стадии
+        """
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._runs = deque(maxlen=max_runs)
+        self._totals = {}
+
+    def _current(self):
+        return getattr(self._local, 'run', None), getattr(self._local, 'depth', 0)
+
+    @contextmanager
+    def run(self, label):
+        """
+        Прогон с заданной меткой; внутри уже идущего прогона - вложенная стадия
+
+        Yields:
+            ProfileRun: Прогон (или None, если профилирование отключено)
+        """
+        if not self.enabled:
+            yield None
+            return
+        if self._current()[0] is not None:
+            with self.stage(label):
+                yield self._local.run
+            return
+        run = ProfileRun(label)
+        started = time.perf_counter()
+        self._local.run, self._local.depth = run, 0
+        try:
+            yield run
+        except Exception as e:
+            run.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            run.seconds = time.perf_counter() - started
+            self._local.run = None
+            # Перезапуски без загрузки данных (пустые прогоны) не сохраняются
+            if run.stages or run.error:
+                with self._lock:
+                    self._runs.append(run)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Замер стадии; результат передается в record() возвращаемого объекта
+
+        Пример:
+            with profile_stage('measurment.pivot') as stage:
+                chart_df = stage.record(df.pivot_table(...))
+        """
+        record = StageRecord(name, 0, datetime.now())
+        if not self.enabled:
+            yield record
+            return
+        run, depth = self._current()
+        record.depth = depth
+        if run is not None:
+            run.stages.append(record)
+        self._local.depth = depth + 1
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - started
+            self._local.depth = depth
+            self._add_total(record)
+
+    def _add_total(self, record):
+        with self._lock:
+            entry = self._totals.setdefault(record.name, {
+                'calls': 0, 'rows': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'last_memory_bytes': None
+            })
+            entry['calls'] += 1
+            entry['rows'] += record.rows or 0
+            entry['total_seconds'] += record.seconds
+            entry['max_seconds'] = max(entry['max_seconds'], record.seconds)
+            if record.memory_bytes is not None:
+                entry['last_memory_bytes'] = record.memory_bytes
+
+    def profiled(self, name):
+        """
+        Декоратор: стадия на каждый вызов функции, размер берется из ее результата
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name) as stage:
+                    return stage.record(func(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def runs(self, label=None):
+        """
+        Returns:
+            list: Сохраненные прогоны (последние в конце), опционально с заданной меткой
+        """
+        with self._lock:
+            runs = list(self._runs)
+        return [run for run in runs if label is None or run.label == label]
+
+    def totals_frame(self):
+        """
+        Returns:
+            pd.DataFrame: Суммарная статистика по стадиям, самые затратные первыми
+        """
+        with self._lock:
+            df = pd.DataFrame.from_dict({name: dict(entry) for name, entry in self._totals.items()}, orient='index')
+        if df.empty:
+            return pd.DataFrame(columns=['stage', 'calls', 'rows', 'total_seconds', 'max_seconds', 'last_memory_bytes', 'avg_seconds'])
+        df['avg_seconds'] = df['total_seconds'] / df['calls']
+        return df.rename_axis('stage').reset_index().sort_values('total_seconds', ascending=False, ignore_index=True)
+
+    def reset(self):
+        with self._lock:
+            self._runs.clear()
+            self._totals.clear()
+
+    def to_json(self):
+        """
+        Прогоны и суммарная статистика в JSON
+        """
+        totals = self.totals_frame()
+        return json.dumps({
+            'created_at': datetime.now().isoformat(),
+            'runs': [run.to_dict() for run in self.runs()],
+            'totals': totals.astype(object).where(totals.notna(), None).to_dict(orient='records')
+        }, indent=2)
+
+    def to_prometheus(self):
+        """
+        Суммарная статистика в текстовом формате Prometheus
+        """
+        totals = self.totals_frame()
+        metrics = [
+            ('stage_calls_total', 'counter', 'Number of executed stages', 'calls'),
+            ('stage_seconds_total', 'counter', 'Total wall time of stages, seconds', 'total_seconds'),
+            ('stage_seconds_max', 'gauge', 'Longest stage wall time, seconds', 'max_seconds'),
+            ('stage_rows_total', 'counter', 'Total rows returned by stages', 'rows'),
+            ('stage_memory_bytes', 'gauge', 'Memory of the last stage result, bytes', 'last_memory_bytes')
+        ]
+        lines = []
+        for metric, kind, description, column in metrics:
+            name = f'{METRIC_PREFIX}_{metric}'
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            for stage, value in zip(totals['stage'], totals[column]):
+                if pd.notna(value):
+                    lines.append(f'{name}{{stage="{_escape_label(stage)}"}} {value}')
+        name = f'{METRIC_PREFIX}_run_last_seconds'
+        lines += [f'# HELP {name} Wall time of the last run, seconds', f'# TYPE {name} gauge']
+        last_runs = {run.label: run for run in self.runs()}
+        for label, run in last_runs.items():
+            lines.append(f'{name}{{run="{_escape_label(label)}"}} {run.seconds}')
+        return '\n'.join(lines) + '\n'
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+_profiler = Profiler()
+
+def get_profiler():
+    """
+    Возвращает общий для процесса профилировщик
+    """
+    return _profiler
+
+def profile_run(label):
+    """
+    Прогон общего профилировщика (см. Profiler.run)
+    """
+    return _profiler.run(label)
+
+def profile_stage(name):
+    """
+    Стадия общего профилировщика (см. Profiler.stage)
+    """
+    return _profiler.stage(name)
+
+def profiled(name):
+    """
+    Декоратор стадии общего профилировщика (см. Profiler.profiled)
+    """
+    return _profiler.profiled(name)
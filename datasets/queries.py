@@ -1,28 +1,297 @@
 """
 SQL запросы для дашборда мониторинга движения
 """
+import io
+import logging
+import os
+import re
+import threading
+import time
+import weakref
 from datetime import datetime, timezone
+import pandas as pd
+import psycopg2
+from psycopg2 import errors, extensions
+from datasets.profiling import profile_stage
+from datasets.schema import apply_schema
 
-def get_current_status_query(params=None):
+# Выполнять зарегистрированные запросы как серверные prepared statements
+# (отключается, например, за pgbouncer в режиме transaction pooling)
+PREPARE_STATEMENTS = os.getenv('DB_PREPARE_STATEMENTS', '1') != '0'
+# Выгружать большие результаты через COPY ... TO STDOUT (см. Query.execute_bulk)
+BULK_COPY = os.getenv('DB_BULK_COPY', '1') != '0'
+
+_PARAM_PATTERN = re.compile(r'%\((\w+)\)s')
+
+# Типы колонок (oid PostgreSQL), которые разбирает COPY-путь; с другими
+# типами запрос выполняется обычным путем
+_COPY_INT_TYPES = {20, 21, 23}
+_COPY_FLOAT_TYPES = {700, 701, 1700}
+_COPY_TEXT_TYPES = {19, 25, 1042, 1043}
+_COPY_BOOL_TYPES = {16}
+_COPY_TIMESTAMP_TYPES = {1114}
+_COPY_TYPES = _COPY_INT_TYPES | _COPY_FLOAT_TYPES | _COPY_TEXT_TYPES | _COPY_BOOL_TYPES | _COPY_TIMESTAMP_TYPES
+# Маркер NULL в CSV: пустая строка остается пустой строкой, а не NaN
+_COPY_NULL = '\\N'
+
+logger = logging.getLogger(__name__)
+
+class Query:
     """
-    Возвращает SQL запрос для получения текущего статуса с учетом параметров фильтрации
-    
+    Запрос, определенный один раз с параметрами %(name)s
+
+    Текст запроса не зависит от значений параметров, поэтому на каждом
+    соединении он один раз подготавливается (PREPARE) и дальше выполняется
+    через EXECUTE без повторного разбора и планирования.
+    """
+
+    def __init__(self, name, sql, schema=None):
+        """
+        Args:
+            name (str): Имя запроса (и prepared statement)
+            sql (str): Текст запроса с параметрами %(name)s
+            schema (dict): Компактные типы колонок результата (см. datasets.schema)
+        """
+        self.name = name
+        self.sql = sql
+        self.schema = schema or {}
+        self.param_names = list(dict.fromkeys(_PARAM_PATTERN.findall(sql)))
+        positions = {param: index + 1 for index, param in enumerate(self.param_names)}
+        self._prepare_sql = _PARAM_PATTERN.sub(lambda m: f'${positions[m.group(1)]}', sql).replace('%%', '%')
+        # Тело запроса для COPY (...) и подзапроса; перевод строки закрывает комментарий в конце
+        self._subquery_sql = sql.rstrip().rstrip(';') + '\n'
+
+    def _prepare(self, conn, cursor):
+        prepared = _prepared.setdefault(conn, set())
+        if self.name not in prepared:
+            cursor.execute(f'PREPARE {self.name} AS {self._prepare_sql}')
+            prepared.add(self.name)
+            _stats.record_prepare(self.name)
+
+    def _execute_prepared(self, conn, cursor, params):
+        self._prepare(conn, cursor)
+        values = [params[param] for param in self.param_names]
+        if values:
+            cursor.execute(f"EXECUTE {self.name} ({', '.join(['%s'] * len(values))})", values)
+        else:
+            cursor.execute(f'EXECUTE {self.name}')
+
+    def execute(self, conn, params=None):
+        """
+        Выполняет запрос и возвращает результат
+
+        Args:
+            conn: Соединение psycopg2
+            params (dict): Значения параметров
+
+        Returns:
+            pd.DataFrame: Результат запроса (как pd.read_sql)
+        """
+        params = params or {}
+        started = time.perf_counter()
+        idle = conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+        with profile_stage(f'sql.{self.name}') as stage, conn.cursor() as cursor:
+            if not PREPARE_STATEMENTS:
+                cursor.execute(self.sql, params)
+            else:
+                try:
+                    self._execute_prepared(conn, cursor, params)
+                except errors.InvalidSqlStatementName:
+                    # Соединение сброшено (DISCARD ALL и т.п.): подготавливаем заново,
+                    # если не прерываем чужую транзакцию
+                    if not idle:
+                        raise
+                    conn.rollback()
+                    _prepared.pop(conn, None)
+                    self._execute_prepared(conn, cursor, params)
+            columns = [col[0] for col in cursor.description]
+            rows = cursor.fetchall()
+            df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+            del rows
+            df = stage.record(apply_schema(df, self.schema))
+        _stats.record(self.name, time.perf_counter() - started, len(df))
+        return df
+
+    def _copy_columns(self, conn, cursor, params):
+        """
+        Имена и oid типов колонок результата (один раз на запрос и соединение:
+        типы не зависят от значений параметров, но oid типов расширений и
+        схема таблиц могут отличаться между базами)
+        """
+        result_types = _result_types.setdefault(conn, {})
+        columns = result_types.get(self.name)
+        if columns is None:
+            cursor.execute(f'SELECT * FROM ({self._subquery_sql}) AS q LIMIT 0', params)
+            columns = [(col.name, col.type_code) for col in cursor.description]
+            result_types[self.name] = columns
+        return columns
+
+    def _copy(self, conn, params):
+        """
+        COPY (запрос) TO STDOUT в CSV и разбор буфера сразу в колонки
+
+        Returns:
+            pd.DataFrame: Результат или None, если в результате есть
+                неподдерживаемые типы колонок
+        """
+        with conn.cursor() as cursor:
+            columns = self._copy_columns(conn, cursor, params)
+            if any(type_code not in _COPY_TYPES for _, type_code in columns):
+                return None
+            encoding = extensions.encodings[conn.encoding]
+            query = cursor.mogrify(self._subquery_sql, params).decode(encoding)
+            buffer = io.BytesIO()
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, NULL '{_COPY_NULL}')", buffer)
+        names = [name for name, _ in columns]
+        if not buffer.getbuffer().nbytes:
+            return apply_schema(pd.DataFrame(columns=names), self.schema)
+        buffer.seek(0)
+        # Целые разбираются без явного типа: с NULL получается float64, как у from_records
+        dtype = {}
+        for position, (_, type_code) in enumerate(columns):
+            if type_code in _COPY_FLOAT_TYPES:
+                dtype[position] = 'float64'
+            elif type_code not in _COPY_INT_TYPES:
+                dtype[position] = object
+        df = pd.read_csv(
+            buffer, header=None, dtype=dtype, na_values=[_COPY_NULL], keep_default_na=False, encoding=encoding
+        )
+        df.columns = names
+        for position, (name, type_code) in enumerate(columns):
+            if type_code in _COPY_TIMESTAMP_TYPES:
+                df.isetitem(position, pd.to_datetime(df.iloc[:, position], format='ISO8601'))
+            elif type_code in _COPY_BOOL_TYPES:
+                df.isetitem(position, df.iloc[:, position].map({'t': True, 'f': False}))
+        return apply_schema(df, self.schema)
+
+    def execute_bulk(self, conn, params=None):
+        """
+        Выполняет запрос через COPY (...) TO STDOUT для больших выгрузок
+
+        Результат передается одним CSV-потоком и разбирается C-парсером pandas
+        сразу в типизированные колонки, без построения Python-кортежа на каждую
+        строку, как при fetchall/pd.read_sql. При DB_BULK_COPY=0, колонках
+        неподдерживаемых типов или ошибке COPY (если соединение было вне
+        транзакции) запрос выполняется обычным execute.
+
+        Args:
+            conn: Соединение psycopg2
+            params (dict): Значения параметров
+
+        Returns:
+            pd.DataFrame: Результат запроса в формате execute
+        """
+        if not BULK_COPY:
+            return self.execute(conn, params)
+        params = params or {}
+        started = time.perf_counter()
+        idle = conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+        try:
+            with profile_stage(f'sql.copy.{self.name}') as stage:
+                df = stage.record(self._copy(conn, params))
+        except (psycopg2.Error, ValueError) as e:
+            # Ошибка в чужой транзакции прерывает ее: повторить нельзя
+            if isinstance(e, psycopg2.Error) and not idle:
+                raise
+            if conn.info.transaction_status == extensions.TRANSACTION_STATUS_INERROR:
+                conn.rollback()
+            logger.warning("COPY для запроса %s не удался, обычное выполнение: %s", self.name, e)
+            df = None
+        if df is None:
+            return self.execute(conn, params)
+        _stats.record(self.name, time.perf_counter() - started, len(df))
+        return df
+
+class QueryStats:
+    """
+    Накопленная статистика выполнения зарегистрированных запросов
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _entry(self, name):
+        return self._stats.setdefault(name, {'calls': 0, 'prepares': 0, 'rows': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+
+    def record(self, name, seconds, rows):
+        with self._lock:
+            entry = self._entry(name)
+            entry['calls'] += 1
+            entry['rows'] += rows
+            entry['total_seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+    def record_prepare(self, name):
+        with self._lock:
+            self._entry(name)['prepares'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def to_frame(self):
+        """
+        Returns:
+            pd.DataFrame: Статистика по запросам, самые затратные первыми
+        """
+        with self._lock:
+            df = pd.DataFrame.from_dict(self._stats, orient='index')
+        if df.empty:
+            return pd.DataFrame(columns=['query', 'calls', 'prepares', 'rows', 'total_seconds', 'max_seconds', 'avg_seconds'])
+        df['avg_seconds'] = df['total_seconds'] / df['calls'].where(df['calls'] > 0)
+        return df.rename_axis('query').reset_index().sort_values('total_seconds', ascending=False, ignore_index=True)
+
+QUERIES = {}
+_prepared = weakref.WeakKeyDictionary()
+# Колонки результата запросов по соединениям (см. Query._copy_columns)
+_result_types = weakref.WeakKeyDictionary()
+_stats = QueryStats()
+
+def register_query(name, sql, schema=None):
+    """
+    Регистрирует запрос в реестре
+
     Args:
-        params (dict): Параметры фильтрации
-            - max_idle_speed: максимальная скорость для определения простоя
-            - min_idle_detection: минимальное время для определения простоя
-            - gps_not_updated_min: минимальное время отсутствия обновления GPS
-            - gps_not_updated_max: максимальное время отсутствия обновления GPS
+        name (str): Уникальное имя запроса
+        sql (str): Текст запроса с параметрами %(name)s
+        schema (dict): Компактные типы колонок результата (см. datasets.schema)
+
+    Returns:
+        Query: Зарегистрированный запрос
+    """
+    if name in QUERIES and QUERIES[name].sql != sql:
+        raise ValueError(f"Запрос {name} уже зарегистрирован с другим текстом")
+    QUERIES[name] = Query(name, sql, schema)
+    return QUERIES[name]
+
+def run_query(conn, name, params=None):
+    """
+    Выполняет зарегистрированный запрос (см. Query.execute)
     """
-    if params is None:
-        params = {
-            'max_idle_speed': 2,
-            'min_idle_detection': 3,
-            'gps_not_updated_min': 5,
-            'gps_not_updated_max': 10
-        }
+    return QUERIES[name].execute(conn, params)
+
+def get_query_stats():
+    """
+    Возвращает статистику выполнения зарегистрированных запросов
+    """
+    return _stats.to_frame()
+
+def reset_query_stats():
+    """
+    Сбрасывает статистику выполнения запросов
+    """
+    _stats.reset()
+
+def get_current_status_query():
+    """
+    Возвращает SQL запрос для получения последней точки каждого устройства
     
-    return f"""
+    Статусы движения и подключения по порогам из параметров управления
+    вычисляются на клиенте (см. datasets.status.classify_status), поэтому
+    текст запроса не зависит от положения слайдеров.
+    """
+    return """
     WITH latest_data AS (
         SELECT 
             o.object_id,
@@ -31,17 +300,10 @@ def get_current_status_query(params=None):
             e.first_name,
             e.last_name,
             tdc.speed / 100 AS speed,
+            tdc.latitude / 1e7 AS latitude,
+            tdc.longitude / 1e7 AS longitude,
             tdc.device_time,
-            CASE 
-                WHEN tdc.speed / 100 > {params['max_idle_speed']} THEN 'moving'
-                WHEN EXTRACT(EPOCH FROM (NOW() - tdc.device_time)) / 60 < {params['min_idle_detection']} THEN 'stopped'
-                ELSE 'parked'
-            END AS moving_status,
-            CASE 
-                WHEN EXTRACT(EPOCH FROM (NOW() - tdc.device_time)) / 60 <= {params['gps_not_updated_min']} THEN 'active'
-                WHEN EXTRACT(EPOCH FROM (NOW() - tdc.device_time)) / 60 <= {params['gps_not_updated_max']} THEN 'idle'
-                ELSE 'offline'
-            END AS connection_status,
+            EXTRACT(EPOCH FROM (NOW() - tdc.device_time)) AS last_connect,
             to_char(tdc.device_time, 'YYYY-MM-DD HH24:MI:SS') as last_connect_formatted
         FROM 
             raw_telematics_data.tracking_data_core AS tdc
@@ -61,94 +323,4 @@ def get_current_status_query(params=None):
     ORDER BY device_id, device_time DESC;
     """
 
-# Запрос для получения текущего статуса объектов
-CURRENT_STATUS_QUERY = """
-    WITH filtered_tracking_data AS (
-    SELECT *
-    FROM raw_telematics_data.tracking_data_core
-    WHERE device_time > now() - INTERVAL '1 days'
-    ),
-    latest_tracking AS (
-    SELECT DISTINCT ON (device_id)
-        device_id,
-        device_time,
-        event_id,
-        speed,
-        longitude,
-        latitude,
-        altitude
-    FROM filtered_tracking_data
-    WHERE event_id IN (2, 802, 803, 804, 811)
-    ORDER BY device_id, device_time DESC
-    ),
-    latest_positions AS (
-    SELECT DISTINCT ON (device_id)
-        device_id,
-        longitude,
-        latitude
-    FROM filtered_tracking_data
-    ORDER BY device_id, device_time DESC
-    ),
-    zones_match AS (
-    SELECT
-        z.zone_label,
-        lp.device_id
-    FROM raw_business_data.zones z
-    JOIN latest_positions lp ON ST_DWithin(
-        ST_SetSRID(ST_MakePoint(lp.longitude / 1e7, lp.latitude / 1e7), 4326)::geography,
-        ST_SetSRID(ST_MakePoint(z.circle_center_longitude, z.circle_center_latitude), 4326)::geography,
-        z.radius
-    )
-    WHERE z.zone_type = 'circle'
-    )
-
-    -- main query:
-    SELECT
-    o.object_id,
-    o.device_id,
-    o.object_label,
-    e.first_name,
-    e.last_name,
-    t.device_time,
-    t.event_id,
-    t.speed / 1e2 AS speed,
-    string_agg(DISTINCT zones_match.zone_label, ', ') AS geozones,
-    t.longitude / 1e7 AS longitude,
-    t.latitude / 1e7 AS latitude,
-    t.altitude / 1e7 AS altitude,
-    EXTRACT(EPOCH FROM (now() - t.device_time)) AS last_connect,
-    TO_CHAR(
-        make_interval(secs => EXTRACT(EPOCH FROM (now() - t.device_time))),
-        'HH24:MI:SS'
-    ) AS last_connect_formatted,
-    CASE
-        WHEN t.device_time IS NULL THEN 'offline'
-        WHEN EXTRACT(EPOCH FROM (now() - t.device_time)) <= 60 THEN 'active'
-        WHEN EXTRACT(EPOCH FROM (now() - t.device_time)) <= 300 THEN 'idle'
-        ELSE 'offline'
-    END AS Connection_status,
-    CASE
-        WHEN t.device_time IS NULL THEN 'parked'
-        WHEN t.speed > 3 AND EXTRACT(EPOCH FROM (now() - t.device_time)) <= 300 THEN 'moving'
-        WHEN t.speed <= 3 AND EXTRACT(EPOCH FROM (now() - t.device_time)) <= 300 THEN 'stopped'
-        ELSE 'parked'
-    END AS moving_status
-    FROM raw_business_data.objects AS o
-    LEFT JOIN latest_tracking AS t ON o.device_id = t.device_id
-    LEFT JOIN raw_business_data.employees AS e ON o.object_id = e.object_id
-    LEFT JOIN zones_match ON zones_match.device_id = t.device_id
-    GROUP BY
-    o.object_id,
-    o.device_id,
-    o.object_label,
-    e.first_name,
-    e.last_name,
-    t.device_time,
-    t.event_id,
-    t.speed,
-    t.longitude,
-    t.latitude,
-    t.altitude
-    ORDER BY
-    t.device_time DESC NULLS LAST
-""" 
\ No newline at end of file
+CURRENT_STATUS = register_query('current_status', get_current_status_query())
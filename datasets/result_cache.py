@@ -0,0 +1,247 @@
+"""
+Общий для сессий кэш результатов загрузки с объединением одновременных запросов
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from datasets.profiling import METRIC_PREFIX, _escape_label, profile_stage
+
+# Возраст результата по умолчанию, после которого он загружается заново, с
+DEFAULT_MAX_AGE = float(os.getenv('RESULT_CACHE_MAX_AGE', '300'))
+# Предел суммарного объема результатов в памяти, МБ
+DEFAULT_MAX_MB = float(os.getenv('RESULT_CACHE_MAX_MB', '512'))
+# Сколько ждать чужую загрузку того же ключа, с
+DEFAULT_WAIT_SECONDS = float(os.getenv('RESULT_CACHE_WAIT_SECONDS', '120'))
+
+STATS_COLUMNS = ['cache', 'hits', 'misses', 'coalesced', 'errors', 'evictions', 'entries', 'memory_bytes']
+
+def _result_bytes(value):
+    """
+    Оценка объема результата в памяти (DataFrame, снимок с frame, кортежи и списки)
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        memory = value.memory_usage(index=True, deep=True)
+        return int(memory.sum() if isinstance(memory, pd.Series) else memory)
+    if isinstance(getattr(value, 'frame', None), pd.DataFrame):
+        return _result_bytes(value.frame)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_result_bytes(item) for item in value)
+    return sys.getsizeof(value)
+
+def _caller_copy(value):
+    """
+    Копия результата для одного вызывающего: DataFrame и Series копируются,
+    кортежи и списки - поэлементно. Остальные объекты (например,
+    StatusSnapshot) отдаются общими: они не изменяются на месте, а их
+    ленивые кэши потокобезопасны.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if type(value) in (tuple, list):
+        return type(value)(_caller_copy(item) for item in value)
+    return value
+
+class ResultLoadError(RuntimeError):
+    """
+    Ошибка загрузки, которую ждал вызывающий (исходная ошибка - в __cause__)
+    """
+
+class _Flight:
+    """
+    Выполняющаяся загрузка, которую ждут остальные вызывающие
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class _Entry:
+    def __init__(self, value, size):
+        self.value = value
+        self.size = size
+        self.loaded_at = time.monotonic()
+
+class ResultCache:
+    """
+    Кэш результатов по явному ключу с single-flight загрузкой
+
+    Ключ - кортеж, первый элемент которого - имя кэша (для счетчиков), а
+    остальные - все, от чего зависит результат, включая конфигурацию
+    подключения. Пока результат по ключу загружается, остальные вызывающие
+    не запускают свою загрузку, а ждут эту (не дольше wait_seconds).
+    Каждый вызывающий получает свою копию DataFrame и контейнеров (см.
+    _caller_copy). Устаревшие (старше max_age) результаты загружаются
+    заново, при превышении max_mb вытесняются давно не использованные.
+    Ошибка загрузки не кэшируется: ожидающие получают каждый свой
+    ResultLoadError с исходной ошибкой в __cause__.
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, max_mb=DEFAULT_MAX_MB, wait_seconds=DEFAULT_WAIT_SECONDS):
+        """
+        Args:
+            max_age (float): Возраст результата по умолчанию, с
+            max_mb (float): Предел суммарного объема результатов, МБ
+            wait_seconds (float): Предел ожидания чужой загрузки, с
+        """
+        self.max_age = max_age
+        self.max_bytes = int(max_mb * 2 ** 20)
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._bytes = 0
+        self._stats = {}
+
+    def _count(self, name, counter, value=1):
+        stats = self._stats.setdefault(name, {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0, 'evictions': 0})
+        stats[counter] += value
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def get(self, key, load, max_age=None):
+        """
+        Возвращает результат по ключу, загружая его не больше одного раза
+        одновременно
+
+        Args:
+            key (tuple): (имя кэша, параметры...) - хешируемые значения
+            load (callable): Загрузка без аргументов
+            max_age (float): Допустимый возраст результата, с (по умолчанию self.max_age)
+
+        Returns:
+            Результат load (копия для этого вызывающего, см. _caller_copy)
+
+        Raises:
+            ResultLoadError: Загрузка, которую ждал вызывающий, завершилась ошибкой
+            TimeoutError: Чужая загрузка не завершилась за wait_seconds
+        """
+        name = key[0]
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and time.monotonic() - entry.loaded_at < max_age
+            if hit:
+                self._entries.move_to_end(key)
+                self._count(name, 'hits')
+            else:
+                flight = self._flights.get(key)
+                owner = flight is None
+                if owner:
+                    flight = _Flight()
+                    self._flights[key] = flight
+                    self._count(name, 'misses')
+                else:
+                    self._count(name, 'coalesced')
+        if hit:
+            # Копия снимается вне блокировки
+            return _caller_copy(entry.value)
+
+        if not owner:
+            with profile_stage(f'cache.wait.{name}'):
+                done = flight.done.wait(self.wait_seconds)
+            if not done:
+                raise TimeoutError(f"Загрузка {name} не завершилась за {self.wait_seconds:g} с")
+            if flight.error is not None:
+                # Свое исключение каждому ожидающему: общий объект не получает чужой traceback
+                raise ResultLoadError(f"Загрузка {name} завершилась ошибкой: {flight.error}") from flight.error
+            return _caller_copy(flight.result)
+
+        try:
+            flight.result = load()
+        except BaseException as e:
+            # В том числе прерывание загрузки (перезапуск скрипта Streamlit,
+            # KeyboardInterrupt): ожидающие не должны получить пустой результат
+            flight.error = e
+            with self._lock:
+                self._count(name, 'errors')
+            raise
+        else:
+            self._store(key, flight.result)
+            return _caller_copy(flight.result)
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _store(self, key, value):
+        size = _result_bytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                # Результат больше всего кэша: отдаем без сохранения, не вытесняя остальные
+                self._count(key[0], 'evictions')
+                return
+            self._entries[key] = _Entry(value, size)
+            self._bytes += size
+            # Вытесняем давно не использованные
+            while self._bytes > self.max_bytes:
+                evicted = next(iter(self._entries))
+                self._drop(evicted)
+                self._count(evicted[0], 'evictions')
+
+    def invalidate(self, name=None):
+        """
+        Удаляет результаты одного кэша или все (выполняющиеся загрузки не прерываются)
+        """
+        with self._lock:
+            for key in [key for key in self._entries if name is None or key[0] == name]:
+                self._drop(key)
+
+    def reset_stats(self):
+        """
+        Сбрасывает счетчики (результаты остаются)
+        """
+        with self._lock:
+            self._stats.clear()
+
+    def stats_frame(self):
+        """
+        Returns:
+            pd.DataFrame: Счетчики, число и объем результатов по именам кэшей
+        """
+        with self._lock:
+            stats = {name: dict(values, entries=0, memory_bytes=0) for name, values in self._stats.items()}
+            for key, entry in self._entries.items():
+                values = stats.setdefault(key[0], {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0, 'evictions': 0, 'entries': 0, 'memory_bytes': 0})
+                values['entries'] += 1
+                values['memory_bytes'] += entry.size
+        if not stats:
+            return pd.DataFrame(columns=STATS_COLUMNS)
+        return pd.DataFrame.from_dict(stats, orient='index').rename_axis('cache').reset_index()[STATS_COLUMNS]
+
+    def to_prometheus(self):
+        """
+        Счетчики в текстовом формате Prometheus
+        """
+        stats = self.stats_frame()
+        metrics = [
+            ('result_cache_hits_total', 'counter', 'Results served from cache', 'hits'),
+            ('result_cache_misses_total', 'counter', 'Loads started on a cache miss', 'misses'),
+            ('result_cache_coalesced_total', 'counter', 'Callers that waited for an in-flight load', 'coalesced'),
+            ('result_cache_errors_total', 'counter', 'Failed loads', 'errors'),
+            ('result_cache_evictions_total', 'counter', 'Results evicted by the memory limit', 'evictions'),
+            ('result_cache_entries', 'gauge', 'Cached results', 'entries'),
+            ('result_cache_memory_bytes', 'gauge', 'Estimated memory of cached results, bytes', 'memory_bytes')
+        ]
+        lines = []
+        for metric, kind, description, column in metrics:
+            name = f'{METRIC_PREFIX}_{metric}'
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            for cache, value in zip(stats['cache'], stats[column]):
+                lines.append(f'{name}{{cache="{_escape_label(cache)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+_result_cache = ResultCache()
+
+def get_result_cache():
+    """
+    Возвращает общий для процесса кэш результатов
+    """
+    return _result_cache
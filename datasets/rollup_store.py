@@ -0,0 +1,177 @@
+"""
+Локальное хранилище закрытых часовых агрегатов сенсоров (SQLite)
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+import pandas as pd
+from datasets.profiling import profiled
+from db_connection import config_path
+
+DEFAULT_ROLLUP_PATH = os.getenv('MEASURMENT_ROLLUP_PATH', os.path.join('.cache', 'measurment_rollup.sqlite3'))
+
+ROLLUP_COLUMNS = [
+    'hour_bucket', 'device_id', 'sensor_name', 'event_id', 'sensor_id', 'input_label',
+    'sensor_label', 'sensor_type', 'sensor_units', 'units_type', 'group_type',
+    'value_avg', 'value_min', 'value_max'
+]
+
+_HOUR_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class RollupStore:
+    """
+    Закрытые часовые бакеты по (device_id, sensor_name, event_id, hour_bucket)
+
+    Хранилище покрывает непрерывный интервал часов [coverage_start, watermark).
+    Часы внутри окна late_hours перед watermark пересчитываются при каждом
+    обновлении, чтобы учесть опоздавшие данные. Хранятся значения после
+    divider/multiplier, поэтому при изменении sensor_description хранилище
+    сбрасывается; калибровка применяется после чтения и сброса не требует.
+    """
+
+    def __init__(self, path=DEFAULT_ROLLUP_PATH, late_hours=2, retention_hours=96):
+        """
+        Args:
+            path (str): Путь к файлу SQLite
+            late_hours (int): Окно пересчета опоздавших данных, часов
+            retention_hours (int): Сколько часов истории хранить
+        """
+        self.path = path
+        self.late_hours = late_hours
+        self.retention_hours = retention_hours
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS hourly_rollup (
+                    hour_bucket TEXT, device_id INTEGER, sensor_name TEXT, event_id INTEGER,
+                    sensor_id INTEGER, input_label TEXT, sensor_label TEXT, sensor_type TEXT,
+                    sensor_units TEXT, units_type INTEGER, group_type INTEGER,
+                    value_avg REAL, value_min REAL, value_max REAL
+                )
+            ''')
+            db.execute('CREATE INDEX IF NOT EXISTS hourly_rollup_hour ON hourly_rollup (hour_bucket)')
+            db.execute('CREATE TABLE IF NOT EXISTS rollup_meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _get_meta(self, db, key):
+        row = db.execute('SELECT value FROM rollup_meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, db, key, value):
+        db.execute('INSERT OR REPLACE INTO rollup_meta (key, value) VALUES (?, ?)', (key, value))
+
+    def _coverage(self, db):
+        coverage_start = self._get_meta(db, 'coverage_start')
+        watermark = self._get_meta(db, 'watermark')
+        if coverage_start is None or watermark is None:
+            return None, None
+        return pd.Timestamp(coverage_start), pd.Timestamp(watermark)
+
+    def invalidate(self):
+        """
+        Полностью очищает хранилище
+        """
+        with self._lock, self._connect() as db:
+            db.execute('DELETE FROM hourly_rollup')
+            db.execute("DELETE FROM rollup_meta WHERE key IN ('coverage_start', 'watermark')")
+
+    def validate(self, fingerprint):
+        """
+        Сбрасывает хранилище, если изменился отпечаток sensor_description
+
+        Args:
+            fingerprint (str): Отпечаток текущего содержимого таблицы
+        """
+        with self._lock, self._connect() as db:
+            if self._get_meta(db, 'fingerprint') == fingerprint:
+                return
+            db.execute('DELETE FROM hourly_rollup')
+            db.execute("DELETE FROM rollup_meta WHERE key IN ('coverage_start', 'watermark')")
+            self._set_meta(db, 'fingerprint', fingerprint)
+
+    def refresh_start(self, first_hour):
+        """
+        Возвращает час, начиная с которого данные нужно пересчитать из БД
+
+        Args:
+            first_hour (pd.Timestamp): Первый полный час запрошенного окна
+        """
+        with self._connect() as db:
+            coverage_start, watermark = self._coverage(db)
+        if coverage_start is None or coverage_start > first_hour:
+            return first_hour
+        return max(first_hour, watermark - timedelta(hours=self.late_hours))
+
+    @profiled('rollup_store.load')
+    def load(self, start, end):
+        """
+        Читает закрытые часы из интервала [start, end)
+        """
+        with self._connect() as db:
+            df = pd.read_sql(
+                'SELECT * FROM hourly_rollup WHERE hour_bucket >= ? AND hour_bucket < ?',
+                db,
+                params=(start.strftime(_HOUR_FORMAT), end.strftime(_HOUR_FORMAT))
+            )
+        df['hour_bucket'] = pd.to_datetime(df['hour_bucket'])
+        return df[ROLLUP_COLUMNS]
+
+    @profiled('rollup_store.save')
+    def save(self, df, since, watermark):
+        """
+        Заменяет часы начиная с since пересчитанными закрытыми часами
+
+        Args:
+            df (pd.DataFrame): Часовые агрегаты из интервала [since, watermark)
+            since (pd.Timestamp): Начало пересчитанного интервала
+            watermark (pd.Timestamp): Первый еще не закрытый час
+        """
+        rows = df[ROLLUP_COLUMNS].copy()
+        rows['hour_bucket'] = pd.to_datetime(rows['hour_bucket']).dt.strftime(_HOUR_FORMAT)
+        retention_start = watermark - timedelta(hours=self.retention_hours)
+        with self._lock, self._connect() as db:
+            coverage_start, current_watermark = self._coverage(db)
+            if coverage_start is None or since > current_watermark or since < coverage_start:
+                # Разрыв с сохраненной историей: начинаем покрытие заново
+                db.execute('DELETE FROM hourly_rollup')
+                coverage_start = since
+            else:
+                db.execute('DELETE FROM hourly_rollup WHERE hour_bucket >= ?', (since.strftime(_HOUR_FORMAT),))
+            rows.to_sql('hourly_rollup', db, if_exists='append', index=False)
+            if coverage_start < retention_start:
+                db.execute('DELETE FROM hourly_rollup WHERE hour_bucket < ?', (retention_start.strftime(_HOUR_FORMAT),))
+                coverage_start = retention_start
+            self._set_meta(db, 'coverage_start', coverage_start.isoformat())
+            self._set_meta(db, 'watermark', watermark.isoformat())
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_rollup_store(config=None):
+    """
+    Возвращает общее для процесса хранилище часовых агрегатов конфигурации
+    подключения (у каждой БД свой файл, см. config_path)
+
+    Args:
+        config (dict): Параметры подключения (по умолчанию DB_CONFIG)
+    """
+    path = config_path(DEFAULT_ROLLUP_PATH, config)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = RollupStore(path)
+            _stores[path] = store
+        return store
@@ -0,0 +1,85 @@
+"""
+Компактные типы колонок телеметрии, применяемые при загрузке
+"""
+import numpy as np
+import pandas as pd
+
+# Сырые точки tracking_data_core: координаты - целые градусы * 1e7
+# (до ±1.8e9, помещаются в int32), скорость - км/ч * 100. Высота в тех же
+# единицах * 1e7 и device_id (bigint) приводятся к int32, только если
+# значения помещаются (см. apply_schema)
+TRACKING_POINTS_SCHEMA = {
+    'device_id': 'int32',
+    'speed': 'int16',
+    'latitude': 'int32',
+    'longitude': 'int32',
+    'altitude': 'int32',
+    'event_id': 'int16'
+}
+
+# Сырые inputs: имя сенсора повторяется на каждой строке
+INPUTS_SCHEMA = {
+    'device_id': 'int32',
+    'sensor_name': 'category',
+    'event_id': 'int16'
+}
+
+# Часовые агрегаты inputs (из pandas, PostgreSQL или хранилища закрытых часов)
+ROLLUP_SCHEMA = {
+    'device_id': 'int32',
+    'sensor_name': 'category',
+    'event_id': 'int16',
+    'input_label': 'category',
+    'sensor_label': 'category',
+    'sensor_type': 'category',
+    'sensor_units': 'category'
+}
+
+# Подписи сенсоров из sensor_description
+SENSOR_META_SCHEMA = {
+    'input_label': 'category',
+    'sensor_label': 'category',
+    'sensor_type': 'category',
+    'sensor_units': 'category'
+}
+
+OBJECT_LABELS_SCHEMA = {
+    'object_label': 'category'
+}
+
+def _fits(values, dtype):
+    """
+    Помещаются ли значения колонки в целочисленный тип без потерь
+    """
+    if values.isna().any():
+        return False
+    if not len(values):
+        return True
+    info = np.iinfo(dtype)
+    if values.dtype.kind == 'f' and not (values == np.floor(values)).all():
+        return False
+    return info.min <= values.min() and values.max() <= info.max
+
+def apply_schema(df, schema):
+    """
+    Приводит колонки к компактным типам схемы
+
+    Целочисленный тип применяется, только если колонка без NULL и значения
+    помещаются в него, иначе колонка остается в загруженном типе.
+    Отсутствующие в df колонки схемы пропускаются.
+
+    Args:
+        df (pd.DataFrame): Загруженные данные
+        schema (dict): Колонка -> тип ('int16', 'int32', 'category', ...)
+
+    Returns:
+        pd.DataFrame: df с приведенными колонками (тот же объект)
+    """
+    for column, dtype in schema.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if dtype == 'category':
+            df[column] = df[column].astype('category')
+        elif pd.api.types.is_numeric_dtype(df[column]) and _fits(df[column], dtype):
+            df[column] = df[column].astype(dtype)
+    return df
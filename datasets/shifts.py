@@ -1,43 +1,54 @@
 """
 Модуль для работы с данными о сменах
 """
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from datasets.dimensions import get_dimension_cache
+from datasets.profiling import profile_stage, profiled
+from datasets.queries import register_query
+from datasets.schema import TRACKING_POINTS_SCHEMA, apply_schema
+from datasets.track_store import STORED_TRACK_COLUMNS
+from db_connection import connection_config, get_db_connection
 
-def get_shifts_data(conn, start_date=None, end_date=None, device_id=None, min_speed=3, max_time_diff=300):
+# Число процессов для расчета треков по умолчанию (0 или 1 - последовательно)
+SHIFTS_WORKERS = int(os.getenv('SHIFTS_WORKERS', '0'))
+
+TRACK_COLUMNS = [
+    'track_id', 'device_id', 'track_start_time', 'track_end_time',
+    'track_duration', 'track_duration_seconds', 'avg_speed', 'max_speed',
+    'min_speed', 'latitude_start', 'longitude_start', 'altitude_start',
+    'latitude_end', 'longitude_end', 'altitude_end', 'points_in_track'
+]
+
+def _tracking_data_cte(device_filter=''):
     """
-    Получение и обработка данных о сменах
-    
-    Args:
-        conn: Соединение с БД
-        start_date (datetime): Начальная дата
-        end_date (datetime): Конечная дата
-        device_id (int): ID устройства
-        min_speed (int): Минимальная скорость для движения
-        max_time_diff (int): Максимальная разница во времени для нового трека
-        
-    Returns:
-        pd.DataFrame: Обработанные данные о сменах
+    CTE filtered_tracking_data: значимые точки за период [%(start_date)s, %(end_date)s)
     """
-    # Подготовка параметров запроса
-    if start_date is None:
-        start_date = datetime.now() - timedelta(days=1)
-    if end_date is None:
-        end_date = datetime.now()
-    
-    device_filter = f"AND t.device_id = {device_id}" if device_id else ""
-    
-    # SQL запрос для получения данных
-    query = f"""
+    return f"""
     WITH filtered_tracking_data AS (
         SELECT *
         FROM raw_telematics_data.tracking_data_core t
-        WHERE device_time < '{end_date}'::timestamp
-        AND device_time >= '{start_date}'::timestamp
+        WHERE device_time < %(end_date)s::timestamp
+        AND device_time >= %(start_date)s::timestamp
         {device_filter}
         AND t.event_id IN (2, 802, 803, 804, 811)  -- только значимые события
-    )
+    )"""
+
+# Фильтры по устройствам: текст запроса зависит только от вида фильтра,
+# значения передаются параметрами
+_DEVICE_FILTERS = {
+    '': '',
+    '_device': 'AND t.device_id = %(device_id)s::bigint',
+    '_devices': 'AND t.device_id = ANY(%(device_ids)s::bigint[])',
+    '_device_devices': 'AND t.device_id = %(device_id)s::bigint AND t.device_id = ANY(%(device_ids)s::bigint[])'
+}
+
+_SHIFTS_POINTS_SQL = """
     SELECT
         t.device_id,
         t.device_time,
@@ -49,16 +60,170 @@ def get_shifts_data(conn, start_date=None, end_date=None, device_id=None, min_sp
     FROM filtered_tracking_data t
     ORDER BY t.device_id, t.device_time;
     """
+
+# Повторяет _segment_points и _aggregate_tracks: LAG дает предыдущую точку
+# устройства, SUM() OVER - промежуточный track_id. Из БД возвращаются только
+# агрегаты по трекам.
+_TRACKS_SQL = """,
+    points AS (
+        SELECT
+            t.device_id,
+            t.device_time,
+            t.speed,
+            t.latitude,
+            t.longitude,
+            t.altitude,
+            LAG(t.device_time) OVER w AS prev_device_time,
+            LAG(t.speed) OVER w AS prev_speed
+        FROM filtered_tracking_data t
+        WINDOW w AS (PARTITION BY t.device_id ORDER BY t.device_time)
+    ),
+    flagged AS (
+        SELECT
+            p.*,
+            CASE
+                WHEN p.prev_device_time IS NULL THEN 1
+                WHEN EXTRACT(EPOCH FROM (p.device_time - p.prev_device_time)) > %(max_time_diff)s::numeric THEN 1
+                WHEN p.speed >= %(min_speed)s::numeric AND p.prev_speed < %(min_speed)s::numeric
+                    AND EXTRACT(EPOCH FROM (p.device_time - p.prev_device_time)) >= %(max_time_diff)s::numeric THEN 1
+                ELSE 0
+            END AS new_track_flag
+        FROM points p
+    ),
+    tracked AS (
+        SELECT
+            f.*,
+            SUM(f.new_track_flag) OVER (
+                PARTITION BY f.device_id ORDER BY f.device_time ROWS UNBOUNDED PRECEDING
+            ) AS temp_track_id
+        FROM flagged f
+    )
+    SELECT
+        device_id,
+        temp_track_id,
+        MIN(device_time) AS track_start_time,
+        (array_agg(latitude ORDER BY device_time) FILTER (WHERE latitude IS NOT NULL))[1] AS latitude_start,
+        (array_agg(longitude ORDER BY device_time) FILTER (WHERE longitude IS NOT NULL))[1] AS longitude_start,
+        (array_agg(altitude ORDER BY device_time) FILTER (WHERE altitude IS NOT NULL))[1] AS altitude_start,
+        MAX(device_time) AS track_end_time,
+        (array_agg(latitude ORDER BY device_time DESC) FILTER (WHERE latitude IS NOT NULL))[1] AS latitude_end,
+        (array_agg(longitude ORDER BY device_time DESC) FILTER (WHERE longitude IS NOT NULL))[1] AS longitude_end,
+        (array_agg(altitude ORDER BY device_time DESC) FILTER (WHERE altitude IS NOT NULL))[1] AS altitude_end,
+        COALESCE(SUM(speed), 0)::FLOAT AS speed_sum,
+        MAX(speed) AS max_speed,
+        MIN(speed) AS min_speed,
+        COUNT(speed) AS points_in_track
+    FROM tracked
+    GROUP BY device_id, temp_track_id
+    ORDER BY device_id, temp_track_id;
+    """
+
+SHIFTS_POINTS_QUERIES = {
+    suffix: register_query(f'shifts_points{suffix}', _tracking_data_cte(device_filter) + _SHIFTS_POINTS_SQL, TRACKING_POINTS_SCHEMA)
+    for suffix, device_filter in _DEVICE_FILTERS.items()
+}
+SHIFTS_TRACKS_QUERIES = {
+    suffix: register_query(f'shifts_tracks{suffix}', _tracking_data_cte(device_filter) + _TRACKS_SQL)
+    for suffix, device_filter in _DEVICE_FILTERS.items()
+}
+DEVICE_POINT_COUNTS = register_query('shifts_device_point_counts', _tracking_data_cte() + """
+    SELECT t.device_id, count(*) AS points
+    FROM filtered_tracking_data t
+    GROUP BY t.device_id;
+    """)
+# Текущее время БД: до него хранилище треков размечает точки
+DB_CLOCK = register_query('db_clock', 'SELECT LOCALTIMESTAMP AS db_now')
+SHIFTS_TAIL = register_query('shifts_tail', """
+    WITH watermarks AS (
+        SELECT *
+        FROM unnest(%(device_ids)s::bigint[], %(open_since)s::timestamp[]) AS w(device_id, open_since)
+    )
+    SELECT
+        t.device_id,
+        t.device_time,
+        t.speed,
+        t.latitude,
+        t.longitude,
+        t.altitude,
+        t.event_id
+    FROM raw_telematics_data.tracking_data_core t
+    LEFT JOIN watermarks w ON w.device_id = t.device_id
+    WHERE t.device_time >= COALESCE(w.open_since, %(coverage_start)s::timestamp)
+    AND t.device_time < %(horizon)s::timestamp
+    AND t.event_id IN (2, 802, 803, 804, 811)  -- только значимые события
+    ORDER BY t.device_id, t.device_time;
+    """, TRACKING_POINTS_SCHEMA)
+# Точки отдельных треков хранилища внутри запрошенного диапазона (для обрезки
+# треков по его границам); temp_track_id - номер трека в списке
+SHIFTS_TRACK_POINTS = register_query('shifts_track_points', """
+    WITH windows AS (
+        SELECT *
+        FROM unnest(%(device_ids)s::bigint[], %(since)s::timestamp[], %(until)s::timestamp[])
+            WITH ORDINALITY AS w(device_id, since, until, temp_track_id)
+    )
+    SELECT
+        w.temp_track_id,
+        t.device_id,
+        t.device_time,
+        t.speed,
+        t.latitude,
+        t.longitude,
+        t.altitude,
+        t.event_id
+    FROM windows w
+    JOIN raw_telematics_data.tracking_data_core t ON t.device_id = w.device_id
+    WHERE t.device_time >= w.since AND t.device_time <= w.until
+    AND t.device_time >= %(start_date)s::timestamp
+    AND t.device_time < %(end_date)s::timestamp
+    AND t.event_id IN (2, 802, 803, 804, 811)  -- только значимые события
+    ORDER BY w.temp_track_id, t.device_time;
+    """, TRACKING_POINTS_SCHEMA)
+
+def _query_params(start_date, end_date, device_id=None, device_ids=None):
+    """
+    Выбирает вариант фильтра по устройствам и значения параметров запроса
+
+    Returns:
+        tuple: (суффикс варианта запроса, параметры)
+    """
+    # Подготовка параметров запроса
+    if start_date is None:
+        start_date = datetime.now() - timedelta(days=1)
+    if end_date is None:
+        end_date = datetime.now()
     
-    # Получаем данные из БД
-    df = pd.read_sql(query, conn)
+    params = {'start_date': start_date, 'end_date': end_date}
+    suffix = ''
+    if device_id:
+        suffix += '_device'
+        params['device_id'] = int(device_id)
+    if device_ids is not None:
+        suffix += '_devices'
+        params['device_ids'] = [int(d) for d in device_ids]
+    return suffix, params
+
+@profiled('shifts.segment')
+def _segment_points(df, min_speed, max_time_diff, prev_point=None):
+    """
+    Размечает точки на треки (temp_track_id внутри каждого device_id)
     
+    Args:
+        df (pd.DataFrame): Точки, упорядоченные по device_id, device_time
+        min_speed (int): Минимальная скорость для движения
+        max_time_diff (int): Максимальная разница во времени для нового трека
+        prev_point (pd.Series): Последняя точка предыдущей порции при потоковой
+            обработке; первые точки того же устройства получают temp_track_id 0,
+            если продолжают открытый трек
+    """
     # Конвертируем timestamp в datetime
     df['device_time'] = pd.to_datetime(df['device_time'])
     
     # Добавляем предыдущие значения
     df['prev_device_time'] = df.groupby('device_id')['device_time'].shift(1)
     df['prev_speed'] = df.groupby('device_id')['speed'].shift(1)
+    if prev_point is not None and len(df) and df['device_id'].iat[0] == prev_point['device_id']:
+        df.loc[df.index[0], 'prev_device_time'] = prev_point['device_time']
+        df.loc[df.index[0], 'prev_speed'] = prev_point['speed']
     
     # Вычисляем разницу во времени
     df['time_diff'] = (df['device_time'] - df['prev_device_time']).dt.total_seconds()
@@ -84,51 +249,66 @@ def get_shifts_data(conn, start_date=None, end_date=None, device_id=None, min_sp
     
     # Назначаем промежуточный track_id
     df['temp_track_id'] = df.groupby('device_id')['new_track_flag'].cumsum()
+    return df
+
+@profiled('shifts.groupby')
+def _aggregate_tracks(df):
+    """
+    Агрегаты по трекам: начальные и конечные точки, сумма и статистики скорости
+    """
+    return df.groupby(['device_id', 'temp_track_id']).agg(
+        track_start_time=('device_time', 'min'),
+        latitude_start=('latitude', 'first'),
+        longitude_start=('longitude', 'first'),
+        altitude_start=('altitude', 'first'),
+        track_end_time=('device_time', 'max'),
+        latitude_end=('latitude', 'last'),
+        longitude_end=('longitude', 'last'),
+        altitude_end=('altitude', 'last'),
+        speed_sum=('speed', 'sum'),
+        max_speed=('speed', 'max'),
+        min_speed=('speed', 'min'),
+        points_in_track=('speed', 'count')
+    ).reset_index()
+
+def _merge_open_track(open_track, continuation):
+    """
+    Объединяет незакрытый трек предыдущей порции с его продолжением
+
+    Args:
+        open_track (pd.DataFrame): Одна строка агрегатов открытого трека
+        continuation (pd.DataFrame): Одна строка агрегатов продолжения
+    """
+    merged = open_track.copy()
+    before = open_track.iloc[0]
+    after = continuation.iloc[0]
+    for col in ['latitude_start', 'longitude_start', 'altitude_start']:
+        if pd.isna(before[col]):
+            merged[col] = after[col]
+    for col in ['track_end_time', 'latitude_end', 'longitude_end', 'altitude_end']:
+        if not pd.isna(after[col]):
+            merged[col] = after[col]
+    merged['speed_sum'] = before['speed_sum'] + after['speed_sum']
+    merged['points_in_track'] = before['points_in_track'] + after['points_in_track']
+    merged['max_speed'] = np.fmax(before['max_speed'], after['max_speed'])
+    merged['min_speed'] = np.fmin(before['min_speed'], after['min_speed'])
+    return merged
+
+@profiled('shifts.finalize')
+def _finalize_tracks(tracks, min_speed, number_offsets=None):
+    """
+    Фильтрует фейковые треки, нормализует единицы и нумерует треки
     
-    # Получаем начальные и конечные координаты для каждого трека
-    track_start = df.groupby(['device_id', 'temp_track_id']).agg({
-        'device_time': 'min',
-        'latitude': 'first',
-        'longitude': 'first',
-        'altitude': 'first'
-    }).reset_index()
-    
-    track_end = df.groupby(['device_id', 'temp_track_id']).agg({
-        'device_time': 'max',
-        'latitude': 'last',
-        'longitude': 'last',
-        'altitude': 'last'
-    }).reset_index()
-    
-    # Объединяем начальные и конечные точки
-    tracks = pd.merge(
-        track_start,
-        track_end,
-        on=['device_id', 'temp_track_id'],
-        suffixes=('_start', '_end')
-    )
-    
-    # Вычисляем статистики по трекам
-    track_stats = df.groupby(['device_id', 'temp_track_id']).agg({
-        'speed': ['mean', 'max', 'min', 'count']
-    }).reset_index()
-    
-    track_stats.columns = ['device_id', 'temp_track_id', 'avg_speed', 'max_speed', 'min_speed', 'points_in_track']
-    
-    # Объединяем все данные
-    final_tracks = pd.merge(tracks, track_stats, on=['device_id', 'temp_track_id'])
-    
-    # Явно переименовываю device_time_start/device_time_end
-    final_tracks = final_tracks.rename(columns={
-        'device_time_start': 'track_start_time',
-        'device_time_end': 'track_end_time'
-    })
+    Args:
+        tracks (pd.DataFrame): Результат _aggregate_tracks
+        min_speed (int): Минимальная скорость для движения
+        number_offsets (dict): Число уже пронумерованных треков по device_id
+    """
+    final_tracks = tracks.copy()
+    final_tracks['avg_speed'] = final_tracks['speed_sum'] / final_tracks['points_in_track']
     
     # Вычисляем длительность трека
     final_tracks['track_duration_seconds'] = (final_tracks['track_end_time'] - final_tracks['track_start_time']).dt.total_seconds()
-    final_tracks['track_duration'] = final_tracks['track_duration_seconds'].apply(
-        lambda x: str(timedelta(seconds=int(x)))
-    )
     
     # Фильтруем фейковые треки
     final_tracks = final_tracks[
@@ -145,36 +325,471 @@ def get_shifts_data(conn, start_date=None, end_date=None, device_id=None, min_sp
     for col in ['avg_speed', 'max_speed', 'min_speed']:
         final_tracks[col] = final_tracks[col] / 1e2
     
+    return _label_tracks(final_tracks, number_offsets)
+
+# Части строки длительности по значению (часы внутри суток, минуты, секунды)
+_HOUR_PARTS = np.array([f'{hour}:' for hour in range(24)], dtype=object)
+_MINUTE_PARTS = np.array([f'{value:02d}' for value in range(60)], dtype=object)
+
+def format_duration(seconds):
+    """
+    Длительность строкой в формате str(timedelta): 'H:MM:SS' или 'N day(s), H:MM:SS'
+
+    Args:
+        seconds (pd.Series): Длительность в секундах (дробная часть отбрасывается)
+
+    Returns:
+        pd.Series: Строки с тем же индексом
+    """
+    days, rest = np.divmod(seconds.to_numpy(dtype='int64'), 86400)
+    text = _HOUR_PARTS[rest // 3600] + _MINUTE_PARTS[rest % 3600 // 60] + ':' + _MINUTE_PARTS[rest % 60]
+    # Многодневные длительности редки: префикс только для них
+    multi_day = days > 0
+    if multi_day.any():
+        prefix = np.array([f'{day} day, ' if day == 1 else f'{day} days, ' for day in days[multi_day]], dtype=object)
+        text[multi_day] = prefix + text[multi_day]
+    return pd.Series(text, index=seconds.index)
+
+def _label_tracks(final_tracks, number_offsets=None):
+    """
+    Добавляет длительность строкой, номер и track_id, выбирает итоговые колонки
+    
+    Args:
+        final_tracks (pd.DataFrame): Треки, упорядоченные по device_id и времени начала
+        number_offsets (dict): Число уже пронумерованных треков по device_id
+    """
+    final_tracks = final_tracks.copy()
+    final_tracks['track_duration'] = format_duration(final_tracks['track_duration_seconds'])
+    
     # Добавляем финальный номер трека
     final_tracks['track_number'] = final_tracks.groupby('device_id').cumcount() + 1
+    if number_offsets:
+        final_tracks['track_number'] += final_tracks['device_id'].map(number_offsets).fillna(0).astype(int)
     final_tracks['track_id'] = final_tracks['device_id'].astype(str) + '-' + final_tracks['track_number'].astype(str)
     
     # Выбираем и переименовываем нужные колонки
-    result = final_tracks[[
-        'track_id', 'device_id', 'track_start_time', 'track_end_time',
-        'track_duration', 'track_duration_seconds', 'avg_speed', 'max_speed',
-        'min_speed', 'latitude_start', 'longitude_start', 'altitude_start',
-        'latitude_end', 'longitude_end', 'altitude_end', 'points_in_track'
-    ]]
+    return final_tracks[TRACK_COLUMNS]
+
+def _segment_tail(conn, coverage_start, watermarks, min_speed, max_time_diff):
+    """
+    Размечает точки после водяных знаков хранилища треков до текущего времени БД
+    
+    Для устройств с водяным знаком точки читаются с начала их открытого трека,
+    для остальных - с начала покрытия хранилища. Последний трек каждого
+    устройства считается открытым. Конец запрошенного диапазона не
+    ограничивает чтение, поэтому закрытые треки всегда целые.
+    
+    Returns:
+        tuple: (закрытые треки, открытые треки, начало открытого трека по
+            device_id, время БД, до которого прочитаны точки)
+    """
+    horizon = pd.Timestamp(DB_CLOCK.execute(conn)['db_now'].iat[0])
+    df = SHIFTS_TAIL.execute_bulk(conn, {
+        'device_ids': [int(device_id) for device_id in watermarks['device_id']],
+        'open_since': [since.to_pydatetime() for since in watermarks['open_since']],
+        'coverage_start': coverage_start.to_pydatetime(),
+        'horizon': horizon.to_pydatetime()
+    })
+    tracks = _aggregate_tracks(_segment_points(df, min_speed, max_time_diff))
+    is_open = tracks['temp_track_id'] == tracks.groupby('device_id')['temp_track_id'].transform('max')
+    open_since = tracks[is_open].set_index('device_id')['track_start_time']
+    closed = _finalize_tracks(tracks[~is_open], min_speed)
+    open_tracks = _finalize_tracks(tracks[is_open], min_speed)
+    return closed, open_tracks, open_since, horizon
+
+def _clipped_tracks(conn, tracks, start, end, min_speed):
+    """
+    Пересчитывает треки хранилища по их точкам внутри [start, end)
+
+    Без хранилища первая точка диапазона начинает новый трек, а внутри трека
+    новые треки не начинаются, поэтому часть трека в диапазоне - это ровно
+    один трек разметки точек только этого диапазона. Слишком короткие или
+    медленные после обрезки треки отбрасываются, как при разметке.
+
+    Args:
+        tracks (pd.DataFrame): Треки в колонках STORED_TRACK_COLUMNS
+    """
+    points = SHIFTS_TRACK_POINTS.execute(conn, {
+        'device_ids': [int(device_id) for device_id in tracks['device_id']],
+        'since': [moment.to_pydatetime() for moment in tracks['track_start_time']],
+        'until': [moment.to_pydatetime() for moment in tracks['track_end_time']],
+        'start_date': start.to_pydatetime(),
+        'end_date': end.to_pydatetime()
+    })
+    return _finalize_tracks(_aggregate_tracks(points), min_speed)[STORED_TRACK_COLUMNS]
+
+def _clip_tracks(conn, tracks, start, end, min_speed):
+    """
+    Обрезает треки хранилища по границам [start, end) (см. _clipped_tracks)
+
+    Returns:
+        tuple: (треки, отсортированные по device_id и track_start_time,
+            обрезанные треки)
+    """
+    crossing = (tracks['track_start_time'] < start) | (tracks['track_end_time'] >= end)
+    if not crossing.any():
+        return tracks, tracks.iloc[:0]
+    clipped = _clipped_tracks(conn, tracks[crossing], start, end, min_speed)
+    result = pd.concat([tracks[~crossing], clipped], ignore_index=True)
+    return result.sort_values(['device_id', 'track_start_time'], kind='stable').reset_index(drop=True), clipped
+
+def _stored_tracks(conn, store, start, end, min_speed, max_time_diff, load_from=None):
+    """
+    Треки хранилища, пересекающиеся с [start, end), с дозаписью хвоста из БД
+
+    Returns:
+        tuple: (треки целиком, время БД, до которого они размечены)
+    """
+    return store.get_tracks(
+        conn, start, end, min_speed, max_time_diff,
+        partial(_segment_tail, min_speed=min_speed, max_time_diff=max_time_diff),
+        load_from
+    )
+
+def iter_shifts_data(conn, start_date=None, end_date=None, device_id=None, min_speed=3, max_time_diff=300, chunk_size=50000, device_ids=None):
+    """
+    Потоковая разметка треков с ограниченным потреблением памяти
+    
+    Точки читаются серверным (именованным) курсором порциями по chunk_size
+    строк в порядке (device_id, device_time). Между порциями хранится только
+    последняя точка и агрегаты открытого трека, поэтому пиковая память
+    зависит от размера порции, а не от диапазона дат.
+    
+    Yields:
+        pd.DataFrame: Закрытые треки в формате get_shifts_data
+    """
+    suffix, params = _query_params(start_date, end_date, device_id, device_ids)
+    query = SHIFTS_POINTS_QUERIES[suffix]
+    prev_point = None
+    open_track = None
+    # Сколько треков последнего устройства уже отдано (для нумерации)
+    number_offsets = {}
+    
+    def finalize(tracks):
+        nonlocal number_offsets
+        result = _finalize_tracks(tracks, min_speed, number_offsets)
+        if not result.empty:
+            last_device = result['device_id'].iat[-1]
+            number_offsets = {last_device: number_offsets.get(last_device, 0) + int((result['device_id'] == last_device).sum())}
+        return result
+    
+    with conn.cursor(name='shifts_stream', withhold=conn.autocommit) as cursor:
+        cursor.itersize = chunk_size
+        # DECLARE не принимает EXECUTE, поэтому серверный курсор открывается
+        # по тексту запроса с параметрами
+        cursor.execute(query.sql, params)
+        while True:
+            with profile_stage('sql.shifts_stream') as stage:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                chunk = pd.DataFrame.from_records(rows, columns=[col[0] for col in cursor.description], coerce_float=True)
+                chunk = stage.record(apply_schema(chunk, query.schema))
+            chunk = _segment_points(chunk, min_speed, max_time_diff, prev_point)
+            prev_point = chunk[['device_id', 'device_time', 'speed']].iloc[-1]
+            tracks = _aggregate_tracks(chunk)
+            del chunk
+            
+            if open_track is not None:
+                first = tracks.iloc[0]
+                if first['device_id'] == open_track['device_id'].iat[0] and first['temp_track_id'] == 0:
+                    tracks = pd.concat([_merge_open_track(open_track, tracks.iloc[[0]]), tracks.iloc[1:]], ignore_index=True)
+                else:
+                    tracks = pd.concat([open_track, tracks], ignore_index=True)
+            
+            # Последний трек может продолжиться в следующей порции
+            open_track = tracks.iloc[[-1]]
+            closed = finalize(tracks.iloc[:-1])
+            if not closed.empty:
+                yield closed
+    
+    if open_track is not None:
+        closed = finalize(open_track)
+        if not closed.empty:
+            yield closed
+
+def get_shifts_data(conn, start_date=None, end_date=None, device_id=None, min_speed=3, max_time_diff=300, chunk_size=None, device_ids=None, store=None, backend='pandas', workers=None):
+    """
+    Получение и обработка данных о сменах
+    
+    Args:
+        conn: Соединение с БД
+        start_date (datetime): Начальная дата
+        end_date (datetime): Конечная дата
+        device_id (int): ID устройства
+        min_speed (int): Минимальная скорость для движения
+        max_time_diff (int): Максимальная разница во времени для нового трека
+        chunk_size (int): Если задан, точки читаются потоково порциями (см. iter_shifts_data)
+        device_ids (list): Ограничить расчет списком устройств
+        store (TrackStore): Хранилище закрытых треков; если задано, из БД
+            размечаются только точки с начала открытого трека каждого
+            устройства, а треки, пересекающие границы [start_date, end_date),
+            обрезаются по ним (результат совпадает с расчетом без хранилища)
+        backend (str): 'pandas' - разметка точек в pandas, 'sql' - разметка
+            оконными функциями в БД с передачей только агрегатов по трекам
+        workers (int): Число процессов для backend='pandas' без store и
+            chunk_size (по умолчанию SHIFTS_WORKERS); больше одного - расчет
+            по шардам устройств (см. get_shifts_data_parallel), conn должно
+            быть выдано get_db_connection
+        
+    Returns:
+        pd.DataFrame: Обработанные данные о сменах
+    """
+    if store is not None:
+        start = pd.Timestamp(start_date if start_date is not None else datetime.now() - timedelta(days=1))
+        end = pd.Timestamp(end_date if end_date is not None else datetime.now())
+        tracks = _stored_tracks(conn, store, start, end, min_speed, max_time_diff)[0]
+        if device_id:
+            tracks = tracks[tracks['device_id'] == device_id]
+        if device_ids is not None:
+            tracks = tracks[tracks['device_id'].isin(device_ids)]
+        return _label_tracks(_clip_tracks(conn, tracks, start, end, min_speed)[0])
+    
+    if backend == 'sql':
+        suffix, params = _query_params(start_date, end_date, device_id, device_ids)
+        tracks = SHIFTS_TRACKS_QUERIES[suffix].execute(conn, {**params, 'min_speed': min_speed, 'max_time_diff': max_time_diff})
+        return _finalize_tracks(tracks, min_speed).reset_index(drop=True)
+    if backend != 'pandas':
+        raise ValueError(f"Неизвестный backend: {backend}")
+    
+    if chunk_size:
+        chunks = list(iter_shifts_data(conn, start_date, end_date, device_id, min_speed, max_time_diff, chunk_size, device_ids))
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=TRACK_COLUMNS)
+    
+    workers = SHIFTS_WORKERS if workers is None else workers
+    if workers > 1:
+        config = connection_config(conn)
+        if config is None:
+            raise ValueError("Параллельный расчет треков требует соединение из get_db_connection")
+        return get_shifts_data_parallel(config, start_date, end_date, device_id, min_speed, max_time_diff, workers, device_ids)
+    
+    # Получаем данные из БД
+    suffix, params = _query_params(start_date, end_date, device_id, device_ids)
+    df = SHIFTS_POINTS_QUERIES[suffix].execute_bulk(conn, params)
+    df = _segment_points(df, min_speed, max_time_diff)
+    return _finalize_tracks(_aggregate_tracks(df), min_speed).reset_index(drop=True)
+
+def _device_point_counts(conn, start_date, end_date):
+    """
+    Число точек по устройствам за период (для балансировки шардов)
+    """
+    return DEVICE_POINT_COUNTS.execute(conn, _query_params(start_date, end_date)[1])
+
+def _shard_devices(counts, shards):
+    """
+    Раскладывает устройства по шардам с примерно равным числом точек
+    (самые нагруженные устройства первыми в наименее загруженный шард)
+    """
+    loads = [0] * shards
+    device_shards = [[] for _ in range(shards)]
+    for row in counts.sort_values('points', ascending=False).itertuples():
+        target = loads.index(min(loads))
+        device_shards[target].append(row.device_id)
+        loads[target] += row.points
+    return [sorted(ids) for ids in device_shards if ids]
+
+def _shifts_shard(config, start_date, end_date, device_ids, min_speed, max_time_diff):
+    """
+    Расчет треков одного шарда в отдельном процессе со своим пулом соединений
+    """
+    with get_db_connection(config) as conn:
+        return get_shifts_data(conn, start_date, end_date, min_speed=min_speed, max_time_diff=max_time_diff, device_ids=device_ids, workers=1)
+
+def get_shifts_data_parallel(config=None, start_date=None, end_date=None, device_id=None, min_speed=3, max_time_diff=300, workers=None, device_ids=None):
+    """
+    Расчет треков параллельно по шардам устройств в пуле процессов
+    
+    Треки каждого устройства независимы, поэтому устройства раскладываются по
+    шардам, каждый шард читается и размечается в своем процессе, результаты
+    объединяются в порядке (device_id, track_start_time). Результат совпадает
+    с последовательным get_shifts_data. Процессы запускаются через spawn:
+    пулы соединений родителя в них не наследуются.
     
-    return result 
+    Args:
+        config (dict): Параметры подключения (по умолчанию DB_CONFIG)
+        start_date (datetime): Начальная дата
+        end_date (datetime): Конечная дата
+        device_id (int): ID устройства
+        min_speed (int): Минимальная скорость для движения
+        max_time_diff (int): Максимальная разница во времени для нового трека
+        workers (int): Число процессов (по умолчанию SHIFTS_WORKERS или число ядер)
+        device_ids (list): Ограничить расчет списком устройств
+        
+    Returns:
+        pd.DataFrame: Данные о треках в формате get_shifts_data
+    """
+    if start_date is None:
+        start_date = datetime.now() - timedelta(days=1)
+    if end_date is None:
+        end_date = datetime.now()
+    workers = workers or SHIFTS_WORKERS or os.cpu_count() or 1
+    
+    with get_db_connection(config) as conn:
+        counts = _device_point_counts(conn, start_date, end_date)
+        if device_id:
+            counts = counts[counts['device_id'] == int(device_id)]
+        if device_ids is not None:
+            counts = counts[counts['device_id'].isin([int(d) for d in device_ids])]
+        shards = _shard_devices(counts, workers)
+        if len(shards) < 2:
+            # Одному шарду отдельный процесс не нужен
+            return get_shifts_data(conn, start_date, end_date, device_id, min_speed, max_time_diff, device_ids=device_ids, workers=1)
+    
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=context) as executor:
+        results = list(executor.map(
+            _shifts_shard,
+            *zip(*[(config, start_date, end_date, ids, min_speed, max_time_diff) for ids in shards])
+        ))
+    result = pd.concat(results, ignore_index=True)
+    return result.sort_values(['device_id', 'track_start_time'], kind='stable').reset_index(drop=True)
 
-def get_shifts_summary(conn, start_date=None, end_date=None, device_id=None, min_speed=3, max_time_diff=300):
+def get_shifts_summary(conn, start_date=None, end_date=None, device_id=None, min_speed=3, max_time_diff=300, chunk_size=None, store=None, summary_store=None, workers=None):
     """
     Возвращает сводную таблицу по сменам для дашборда (по аналогии с Superset)
+
+    Args:
+        workers (int): Число процессов для расчета треков без хранилища (см. get_shifts_data)
+        summary_store (ShiftSummaryStore): Хранилище сводок по дням; если
+            задано (вместе с store), закрытые полные дни диапазона берутся из
+            него, а пересчитываются только дни начиная с первого несохраненного
+
+    Returns:
+        pd.DataFrame: Сводка по device_id и date; activity - суммарная
+            длительность треков строкой в формате str(timedelta)
+    """
+    if summary_store is None:
+        df = get_shifts_data(conn, start_date, end_date, device_id, min_speed, max_time_diff, chunk_size, store=store, workers=workers)
+        # object_label из общего кэша справочников
+        return _summarize_tracks(df, get_dimension_cache().objects(conn))
+    if store is None:
+        raise ValueError("Хранилище сводок по дням требует хранилище треков (store)")
+
+    start = pd.Timestamp(start_date if start_date is not None else datetime.now() - timedelta(days=1))
+    end = pd.Timestamp(end_date if end_date is not None else datetime.now())
+    # Полные дни диапазона
+    days = pd.date_range(start.ceil('D'), end.floor('D') - timedelta(days=1), freq='D')
+
+    def closed(horizon):
+        # Дни, закончившиеся до границы опоздавших данных по времени БД
+        if horizon is None:
+            return []
+        return list(days[days + timedelta(days=1) <= horizon - timedelta(hours=summary_store.late_hours)])
+
+    # Сохраненные сводки берутся только за дни, закрытые на момент прошлой
+    # разметки хранилища треков; запрос раньше начала покрытия перестроит
+    # хранилище треков, и сохраненные сводки не используются
+    coverage_start = store.coverage_start(min_speed, max_time_diff)
+    rebuild = coverage_start is None or start < coverage_start
+    closed_days = [] if rebuild else closed(store.horizon(min_speed, max_time_diff))
+    cached, cached_days = summary_store.load(min_speed, max_time_diff, closed_days, coverage_start)
+
+    # Сохраненные дни в начале диапазона берутся как есть, остальное
+    # пересчитывается по трекам хранилища
+    recompute_start = start
+    for day in closed_days:
+        if day != recompute_start or day not in cached_days:
+            break
+        recompute_start = day + timedelta(days=1)
+    full, horizon = _stored_tracks(conn, store, start, end, min_speed, max_time_diff, recompute_start)
+    # В сохраненной сводке дня трек учтен целиком (хранилище отдает треки
+    # целиком): дни, в которых начинаются треки, пересекающие конец
+    # диапазона, пересчитываются
+    cut_days = set(full.loc[full['track_end_time'] >= end, 'track_start_time'].dt.normalize())
+    if cut_days and min(cut_days) < recompute_start:
+        recompute_start = max(start, min(cut_days))
+        full, horizon = _stored_tracks(conn, store, start, end, min_speed, max_time_diff, recompute_start)
+        cut_days = set(full.loc[full['track_end_time'] >= end, 'track_start_time'].dt.normalize())
+    tracks, clipped = _clip_tracks(conn, full, start, end, min_speed)
+
+    # До recompute_start остаются только треки, обрезанные началом диапазона:
+    # они дополняют сохраненные дни
+    early = tracks['track_start_time'] < recompute_start
+    parts = [_merge_daily(cached[pd.to_datetime(cached['date']) < recompute_start], _daily_summary(tracks[early]))]
+    if recompute_start < end:
+        fresh_tracks = tracks[~early]
+        fresh = _daily_summary(fresh_tracks)
+        # День сохраняется, только если он закрыт по времени БД этой разметки,
+        # все его треки закончились раньше, чем их может продолжить опоздавшая
+        # точка, и ни один не пересекает границы диапазона
+        cutoff = horizon - timedelta(hours=summary_store.late_hours, seconds=max_time_diff)
+        unfinished = set(fresh_tracks.loc[fresh_tracks['track_end_time'] >= cutoff, 'track_start_time'].dt.normalize())
+        unfinished |= cut_days | set(clipped['track_start_time'].dt.normalize())
+        save_days = [day for day in closed(horizon) if day >= recompute_start and day not in unfinished]
+        if save_days:
+            summary_store.save(
+                min_speed, max_time_diff, fresh[pd.to_datetime(fresh['date']).isin(save_days)],
+                save_days, store.coverage_start(min_speed, max_time_diff)
+            )
+        parts.append(fresh)
+
+    summary = pd.concat([part for part in parts if not part.empty] or parts[-1:], ignore_index=True)
+    if device_id:
+        summary = summary[summary['device_id'] == device_id]
+    summary = summary.sort_values(['device_id', 'date'], kind='stable').reset_index(drop=True)
+    return _public_summary(summary, get_dimension_cache().objects(conn))
+
+def _merge_daily(summary, extra):
+    """
+    Объединяет сводки с одинаковыми (device_id, date): средняя скорость
+    взвешивается по числу треков
+
+    Args:
+        summary (pd.DataFrame): Сводка в колонках _daily_summary
+        extra (pd.DataFrame): Дополнительные строки в тех же колонках
+    """
+    if extra.empty:
+        return summary
+    df = pd.concat([part for part in (summary, extra) if not part.empty], ignore_index=True)
+    df['speed_total'] = df['average_speed'] * df['track_count']
+    merged = df.groupby(['device_id', 'date'], sort=False).agg(
+        activity_seconds=('activity_seconds', 'sum'),
+        speed_total=('speed_total', 'sum'),
+        track_count=('track_count', 'sum'),
+        max_speed=('max_speed', 'max'),
+        activity_start=('activity_start', 'min'),
+        activity_end=('activity_end', 'max')
+    ).reset_index()
+    merged['average_speed'] = merged['speed_total'] / merged['track_count']
+    return merged[extra.columns]
+
+@profiled('shifts.summary')
+def _daily_summary(df):
+    """
+    Сводка треков по устройству и дате начала трека
+
+    Args:
+        df (pd.DataFrame): Треки в формате get_shifts_data
     """
-    df = get_shifts_data(conn, start_date, end_date, device_id, min_speed, max_time_diff)
-    # Получаем object_label (можно джойнить к объектам, если нужно)
-    # Для примера: пусть object_label = device_id (или добавить join при необходимости)
-    df['date'] = df['track_start_time'].dt.date
     # Группировка по объекту и дате
-    summary = df.groupby(['device_id', 'date']).agg(
-        activity=('track_duration_seconds', lambda x: str(timedelta(seconds=int(x.sum())))),
+    return df.assign(date=df['track_start_time'].dt.date).groupby(['device_id', 'date']).agg(
+        activity_seconds=('track_duration_seconds', 'sum'),
+        track_count=('track_duration_seconds', 'size'),
         average_speed=('avg_speed', 'mean'),
         max_speed=('max_speed', 'max'),
         activity_start=('track_start_time', 'min'),
         activity_end=('track_end_time', 'max')
     ).reset_index()
-    # Пример для object_label (если есть join с объектами)
-    # summary = summary.merge(...)
-    return summary 
\ No newline at end of file
+
+def _summarize_tracks(df, objects):
+    """
+    Сводка треков по устройству и дате с подписями объектов
+
+    Args:
+        df (pd.DataFrame): Треки в формате get_shifts_data
+        objects (pd.DataFrame): object_label с индексом по device_id
+    """
+    return _public_summary(_daily_summary(df), objects)
+
+def _public_summary(summary, objects):
+    """
+    Сводка в формате get_shifts_summary: длительность строкой (activity) на
+    месте activity_seconds, без track_count, с подписями объектов
+
+    Args:
+        summary (pd.DataFrame): Сводка в колонках _daily_summary
+        objects (pd.DataFrame): object_label с индексом по device_id
+    """
+    summary = summary.drop(columns='track_count')
+    summary.insert(summary.columns.get_loc('activity_seconds'), 'activity', format_duration(summary['activity_seconds']))
+    return summary.drop(columns='activity_seconds').join(objects, on='device_id')
@@ -0,0 +1,240 @@
+"""
+Снимок текущего статуса парка для дашборда мониторинга движения
+"""
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from datasets.dimensions import get_dimension_cache
+from datasets.profiling import profiled
+from datasets.queries import CURRENT_STATUS
+
+DEFAULT_STATUS_PARAMS = {
+    'max_idle_speed': 2,
+    'min_idle_detection': 3,
+    'gps_not_updated_min': 5,
+    'gps_not_updated_max': 10
+}
+
+@profiled('status.classify')
+def classify_status(frame, params=None):
+    """
+    Вычисляет статусы движения и подключения по порогам параметров управления
+
+    Повторяет прежние CASE из SQL: moving при скорости выше max_idle_speed,
+    иначе stopped, если последняя точка моложе min_idle_detection минут,
+    иначе parked; active/idle/offline по возрасту последней точки
+    относительно gps_not_updated_min и gps_not_updated_max.
+
+    Args:
+        frame (pd.DataFrame): Последние точки устройств (колонки speed и
+            last_connect - возраст точки в секундах на момент загрузки)
+        params (dict): Параметры управления (по умолчанию DEFAULT_STATUS_PARAMS)
+
+    Returns:
+        pd.DataFrame: Копия frame с колонками moving_status и connection_status
+    """
+    params = {**DEFAULT_STATUS_PARAMS, **(params or {})}
+    speed = frame['speed'].to_numpy(dtype=float)
+    age_minutes = frame['last_connect'].to_numpy(dtype=float) / 60
+
+    moving_status = np.select(
+        [speed > params['max_idle_speed'], age_minutes < params['min_idle_detection']],
+        ['moving', 'stopped'],
+        default='parked'
+    )
+    connection_status = np.select(
+        [age_minutes <= params['gps_not_updated_min'], age_minutes <= params['gps_not_updated_max']],
+        ['active', 'idle'],
+        default='offline'
+    )
+    return frame.assign(moving_status=moving_status, connection_status=connection_status)
+
+@profiled('status.geozones')
+def assign_geozones(conn, frame, dims=None):
+    """
+    Добавляет колонку geozones по координатам latitude/longitude (в градусах)
+    через индекс геозон из кэша справочников, без PostGIS
+
+    Args:
+        dims (DimensionCache): Кэш справочников (по умолчанию общий для процесса)
+    """
+    if dims is None:
+        dims = get_dimension_cache()
+    labels = dims.geozones(conn).assign(frame['latitude'], frame['longitude'])
+    return frame.assign(geozones=labels)
+
+# Колонки, изменение которых считается изменением статуса устройства
+STATUS_DIFF_COLUMNS = ['device_time', 'speed', 'moving_status', 'connection_status', 'geozones']
+
+class StatusDiff:
+    """
+    Разница двух классифицированных снимков по device_id
+    """
+
+    def __init__(self, new, changed, gone):
+        """
+        Args:
+            new (pd.DataFrame): Появившиеся устройства (строки текущего снимка)
+            changed (pd.DataFrame): Изменившиеся устройства (строки текущего снимка)
+            gone (pd.DataFrame): Пропавшие устройства (строки предыдущего снимка)
+        """
+        self.new = new
+        self.changed = changed
+        self.gone = gone
+
+    def __len__(self):
+        return len(self.new) + len(self.changed) + len(self.gone)
+
+    def to_frame(self):
+        """
+        Все изменения одной таблицей с колонкой change (new, changed, gone)
+        """
+        return pd.concat([
+            self.new.assign(change='new'),
+            self.changed.assign(change='changed'),
+            self.gone.assign(change='gone')
+        ], ignore_index=True)
+
+def diff_snapshots(previous, current, columns=STATUS_DIFF_COLUMNS):
+    """
+    Сравнивает классифицированные снимки статуса по device_id
+
+    Args:
+        previous (pd.DataFrame): Предыдущий снимок (None - все устройства новые)
+        current (pd.DataFrame): Текущий снимок
+        columns (list): Сравниваемые колонки
+
+    Returns:
+        StatusDiff: Новые, изменившиеся и пропавшие устройства
+    """
+    if previous is None:
+        return StatusDiff(current, current.iloc[0:0], current.iloc[0:0])
+    before = previous.set_index('device_id')
+    after = current.set_index('device_id')
+    common = after.index.intersection(before.index)
+    old_values = before.loc[common, columns]
+    new_values = after.loc[common, columns]
+    same = (old_values == new_values) | (old_values.isna() & new_values.isna())
+    changed = common[~same.all(axis=1).to_numpy()]
+    return StatusDiff(
+        current[~current['device_id'].isin(before.index)],
+        current[current['device_id'].isin(changed)],
+        previous[~previous['device_id'].isin(after.index)]
+    )
+
+# Колонки, по которым ищет текстовый поиск таблицы статуса
+STATUS_SEARCH_COLUMNS = ['device_id', 'object_label', 'first_name', 'last_name', 'geozones']
+
+class StatusSnapshot:
+    """
+    Последние точки устройств, загруженные один раз на обновление и общие для
+    метрик, графиков и таблицы
+
+    Статусы зависят только от порогов, поэтому при изменении слайдеров снимок
+    переклассифицируется на клиенте без повторного запроса к БД. Порядки
+    сортировки таблицы и текст для поиска строятся один раз на снимок, а
+    страница таблицы выбирается по ним без сортировки (см. page). Снимок
+    общий для сессий (см. ResultCache): frame не изменяется, а ленивые кэши
+    заполняются под блокировкой.
+    """
+
+    def __init__(self, frame, fetched_at):
+        """
+        Args:
+            frame (pd.DataFrame): Последние точки по устройствам без статусов
+            fetched_at (datetime): Время загрузки
+        """
+        self.frame = frame
+        self.fetched_at = fetched_at
+        self._lock = threading.Lock()
+        self._orders = {}
+        self._search_text = None
+
+    def __len__(self):
+        return len(self.frame)
+
+    def classify(self, params=None):
+        """
+        Возвращает строки снимка со статусами для заданных параметров (см. classify_status)
+        """
+        return classify_status(self.frame, params)
+
+    def sort_order(self, column, descending=False):
+        """
+        Позиции строк снимка, упорядоченные по колонке (пустые значения в конце)
+
+        Порядок строится по типизированной колонке (device_time, а не строка
+        last_connect_formatted) и кэшируется на снимок.
+        """
+        key = (column, descending)
+        with self._lock:
+            if key not in self._orders:
+                values = self.frame[column].reset_index(drop=True)
+                self._orders[key] = values.sort_values(ascending=not descending, kind='stable', na_position='last').index.to_numpy()
+            return self._orders[key]
+
+    def search_text(self):
+        """
+        Текст строки для поиска в нижнем регистре (device_id, объект,
+        сотрудник, геозоны), строится один раз на снимок
+        """
+        with self._lock:
+            if self._search_text is None:
+                parts = [
+                    self.frame[column].astype(object).fillna('').astype(str)
+                    for column in STATUS_SEARCH_COLUMNS if column in self.frame.columns
+                ]
+                text = parts[0].str.cat(parts[1:], sep=' ') if parts else pd.Series('', index=self.frame.index)
+                self._search_text = text.str.lower().to_numpy(dtype=object)
+            return self._search_text
+
+    @profiled('status.page')
+    def page(self, classified, sort_by='device_time', descending=False, search='', moving_statuses=None, connection_statuses=None, page=1, page_size=50):
+        """
+        Страница таблицы статуса с поиском, фильтрами по статусам и сортировкой
+
+        Args:
+            classified (pd.DataFrame): Результат classify для этого снимка
+            sort_by (str): Колонка сортировки
+            descending (bool): Сортировка по убыванию
+            search (str): Подстрока для поиска без учета регистра
+            moving_statuses (list): Оставить только эти moving_status
+            connection_statuses (list): Оставить только эти connection_status
+            page (int): Номер страницы с 1 (больше последней - последняя)
+            page_size (int): Строк на странице (None - все подходящие строки)
+
+        Returns:
+            tuple: (строки страницы, число подходящих строк)
+        """
+        mask = np.ones(len(classified), dtype=bool)
+        if search:
+            needle = search.strip().lower()
+            mask &= np.fromiter((needle in text for text in self.search_text()), dtype=bool, count=len(mask))
+        if moving_statuses:
+            mask &= classified['moving_status'].isin(moving_statuses).to_numpy()
+        if connection_statuses:
+            mask &= classified['connection_status'].isin(connection_statuses).to_numpy()
+        order = self.sort_order(sort_by, descending)
+        matched = order[mask[order]]
+        if page_size:
+            # Номер за последней страницей (после сужения фильтра) дает последнюю
+            pages = max((len(matched) - 1) // page_size + 1, 1)
+            first = (min(max(page, 1), pages) - 1) * page_size
+            matched_page = matched[first:first + page_size]
+        else:
+            matched_page = matched
+        return classified.iloc[matched_page], len(matched)
+
+def load_status_snapshot(conn):
+    """
+    Загружает последние точки устройств одним подготовленным запросом
+
+    Args:
+        conn: Соединение с БД
+
+    Returns:
+        StatusSnapshot: Снимок статуса
+    """
+    frame = assign_geozones(conn, CURRENT_STATUS.execute(conn))
+    return StatusSnapshot(frame, datetime.now())
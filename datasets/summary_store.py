@@ -0,0 +1,193 @@
+"""
+Локальное хранилище сводок по сменам за закрытые дни (SQLite)
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+import pandas as pd
+from datasets.profiling import profiled
+from db_connection import config_path
+
+DEFAULT_SUMMARY_STORE_PATH = os.getenv('SHIFTS_SUMMARY_STORE_PATH', os.path.join('.cache', 'shift_summary.sqlite3'))
+
+SUMMARY_COLUMNS = [
+    'device_id', 'date', 'activity_seconds', 'track_count', 'average_speed', 'max_speed',
+    'activity_start', 'activity_end'
+]
+
+_DATE_FORMAT = '%Y-%m-%d'
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+class ShiftSummaryStore:
+    """
+    Сводки по (device_id, date) за закрытые календарные дни для каждой пары
+    (min_speed, max_time_diff)
+
+    Сводки строятся по трекам из хранилища треков (TrackStore), поэтому не
+    зависят от границ запрошенного диапазона. Для каждого дня хранится отметка
+    о расчете, в том числе для дней без треков. Хранилище треков при
+    перестроении меняет начало покрытия: сохраненные с другим покрытием
+    сводки сбрасываются. День считается закрытым, когда по времени БД после его
+    конца прошло late_hours и все начавшиеся в нем треки закончились раньше,
+    чем их может продолжить опоздавшая точка.
+    """
+
+    def __init__(self, path=DEFAULT_SUMMARY_STORE_PATH, late_hours=2):
+        """
+        Args:
+            path (str): Путь к файлу SQLite
+            late_hours (int): Окно опоздавших данных после конца дня и трека, часов
+        """
+        self.path = path
+        self.late_hours = late_hours
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS daily_summary (
+                    min_speed_param REAL, max_time_diff_param REAL, date TEXT,
+                    device_id INTEGER, activity_seconds REAL, track_count INTEGER, average_speed REAL, max_speed REAL,
+                    activity_start TEXT, activity_end TEXT
+                )
+            ''')
+            db.execute('''
+                CREATE INDEX IF NOT EXISTS daily_summary_key
+                ON daily_summary (min_speed_param, max_time_diff_param, date)
+            ''')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS summary_days (
+                    min_speed_param REAL, max_time_diff_param REAL, date TEXT,
+                    PRIMARY KEY (min_speed_param, max_time_diff_param, date)
+                )
+            ''')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS summary_coverage (
+                    min_speed_param REAL, max_time_diff_param REAL, coverage_start TEXT,
+                    PRIMARY KEY (min_speed_param, max_time_diff_param)
+                )
+            ''')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _clear(self, db, key):
+        for table in ('daily_summary', 'summary_days', 'summary_coverage'):
+            db.execute(f'DELETE FROM {table} WHERE min_speed_param = ? AND max_time_diff_param = ?', key)
+
+    def _check_coverage(self, db, key, coverage_start):
+        """
+        Сбрасывает сводки пары параметров, если покрытие хранилища треков
+        отличается от того, по которому они посчитаны
+        """
+        stored = coverage_start.strftime(_TIME_FORMAT) if coverage_start is not None else ''
+        row = db.execute(
+            'SELECT coverage_start FROM summary_coverage WHERE min_speed_param = ? AND max_time_diff_param = ?', key
+        ).fetchone()
+        if row is None or row[0] != stored:
+            self._clear(db, key)
+            db.execute('INSERT INTO summary_coverage VALUES (?, ?, ?)', key + (stored,))
+
+    def invalidate(self, min_speed=None, max_time_diff=None):
+        """
+        Очищает хранилище целиком или для одной пары параметров
+        """
+        with self._lock, self._connect() as db:
+            if min_speed is None:
+                for table in ('daily_summary', 'summary_days', 'summary_coverage'):
+                    db.execute(f'DELETE FROM {table}')
+            else:
+                self._clear(db, (float(min_speed), float(max_time_diff)))
+
+    @profiled('summary_store.load')
+    def load(self, min_speed, max_time_diff, days, coverage_start):
+        """
+        Читает сводки за сохраненные дни из списка
+
+        Args:
+            min_speed (int): Минимальная скорость для движения
+            max_time_diff (int): Максимальная разница во времени для нового трека
+            days (list): Календарные дни (pd.Timestamp, полночь)
+            coverage_start (pd.Timestamp): Текущее начало покрытия хранилища треков
+
+        Returns:
+            tuple: (сводки в колонках SUMMARY_COLUMNS, множество сохраненных дней)
+        """
+        key = (float(min_speed), float(max_time_diff))
+        dates = [day.strftime(_DATE_FORMAT) for day in days]
+        with self._lock, self._connect() as db:
+            self._check_coverage(db, key, coverage_start)
+            if not dates:
+                return pd.DataFrame(columns=SUMMARY_COLUMNS), set()
+            stored_days = pd.read_sql(
+                'SELECT date FROM summary_days WHERE min_speed_param = ? AND max_time_diff_param = ? AND date >= ? AND date <= ?',
+                db, params=key + (min(dates), max(dates))
+            )
+            df = pd.read_sql(
+                'SELECT * FROM daily_summary WHERE min_speed_param = ? AND max_time_diff_param = ? AND date >= ? AND date <= ?',
+                db, params=key + (min(dates), max(dates))
+            )
+        available = set(stored_days['date']) & set(dates)
+        df = df[df['date'].isin(available)].assign(
+            date=lambda frame: pd.to_datetime(frame['date']).dt.date,
+            activity_start=lambda frame: pd.to_datetime(frame['activity_start']),
+            activity_end=lambda frame: pd.to_datetime(frame['activity_end'])
+        )
+        return df[SUMMARY_COLUMNS].reset_index(drop=True), {pd.Timestamp(date) for date in available}
+
+    @profiled('summary_store.save')
+    def save(self, min_speed, max_time_diff, summary, days, coverage_start):
+        """
+        Заменяет сводки за перечисленные дни
+
+        Args:
+            min_speed (int): Минимальная скорость для движения
+            max_time_diff (int): Максимальная разница во времени для нового трека
+            summary (pd.DataFrame): Сводки в колонках SUMMARY_COLUMNS за дни из days
+            days (list): Закрытые дни (pd.Timestamp, полночь), в том числе без треков
+            coverage_start (pd.Timestamp): Начало покрытия хранилища треков, по
+                которому посчитаны сводки
+        """
+        key = (float(min_speed), float(max_time_diff))
+        dates = [day.strftime(_DATE_FORMAT) for day in days]
+        rows = summary[SUMMARY_COLUMNS].copy()
+        rows['date'] = pd.to_datetime(rows['date']).dt.strftime(_DATE_FORMAT)
+        for col in ('activity_start', 'activity_end'):
+            rows[col] = rows[col].dt.strftime(_TIME_FORMAT)
+        rows.insert(0, 'max_time_diff_param', key[1])
+        rows.insert(0, 'min_speed_param', key[0])
+        with self._lock, self._connect() as db:
+            self._check_coverage(db, key, coverage_start)
+            db.executemany(
+                'DELETE FROM daily_summary WHERE min_speed_param = ? AND max_time_diff_param = ? AND date = ?',
+                [key + (date,) for date in dates]
+            )
+            rows.to_sql('daily_summary', db, if_exists='append', index=False)
+            db.executemany('INSERT OR REPLACE INTO summary_days VALUES (?, ?, ?)', [key + (date,) for date in dates])
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_summary_store(config=None):
+    """
+    Возвращает общее для процесса хранилище сводок по дням конфигурации
+    подключения (у каждой БД свой файл, см. config_path)
+
+    Args:
+        config (dict): Параметры подключения (по умолчанию DB_CONFIG)
+    """
+    path = config_path(DEFAULT_SUMMARY_STORE_PATH, config)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = ShiftSummaryStore(path)
+            _stores[path] = store
+        return store
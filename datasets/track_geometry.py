@@ -0,0 +1,197 @@
+"""
+Геометрия треков: пройденное расстояние и упрощенные полилинии для карты
+"""
+import os
+import numpy as np
+import pandas as pd
+from datasets.geozones import EARTH_RADIUS, haversine
+from datasets.profiling import profiled
+from datasets.shifts import (
+    SHIFTS_POINTS_QUERIES, _aggregate_tracks, _finalize_tracks, _query_params, _segment_points
+)
+
+# Допуск упрощения, м: точки ближе к хорде не добавляют формы (шум GPS)
+DEFAULT_TOLERANCE = float(os.getenv('TRACK_GEOMETRY_TOLERANCE', '5'))
+# Максимум точек полилинии одного трека
+DEFAULT_MAX_POINTS = int(os.getenv('TRACK_GEOMETRY_MAX_POINTS', '200'))
+
+def _segment_distance(px, py, ax, ay, bx, by):
+    """
+    Расстояние от точек P до отрезков AB на плоскости (векторно)
+    """
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = np.clip(((px - ax) * dx + (py - ay) * dy) / np.where(length2 > 0, length2, 1), 0, 1)
+    return np.hypot(px - ax - t * dx, py - ay - t * dy)
+
+def _importance(x, y, starts, ends, tolerance, max_inner=None):
+    """
+    Вес точек по Дугласу-Пекеру для всех треков сразу
+
+    Отрезки всех треков делятся одновременно, уровень за уровнем: на каждом
+    уровне в каждом отрезке находится самая удаленная от хорды точка. Вес
+    точки - ее удаление, ограниченное весом родительского отрезка, поэтому
+    отбор точек с наибольшим весом дает вложенные упрощения. Концы треков
+    получают бесконечный вес, отрезки с удалением не больше tolerance дальше
+    не делятся. Если задан max_inner, не делятся и отрезки, в которых вес
+    не может превысить max_inner-й по величине уже найденный вес трека.
+
+    Args:
+        x, y (np.ndarray): Координаты точек в метрах (локальная проекция)
+        starts, ends (np.ndarray): Границы треков [start, end) в массивах точек
+        tolerance (float): Допуск, м
+        max_inner (int): Сколько внутренних точек трека будет отобрано по весу
+
+    Returns:
+        np.ndarray: Вес каждой точки (0 - точка не выбиралась или отброшена)
+    """
+    importance = np.zeros(len(x))
+    importance[starts] = np.inf
+    importance[ends - 1] = np.inf
+    long_tracks = (ends - starts >= 3) & (max_inner != 0)
+    lo, hi = starts[long_tracks], ends[long_tracks] - 1
+    owner = np.flatnonzero(long_tracks)
+    cap = np.full(len(lo), np.inf)
+    found_track, found_weight = np.empty(0, dtype=np.int64), np.empty(0)
+    while len(lo):
+        counts = hi - lo - 1
+        offsets = np.cumsum(counts) - counts
+        segment = np.repeat(np.arange(len(lo)), counts)
+        inner = np.arange(counts.sum()) - offsets[segment] + lo[segment] + 1
+        distance = _segment_distance(
+            x[inner], y[inner], x[lo][segment], y[lo][segment], x[hi][segment], y[hi][segment]
+        )
+        farthest = np.maximum.reduceat(distance, offsets)
+        # Первая точка с максимальным удалением в каждом отрезке
+        positions = np.where(distance == farthest[segment], np.arange(len(distance)), len(distance))
+        split = inner[np.minimum.reduceat(positions, offsets)]
+        # Вес строго меньше веса родителя: отбор по весу не зависит от порядка обхода
+        weight = np.minimum(farthest, np.nextafter(cap, 0))
+        importance[split] = weight
+
+        refine = farthest > tolerance
+        if max_inner is not None:
+            # Порог трека - max_inner-й по величине найденный вес: веса
+            # в дочерних отрезках меньше веса точки деления. Хранятся только
+            # max_inner наибольших весов каждого трека
+            found_track = np.concatenate([found_track, owner])
+            found_weight = np.concatenate([found_weight, weight])
+            order = np.lexsort((-found_weight, found_track))
+            found_track, found_weight = found_track[order], found_weight[order]
+            rank = np.arange(len(order)) - np.searchsorted(found_track, found_track)
+            threshold = np.zeros(len(starts))
+            kth = rank == max_inner - 1
+            threshold[found_track[kth]] = found_weight[kth]
+            found_track, found_weight = found_track[rank < max_inner], found_weight[rank < max_inner]
+            refine &= weight > threshold[owner]
+        lo = np.concatenate([lo[refine], split[refine]])
+        hi = np.concatenate([split[refine], hi[refine]])
+        cap = np.concatenate([weight[refine], weight[refine]])
+        owner = np.concatenate([owner[refine], owner[refine]])
+        has_inner = hi - lo >= 2
+        lo, hi, cap, owner = lo[has_inner], hi[has_inner], cap[has_inner], owner[has_inner]
+    return importance
+
+@profiled('geometry.simplify')
+def simplify_tracks(latitude, longitude, track, tolerance=DEFAULT_TOLERANCE, max_points=DEFAULT_MAX_POINTS):
+    """
+    Расстояние и упрощенная полилиния каждого трека
+
+    Расстояние - сумма haversine между соседними точками трека. Полилиния -
+    упрощение Дугласа-Пекера с допуском tolerance, из которого оставляются
+    не больше max_points точек с наибольшим весом (концы трека сохраняются
+    всегда).
+
+    Args:
+        latitude, longitude (array-like): Координаты точек в градусах
+        track (array-like): Номер трека точки; точки одного трека идут подряд
+            в порядке времени
+        tolerance (float): Допуск упрощения, м
+        max_points (int): Максимум точек полилинии трека (не меньше 2)
+
+    Returns:
+        pd.DataFrame: distance_m, path_points и path (список [lon, lat]) с
+            индексом по номеру трека
+    """
+    lat = np.asarray(latitude, dtype=float)
+    lon = np.asarray(longitude, dtype=float)
+    track = np.asarray(track)
+    if not len(track):
+        return pd.DataFrame(
+            {'distance_m': pd.Series(dtype=float), 'path_points': pd.Series(dtype='int64'), 'path': pd.Series(dtype=object)}
+        )
+    new_track = np.r_[True, track[1:] != track[:-1]]
+    starts = np.flatnonzero(new_track)
+    ends = np.r_[starts[1:], len(track)]
+
+    step = np.zeros(len(track))
+    step[1:] = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    step[new_track] = 0
+    distance = np.add.reduceat(step, starts)
+
+    # Локальная равнопромежуточная проекция по широте начала трека
+    scale = np.cos(np.radians(np.repeat(lat[starts], ends - starts)))
+    x = np.radians(lon) * scale * EARTH_RADIUS
+    y = np.radians(lat) * EARTH_RADIUS
+    max_points = max(max_points, 2) if max_points else None
+    importance = _importance(x, y, starts, ends, tolerance, max_points - 2 if max_points else None)
+
+    keep = importance > tolerance
+    if max_points:
+        # Ранг точки по весу внутри трека (треки идут подряд)
+        order = np.lexsort((-importance, np.repeat(np.arange(len(starts)), ends - starts)))
+        rank = np.empty(len(track), dtype=np.int64)
+        rank[order] = np.arange(len(track)) - np.repeat(starts, ends - starts)
+        keep &= rank < max_points
+
+    kept = np.flatnonzero(keep)
+    path_points = np.add.reduceat(keep.astype(np.int64), starts)
+    coordinates = np.column_stack([lon[kept], lat[kept]])
+    paths = [part.tolist() for part in np.split(coordinates, np.cumsum(path_points)[:-1])]
+    return pd.DataFrame(
+        {'distance_m': distance, 'path_points': path_points, 'path': paths},
+        index=track[starts]
+    )
+
+def get_track_geometry(conn, start_date=None, end_date=None, device_id=None, min_speed=3, max_time_diff=300, device_ids=None, tolerance=DEFAULT_TOLERANCE, max_points=DEFAULT_MAX_POINTS):
+    """
+    Треки за период с расстоянием и упрощенной полилинией для карты
+
+    Точки размечаются так же, как в get_shifts_data (без хранилища треков),
+    поэтому track_id совпадают с результатом get_shifts_data за тот же период.
+
+    Args:
+        conn: Соединение с БД
+        start_date (datetime): Начальная дата
+        end_date (datetime): Конечная дата
+        device_id (int): ID устройства
+        min_speed (int): Минимальная скорость для движения
+        max_time_diff (int): Максимальная разница во времени для нового трека
+        device_ids (list): Ограничить расчет списком устройств
+        tolerance (float): Допуск упрощения, м
+        max_points (int): Максимум точек полилинии трека
+
+    Returns:
+        pd.DataFrame: track_id, device_id, track_start_time, track_end_time,
+            points_in_track, distance_m, path_points, path
+    """
+    suffix, params = _query_params(start_date, end_date, device_id, device_ids)
+    df = _segment_points(SHIFTS_POINTS_QUERIES[suffix].execute_bulk(conn, params), min_speed, max_time_diff)
+    aggregated = _aggregate_tracks(df)
+    tracks = _finalize_tracks(aggregated, min_speed)[
+        ['track_id', 'device_id', 'track_start_time', 'track_end_time', 'points_in_track']
+    ]
+    if df.empty:
+        return tracks.assign(distance_m=pd.Series(dtype=float), path_points=pd.Series(dtype='int64'), path=pd.Series(dtype=object))
+
+    # Точки упорядочены по (device_id, device_time), поэтому номер подряд
+    # идущей группы (device_id, temp_track_id) совпадает с позицией трека в
+    # aggregated, а _finalize_tracks сохраняет индекс aggregated
+    device = df['device_id'].to_numpy()
+    temp_track = df['temp_track_id'].to_numpy()
+    position = np.r_[0, np.cumsum((device[1:] != device[:-1]) | (temp_track[1:] != temp_track[:-1]))]
+    latitude = df['latitude'].to_numpy(dtype=float) / 1e7
+    longitude = df['longitude'].to_numpy(dtype=float) / 1e7
+    points = np.isin(position, tracks.index) & np.isfinite(latitude) & np.isfinite(longitude)
+    geometry = simplify_tracks(latitude[points], longitude[points], position[points], tolerance, max_points)
+    return tracks.join(geometry).reset_index(drop=True)
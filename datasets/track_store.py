@@ -0,0 +1,291 @@
+"""
+Локальное хранилище закрытых треков (SQLite) с пересчетом только открытого хвоста
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+import pandas as pd
+from datasets.profiling import profile_stage
+from db_connection import config_path
+
+DEFAULT_TRACK_STORE_PATH = os.getenv('SHIFTS_TRACK_STORE_PATH', os.path.join('.cache', 'shift_tracks.sqlite3'))
+
+STORED_TRACK_COLUMNS = [
+    'device_id', 'track_start_time', 'track_end_time', 'track_duration_seconds',
+    'avg_speed', 'max_speed', 'min_speed', 'latitude_start', 'longitude_start', 'altitude_start',
+    'latitude_end', 'longitude_end', 'altitude_end', 'points_in_track'
+]
+
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+class TrackStore:
+    """
+    Закрытые треки и водяные знаки по устройствам для каждой пары
+    (min_speed, max_time_diff)
+
+    Трек закрыт, когда после него у устройства уже начался следующий трек:
+    правило нового трека зависит только от предыдущей точки, поэтому такой
+    трек больше не меняется. Для каждого устройства хранится начало последнего
+    (открытого) трека, и при следующем запросе точки читаются только с него.
+    Окно late_hours перед открытым треком (вместе с закрытыми треками,
+    закончившимися в нем) читается заново, чтобы учесть опоздавшие точки.
+    Хранилище покрывает непрерывную историю начиная с coverage_start и до
+    horizon - времени БД последней разметки; точки всегда размечаются до
+    текущего времени БД, независимо от конца запрошенного диапазона, поэтому
+    хранятся только целые треки.
+    """
+
+    def __init__(self, path=DEFAULT_TRACK_STORE_PATH, late_hours=2):
+        """
+        Args:
+            path (str): Путь к файлу SQLite
+            late_hours (int): Окно перечитывания опоздавших точек перед открытым треком, часов
+        """
+        self.path = path
+        self.late_hours = late_hours
+        self._lock = threading.Lock()
+        # Меняется при каждой записи: запрос, размечавший точки без блокировки,
+        # не сохраняет результат поверх более новой записи
+        self._generation = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS tracks (
+                    min_speed_param REAL, max_time_diff_param REAL,
+                    device_id INTEGER, track_start_time TEXT, track_end_time TEXT,
+                    track_duration_seconds REAL, avg_speed REAL, max_speed REAL, min_speed REAL,
+                    latitude_start REAL, longitude_start REAL, altitude_start REAL,
+                    latitude_end REAL, longitude_end REAL, altitude_end REAL,
+                    points_in_track INTEGER
+                )
+            ''')
+            db.execute('''
+                CREATE INDEX IF NOT EXISTS tracks_key
+                ON tracks (min_speed_param, max_time_diff_param, track_start_time)
+            ''')
+            db.execute('''
+                CREATE INDEX IF NOT EXISTS tracks_end
+                ON tracks (min_speed_param, max_time_diff_param, track_end_time)
+            ''')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    min_speed_param REAL, max_time_diff_param REAL, device_id INTEGER, open_since TEXT,
+                    PRIMARY KEY (min_speed_param, max_time_diff_param, device_id)
+                )
+            ''')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS coverage (
+                    min_speed_param REAL, max_time_diff_param REAL, coverage_start TEXT, horizon TEXT,
+                    PRIMARY KEY (min_speed_param, max_time_diff_param)
+                )
+            ''')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def invalidate(self, min_speed=None, max_time_diff=None):
+        """
+        Очищает хранилище целиком или для одной пары параметров
+        """
+        with self._lock, self._connect() as db:
+            self._generation += 1
+            for table in ('tracks', 'watermarks', 'coverage'):
+                if min_speed is None:
+                    db.execute(f'DELETE FROM {table}')
+                else:
+                    db.execute(
+                        f'DELETE FROM {table} WHERE min_speed_param = ? AND max_time_diff_param = ?',
+                        (float(min_speed), float(max_time_diff))
+                    )
+
+    def _coverage(self, min_speed, max_time_diff):
+        with self._connect() as db:
+            row = db.execute(
+                'SELECT coverage_start, horizon FROM coverage WHERE min_speed_param = ? AND max_time_diff_param = ?',
+                (float(min_speed), float(max_time_diff))
+            ).fetchone()
+        return (pd.Timestamp(row[0]), pd.Timestamp(row[1]) if row[1] else None) if row else (None, None)
+
+    def coverage_start(self, min_speed, max_time_diff):
+        """
+        Начало покрытия для пары параметров (None, если хранилище не построено)
+
+        Покрытие меняется только при перестроении хранилища с нуля.
+        """
+        return self._coverage(min_speed, max_time_diff)[0]
+
+    def horizon(self, min_speed, max_time_diff):
+        """
+        Время БД, до которого размечены сохраненные треки (None, если еще не размечены)
+        """
+        return self._coverage(min_speed, max_time_diff)[1]
+
+    def _read_tracks(self, db, key, start, end, load_from):
+        with profile_stage('track_store.load') as stage:
+            stored = stage.record(pd.read_sql(
+                '''
+                    SELECT * FROM tracks
+                    WHERE min_speed_param = ? AND max_time_diff_param = ?
+                    AND track_start_time < ? AND track_end_time >= ?
+                    AND (track_start_time >= ? OR track_start_time < ? OR track_end_time >= ?)
+                ''',
+                db, params=key + tuple(moment.strftime(_TIME_FORMAT) for moment in (end, start, load_from, start, end))
+            ))
+        for col in ('track_start_time', 'track_end_time'):
+            stored[col] = pd.to_datetime(stored[col])
+        return stored[STORED_TRACK_COLUMNS]
+
+    def _reread_since(self, db, key, watermarks, coverage_start):
+        """
+        Начало перечитывания по устройствам: начало открытого трека, но не
+        позже начала окна late_hours перед ним (но не раньше начала покрытия)
+        и начала закрытого трека, закончившегося в этом окне
+
+        Между сохраненными треками лежат только точки отброшенных (медленных
+        или одиночных) треков, поэтому перечитывание с середины такого
+        промежутка дает те же треки.
+        """
+        since = watermarks.set_index('device_id')['open_since']
+        if since.empty:
+            return since
+        late = (since - timedelta(hours=self.late_hours)).clip(lower=coverage_start)
+        recent = pd.read_sql(
+            '''
+                SELECT device_id, track_start_time, track_end_time FROM tracks
+                WHERE min_speed_param = ? AND max_time_diff_param = ? AND track_end_time >= ?
+            ''',
+            db, params=key + (late.min().strftime(_TIME_FORMAT),)
+        )
+        recent = recent[recent['device_id'].isin(since.index)]
+        recent = recent[pd.to_datetime(recent['track_end_time']) >= recent['device_id'].map(late)]
+        first_late = pd.to_datetime(recent['track_start_time']).groupby(recent['device_id']).min().reindex(since.index)
+        return late.mask(first_late < late, first_late)
+
+    def get_tracks(self, conn, start_date, end_date, min_speed, max_time_diff, segment, load_from=None):
+        """
+        Треки, пересекающиеся с [start_date, end_date), целиком (без обрезки
+        по границам диапазона)
+
+        Блокировка держится только на время чтения и записи SQLite: разметка
+        точек из БД выполняется без нее, и результат не сохраняется, если
+        хранилище за это время изменил другой запрос или уже размечено до
+        более позднего времени БД.
+
+        Args:
+            conn: Соединение с БД
+            start_date (datetime): Начальная дата
+            end_date (datetime): Конечная дата
+            min_speed (int): Минимальная скорость для движения
+            max_time_diff (int): Максимальная разница во времени для нового трека
+            segment (callable): segment(conn, coverage_start, watermarks) ->
+                (closed, open_tracks, open_since, horizon): закрытые и открытые
+                треки по точкам после водяных знаков до текущего времени БД,
+                начала открытых треков по устройствам и это время БД
+            load_from (datetime): Если задано, из треков внутри диапазона
+                возвращаются только начавшиеся не раньше load_from (треки,
+                пересекающие границы диапазона, возвращаются всегда)
+
+        Returns:
+            tuple: (треки в колонках STORED_TRACK_COLUMNS, отсортированные по
+                device_id и track_start_time; время БД, до которого они размечены)
+        """
+        key = (float(min_speed), float(max_time_diff))
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+        load_from = start if load_from is None else max(start, pd.Timestamp(load_from))
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                'SELECT coverage_start, horizon FROM coverage WHERE min_speed_param = ? AND max_time_diff_param = ?', key
+            ).fetchone()
+            coverage_start = pd.Timestamp(row[0]) if row else None
+            stored_horizon = pd.Timestamp(row[1]) if row and row[1] else None
+            if coverage_start is None or start < coverage_start:
+                # Запрошена история раньше покрытия: строим хранилище заново
+                self._generation += 1
+                for table in ('tracks', 'watermarks'):
+                    db.execute(f'DELETE FROM {table} WHERE min_speed_param = ? AND max_time_diff_param = ?', key)
+                coverage_start = start
+                stored_horizon = None
+                db.execute('INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, NULL)', key + (coverage_start.strftime(_TIME_FORMAT),))
+            generation = self._generation
+            with profile_stage('track_store.watermarks') as stage:
+                watermarks = stage.record(pd.read_sql(
+                    'SELECT device_id, open_since FROM watermarks WHERE min_speed_param = ? AND max_time_diff_param = ?',
+                    db, params=key
+                ))
+            watermarks['open_since'] = pd.to_datetime(watermarks['open_since'])
+            since = self._reread_since(db, key, watermarks, coverage_start)
+            stored = self._read_tracks(db, key, start, end, load_from)
+
+        # Треки устройств с позиции перечитывания заменяются размеченными заново
+        stored = stored[~(stored['track_start_time'] >= pd.to_datetime(stored['device_id'].map(since)))]
+        closed, open_tracks, open_since, horizon = segment(
+            conn, coverage_start, since.rename('open_since').rename_axis('device_id').reset_index()
+        )
+
+        with self._lock, self._connect() as db:
+            # Разметка до более раннего времени БД, чем уже сохраненная, не записывается
+            if generation == self._generation and (stored_horizon is None or horizon >= stored_horizon):
+                self._generation += 1
+                late = since[since < watermarks.set_index('device_id')['open_since'].reindex(since.index)]
+                db.executemany(
+                    '''
+                        DELETE FROM tracks WHERE min_speed_param = ? AND max_time_diff_param = ?
+                        AND device_id = ? AND track_start_time >= ?
+                    ''',
+                    [key + (int(device_id), moment.strftime(_TIME_FORMAT)) for device_id, moment in late.items()]
+                )
+                if not closed.empty:
+                    with profile_stage('track_store.save') as stage:
+                        rows = stage.record(closed[STORED_TRACK_COLUMNS].copy())
+                        for col in ('track_start_time', 'track_end_time'):
+                            rows[col] = rows[col].dt.strftime(_TIME_FORMAT)
+                        rows.insert(0, 'max_time_diff_param', key[1])
+                        rows.insert(0, 'min_speed_param', key[0])
+                        rows.to_sql('tracks', db, if_exists='append', index=False)
+                db.executemany(
+                    'INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?)',
+                    [key + (int(device_id), moment.strftime(_TIME_FORMAT)) for device_id, moment in open_since.items()]
+                )
+                db.execute(
+                    'UPDATE coverage SET horizon = ? WHERE min_speed_param = ? AND max_time_diff_param = ?',
+                    (horizon.strftime(_TIME_FORMAT),) + key
+                )
+
+        fresh = pd.concat([closed[STORED_TRACK_COLUMNS], open_tracks[STORED_TRACK_COLUMNS]], ignore_index=True)
+        fresh = fresh[
+            (fresh['track_start_time'] < end) & (fresh['track_end_time'] >= start) & (
+                (fresh['track_start_time'] >= load_from) | (fresh['track_start_time'] < start) | (fresh['track_end_time'] >= end)
+            )
+        ]
+        tracks = pd.concat([part for part in (stored, fresh) if not part.empty] or [stored], ignore_index=True)
+        return tracks.sort_values(['device_id', 'track_start_time'], kind='stable').reset_index(drop=True), horizon
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_track_store(config=None):
+    """
+    Возвращает общее для процесса хранилище треков конфигурации подключения
+    (у каждой БД свой файл, см. config_path)
+
+    Args:
+        config (dict): Параметры подключения (по умолчанию DB_CONFIG)
+    """
+    path = config_path(DEFAULT_TRACK_STORE_PATH, config)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = TrackStore(path)
+            _stores[path] = store
+        return store
@@ -1,47 +1,201 @@
+"""
+Единый слой подключения к БД: ленивые потокобезопасные пулы соединений
+и общий движок SQLAlchemy
+"""
+import hashlib
 import os
+import threading
+import time
+import weakref
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
 import psycopg2
-from psycopg2 import pool
+from psycopg2 import pool, extensions
 from contextlib import contextmanager
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Конфигурация подключения к БД
+# Конфигурация подключения к БД (DB_* как в форме приложения, PG* как запасной вариант)
 DB_CONFIG = {
-    'user': os.getenv('PGUSER'),
-    'password': os.getenv('PGPASSWORD'),
-    'host': os.getenv('PGHOST'),
-    'port': os.getenv('PGPORT'),
-    'database': os.getenv('PGDATABASE')
+    'user': os.getenv('DB_USER', os.getenv('PGUSER')),
+    'password': os.getenv('DB_PASSWORD', os.getenv('PGPASSWORD')),
+    'host': os.getenv('DB_HOST', os.getenv('PGHOST')),
+    'port': os.getenv('DB_PORT', os.getenv('PGPORT', '5432')),
+    'dbname': os.getenv('DB_NAME', os.getenv('PGDATABASE')),
+    'sslmode': os.getenv('DB_SSLMODE', 'require')
 }
 
-# Создание пула соединений
-connection_pool = pool.SimpleConnectionPool(
-    minconn=1,
-    maxconn=10,
-    **DB_CONFIG
-)
+# Размер пула и проверка соединений
+POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Соединение, простоявшее дольше этого времени, проверяется SELECT 1 при выдаче
+POOL_CHECK_IDLE = float(os.getenv('DB_POOL_CHECK_IDLE', '30'))
+
+class ConnectionPool:
+    """
+    Пул соединений psycopg2 с ожиданием свободного соединения и проверкой
+    соединения при выдаче
+    """
+
+    def __init__(self, config, minconn=POOL_MIN, maxconn=POOL_MAX):
+        self.config = config
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, **config)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = weakref.WeakKeyDictionary()
+
+    @property
+    def closed(self):
+        return self._pool.closed
+
+    def _healthy(self, conn):
+        if conn.closed or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - self._last_used.get(conn, 0) < POOL_CHECK_IDLE:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=POOL_TIMEOUT):
+        """
+        Выдает проверенное соединение, при необходимости ожидая освобождения
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise pool.PoolError("Нет свободных соединений в пуле")
+        try:
+            conn = self._pool.getconn()
+            if not self._healthy(conn):
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            _connection_configs[conn] = self.config
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        """
+        Возвращает соединение в пул (сломанные соединения закрываются)
+        """
+        try:
+            broken = close or conn.closed or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN
+            if not broken:
+                self._last_used[conn] = time.monotonic()
+            self._pool.putconn(conn, close=bool(broken))
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+_pools = {}
+_engines = {}
+_lock = threading.Lock()
+# Конфигурация пула, из которого выдано соединение
+_connection_configs = weakref.WeakKeyDictionary()
+
+def config_key(config):
+    """
+    Ключ конфигурации подключения для общих по процессу объектов
+    """
+    return tuple(sorted((key, str(value)) for key, value in config.items() if value is not None))
+
+def connection_config(conn):
+    """
+    Конфигурация пула, из которого выдано соединение (None для соединений не из пула)
+    """
+    return _connection_configs.get(conn)
+
+def connection_key(conn):
+    """
+    Ключ конфигурации, из пула которой выдано соединение (для соединений не
+    из пула - по параметрам DSN без пароля)
+    """
+    config = connection_config(conn)
+    if config is not None:
+        return config_key(config)
+    return config_key(conn.get_dsn_parameters())
+
+def config_path(path, config=None):
+    """
+    Путь файла локального хранилища для конфигурации подключения
+
+    К имени файла добавляется хеш конфигурации без пароля, поэтому сессии,
+    подключенные к разным БД, не читают и не перезаписывают данные друг друга.
+
+    Args:
+        path (str): Путь по умолчанию
+        config (dict): Параметры подключения (по умолчанию DB_CONFIG)
+    """
+    identity = config_key({key: value for key, value in (config or DB_CONFIG).items() if key != 'password'})
+    digest = hashlib.sha256(repr(identity).encode()).hexdigest()[:12]
+    root, ext = os.path.splitext(path)
+    return f'{root}.{digest}{ext}'
+
+def get_pool(config=None):
+    """
+    Возвращает пул соединений для конфигурации, создавая его при первом обращении
+
+    Args:
+        config (dict): Параметры psycopg2.connect (по умолчанию DB_CONFIG)
+    """
+    config = config or DB_CONFIG
+    key = config_key(config)
+    with _lock:
+        connection_pool = _pools.get(key)
+        if connection_pool is None or connection_pool.closed:
+            connection_pool = ConnectionPool(config)
+            _pools[key] = connection_pool
+        return connection_pool
 
 @contextmanager
-def get_db_connection():
+def get_db_connection(config=None):
     """
     Контекстный менеджер для получения соединения из пула
     """
+    connection_pool = get_pool(config)
     conn = connection_pool.getconn()
+    broken = False
     try:
         yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
     finally:
-        connection_pool.putconn(conn)
+        connection_pool.putconn(conn, close=broken)
+
+def close_pool(config=None):
+    """
+    Закрывает пул соединений конфигурации
+    """
+    with _lock:
+        connection_pool = _pools.pop(config_key(config or DB_CONFIG), None)
+    if connection_pool is not None:
+        connection_pool.closeall()
 
-def get_sqlalchemy_engine():
+def get_sqlalchemy_engine(config=None):
     """
-    Создание движка SQLAlchemy для работы с БД
+    Возвращает общий движок SQLAlchemy для конфигурации (создается один раз)
     """
-    return create_engine(
-        f'postgresql://{DB_CONFIG["user"]}:{DB_CONFIG["password"]}@{DB_CONFIG["host"]}:{DB_CONFIG["port"]}/{DB_CONFIG["database"]}'
-    )
+    config = config or DB_CONFIG
+    key = config_key(config)
+    with _lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_engine(
+                'postgresql+psycopg2://',
+                creator=lambda: psycopg2.connect(**config),
+                pool_size=POOL_MAX,
+                pool_pre_ping=True
+            )
+            _engines[key] = engine
+        return engine
 
 def test_connection():
     """
@@ -60,4 +214,4 @@ def test_connection():
 
 if __name__ == "__main__":
     # Тестирование подключения при запуске файла
-    test_connection() 
\ No newline at end of file
+    test_connection()
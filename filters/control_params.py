@@ -19,16 +19,20 @@ def display_control_params():
     with col4:
         gps_not_updated_max = st.slider("GPS Not Updated Max (minutes)", gps_not_updated_min, 15, 10)
 
-<<<<<<< HEAD
+    col5, col6 = st.columns(2)
+    with col5:
+        live_mode = st.toggle("Live mode", value=False)
+    with col6:
+        refresh_seconds = st.select_slider("Refresh interval (seconds)", [5, 10, 30, 60], value=10)
+
     update_button = st.button("refresh")
-=======
-    update_button = st.button("Обновить данные")
->>>>>>> 59fb1d1 (разделен дашборд и апп)
     
     return {
         'max_idle_speed': max_idle_speed,
         'min_idle_detection': min_idle_detection,
         'gps_not_updated_min': gps_not_updated_min,
         'gps_not_updated_max': gps_not_updated_max,
-        'update_button': update_button
+        'update_button': update_button,
+        'live_mode': live_mode,
+        'refresh_seconds': refresh_seconds
     } 
\ No newline at end of file
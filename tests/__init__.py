@@ -0,0 +1,3 @@
+"""
+Тесты обработки данных дашборда
+"""
@@ -0,0 +1,127 @@
+"""
+Тестовая БД точек трекинга без PostgreSQL: запросы модуля datasets.shifts
+выполняются по таблице точек в pandas
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import datasets.shifts
+from datasets.queries import Query
+from datasets.schema import TRACKING_POINTS_SCHEMA, apply_schema
+
+POINT_COLUMNS = ['device_id', 'device_time', 'speed', 'latitude', 'longitude', 'altitude', 'event_id']
+EVENT_IDS = (2, 802, 803, 804, 811)
+
+def generate_points(seed, devices=5, start='2026-10-08', end='2026-10-12 06:00', max_delay_minutes=60):
+    """
+    Случайные точки устройств: поездки, стоянки и разрывы связи, в том числе
+    через полночь
+
+    Returns:
+        pd.DataFrame: Точки в колонках POINT_COLUMNS и arrival - время
+            появления точки в БД (не позже max_delay_minutes после device_time)
+    """
+    rng = np.random.default_rng(seed)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    frames = []
+    for device_id in range(1, devices + 1):
+        seconds = []
+        speeds = []
+        moment = rng.uniform(0, 3600)
+        moving = False
+        while moment < (end - start).total_seconds():
+            if rng.random() < 0.05:
+                moving = not moving
+            seconds.append(moment)
+            speeds.append(rng.uniform(300, 1500) if moving else rng.choice([0, 0, 1, 2]))
+            gap = rng.random()
+            if gap < 0.03:
+                moment += rng.uniform(3600, 5 * 3600)
+            elif gap < 0.12:
+                moment += rng.uniform(250, 3000)
+            else:
+                moment += rng.uniform(20, 120)
+        count = len(seconds)
+        device_time = start + pd.to_timedelta(np.round(seconds), unit='s')
+        delay = np.where(rng.random(count) < 0.1, rng.uniform(0, max_delay_minutes * 60, count), rng.uniform(0, 30, count))
+        frames.append(pd.DataFrame({
+            'device_id': device_id,
+            'device_time': device_time,
+            'speed': np.where(rng.random(count) < 0.02, np.nan, speeds),
+            'latitude': 550000000 + rng.integers(0, 100000, count),
+            'longitude': 370000000 + rng.integers(0, 100000, count),
+            'altitude': rng.integers(100, 2000, count),
+            'event_id': rng.choice([2, 2, 2, 802, 811, 5], count),
+            'arrival': device_time + pd.to_timedelta(delay, unit='s')
+        }))
+    points = pd.concat(frames, ignore_index=True).drop_duplicates(['device_id', 'device_time'])
+    return points.astype({'speed': 'float64', 'latitude': 'float64', 'longitude': 'float64', 'altitude': 'float64'})
+
+class FakeTrackingDB:
+    """
+    Точки трекинга, видимые на момент clock (arrival <= clock), и время БД clock
+    """
+
+    def __init__(self, points, clock):
+        self.points = points
+        self.clock = pd.Timestamp(clock)
+
+    def visible(self):
+        points = self.points
+        return points[(points['arrival'] <= self.clock) & points['event_id'].isin(EVENT_IDS)]
+
+    def _result(self, df, order):
+        df = df.sort_values(order, kind='stable').reset_index(drop=True)
+        return apply_schema(df, TRACKING_POINTS_SCHEMA)
+
+    def query(self, name, params):
+        points = self.visible()
+        if name == 'db_clock':
+            return pd.DataFrame({'db_now': [self.clock]})
+        if name.startswith('shifts_points'):
+            points = points[
+                (points['device_time'] >= pd.Timestamp(params['start_date']))
+                & (points['device_time'] < pd.Timestamp(params['end_date']))
+            ]
+            if 'device_id' in params:
+                points = points[points['device_id'] == params['device_id']]
+            if 'device_ids' in params:
+                points = points[points['device_id'].isin(params['device_ids'])]
+            return self._result(points[POINT_COLUMNS], ['device_id', 'device_time'])
+        if name == 'shifts_tail':
+            open_since = pd.Series(pd.to_datetime(params['open_since']), index=params['device_ids'], dtype='datetime64[ns]')
+            since = points['device_id'].map(open_since).fillna(pd.Timestamp(params['coverage_start']))
+            points = points[(points['device_time'] >= since) & (points['device_time'] < pd.Timestamp(params['horizon']))]
+            return self._result(points[POINT_COLUMNS], ['device_id', 'device_time'])
+        if name == 'shifts_track_points':
+            parts = []
+            for number, (device_id, since, until) in enumerate(zip(params['device_ids'], params['since'], params['until']), 1):
+                part = points[
+                    (points['device_id'] == device_id)
+                    & (points['device_time'] >= pd.Timestamp(since)) & (points['device_time'] <= pd.Timestamp(until))
+                    & (points['device_time'] >= pd.Timestamp(params['start_date']))
+                    & (points['device_time'] < pd.Timestamp(params['end_date']))
+                ]
+                parts.append(part[POINT_COLUMNS].assign(temp_track_id=number))
+            result = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=POINT_COLUMNS + ['temp_track_id'])
+            return self._result(result[['temp_track_id'] + POINT_COLUMNS], ['temp_track_id', 'device_time'])
+        raise AssertionError(f"Запрос {name} не поддерживается тестовой БД")
+
+class _Objects:
+    def objects(self, conn):
+        return pd.DataFrame(
+            {'object_label': [f'Объект {device_id}' for device_id in range(1, 11)]},
+            index=pd.Index(range(1, 11), name='device_id')
+        )
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """
+    Подменяет выполнение запросов тестовой БД; возвращает ее (points и clock
+    задаются тестом)
+    """
+    db = FakeTrackingDB(generate_points(1), '2026-10-12 06:00')
+    monkeypatch.setattr(Query, 'execute', lambda self, conn, params=None: db.query(self.name, params or {}))
+    monkeypatch.setattr(Query, 'execute_bulk', lambda self, conn, params=None: db.query(self.name, params or {}))
+    monkeypatch.setattr(datasets.shifts, 'get_dimension_cache', _Objects)
+    return db
@@ -0,0 +1,72 @@
+"""
+Снимок живой таблицы статуса без PostgreSQL: опрос подменяется готовым результатом
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import datasets.live_state
+import datasets.status
+from datasets.geozones import GeozoneIndex
+from datasets.live_state import LIVE_STATE_POLL, LiveStateTable
+from datasets.queries import Query
+
+DB_NOW = pd.Timestamp('2026-10-17 12:00')
+
+class _Dimensions:
+    def fleet_objects(self, conn):
+        return pd.DataFrame(
+            {'object_id': [10, 20], 'object_label': ['A', 'B'], 'first_name': ['Иван', None], 'last_name': ['Петров', None]},
+            index=pd.Index([1, 2], name='device_id')
+        )
+
+    def geozones(self, conn):
+        return GeozoneIndex(pd.DataFrame({
+            'zone_label': ['База'], 'zone_type': ['circle'],
+            'circle_center_latitude': [55.0], 'circle_center_longitude': [37.0], 'radius': [500.0]
+        }))
+
+@pytest.fixture
+def poll_rows(monkeypatch):
+    """
+    Результат запроса опроса: список строк (db_now, device_id, device_time,
+    speed, latitude, longitude); без точек в окне - одна строка с db_now
+    """
+    rows = []
+
+    def execute(self, conn, params=None):
+        assert self is LIVE_STATE_POLL
+        return pd.DataFrame(
+            rows or [(DB_NOW, np.nan, pd.NaT, np.nan, np.nan, np.nan)],
+            columns=['db_now', 'device_id', 'device_time', 'speed', 'latitude', 'longitude']
+        )
+
+    monkeypatch.setattr(Query, 'execute', execute)
+    monkeypatch.setattr(datasets.live_state, 'get_dimension_cache', _Dimensions)
+    monkeypatch.setattr(datasets.status, 'get_dimension_cache', _Dimensions)
+    return rows
+
+def test_empty_poll(poll_rows):
+    snapshot = LiveStateTable(interval=0).snapshot(None)
+    assert len(snapshot) == 0
+    assert list(snapshot.frame.columns) == [
+        'object_id', 'device_id', 'object_label', 'first_name', 'last_name',
+        'speed', 'latitude', 'longitude', 'device_time', 'last_connect',
+        'last_connect_formatted', 'geozones'
+    ]
+
+def test_poll_keeps_latest_point(poll_rows):
+    table = LiveStateTable(interval=0)
+    poll_rows.append((DB_NOW, 1, DB_NOW - pd.Timedelta(minutes=3), 10.0, 55.0, 37.0))
+    table.poll(None)
+    poll_rows[:] = [
+        (DB_NOW, 1, DB_NOW - pd.Timedelta(minutes=1), 0.0, 55.0, 37.0),
+        (DB_NOW, 2, DB_NOW - pd.Timedelta(minutes=2), 5.0, 56.0, 38.0),
+        (DB_NOW, 3, DB_NOW - pd.Timedelta(minutes=2), 5.0, 56.0, 38.0),
+    ]
+    table.poll(None)
+    frame = table.snapshot(None).frame
+    # Устройство 3 без объекта в справочнике не показывается
+    assert frame['device_id'].tolist() == [1, 2]
+    assert frame['speed'].tolist() == [0.0, 5.0]
+    assert frame['geozones'].tolist()[0] == 'База'
+    assert (frame['last_connect'] >= 60).all()
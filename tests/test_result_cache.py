@@ -0,0 +1,56 @@
+"""
+Совместная загрузка в кэше результатов: ожидающие получают результат или
+ошибку загрузки, которую ждали
+"""
+import threading
+import pytest
+from datasets.result_cache import ResultCache, ResultLoadError
+
+class _Interrupted(BaseException):
+    """
+    Прерывание загрузки не через Exception (как перезапуск скрипта Streamlit)
+    """
+
+def _coalesced(cache, error):
+    started = threading.Event()
+    release = threading.Event()
+    outcome = {}
+
+    def load():
+        started.set()
+        release.wait(5)
+        raise error
+
+    def leader():
+        try:
+            cache.get(('test', 1), load)
+        except BaseException as e:
+            outcome['leader'] = e
+
+    def waiter():
+        try:
+            outcome['waiter'] = cache.get(('test', 1), lambda: 'свой результат')
+        except BaseException as e:
+            outcome['waiter'] = e
+
+    threads = [threading.Thread(target=leader)]
+    threads[0].start()
+    started.wait(5)
+    threads.append(threading.Thread(target=waiter))
+    threads[1].start()
+    # Ожидающий присоединяется к загрузке лидера до ее завершения
+    for _ in range(500):
+        if cache.stats_frame()['coalesced'].sum() >= 1:
+            break
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcome
+
+@pytest.mark.parametrize('error', [ValueError('нет данных'), _Interrupted()])
+def test_waiter_gets_load_error(error):
+    outcome = _coalesced(ResultCache(wait_seconds=5), error)
+    assert outcome['leader'] is error
+    assert isinstance(outcome['waiter'], ResultLoadError)
+    assert outcome['waiter'].__cause__ is error
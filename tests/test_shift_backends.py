@@ -0,0 +1,128 @@
+"""
+Разметка треков: pandas (_segment_points, _aggregate_tracks, _finalize_tracks)
+против ожидаемой семантики SQL-разметки и backend='pandas' против backend='sql'
+
+Сверка backend выполняется на БД из переменных окружения PG* (как у
+psycopg2) и пропускается, если БД недоступна. Точки вставляются внутри
+транзакции, которая затем откатывается.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import psycopg2
+import pytest
+from datasets.shifts import _aggregate_tracks, _finalize_tracks, _segment_points, get_shifts_data
+
+MIN_SPEED = 3
+MAX_TIME_DIFF = 300
+T0 = datetime(2001, 1, 1, 8, 0)
+
+# (device_id, секунды от T0, speed, latitude, longitude, altitude); скорость и
+# координаты в единицах БД (скорость * 100, координаты * 1e7)
+POINTS = [
+    # Трек 1-1: первая точка устройства начинает трек, широта с пропуском
+    (1, 0, 0, 550000000, 370000000, 1500),
+    (1, 60, 500, 550000100, 370000100, 1510),
+    (1, 120, 800, None, 370000200, 1520),
+    (1, 180, 0, 550000300, 370000300, 1530),
+    # Трек 1-2: разрыв больше MAX_TIME_DIFF, точка без скорости не считается
+    (1, 580, 600, 550001000, 370001000, 1600),
+    (1, 640, None, 550001100, 370001100, 1610),
+    (1, 700, 2, 550001200, 370001200, 1620),
+    # Трек 1-3: разрыв ровно MAX_TIME_DIFF и начало движения после остановки
+    (1, 1000, 700, 550002000, 370002000, 1700),
+    (1, 1060, 900, 550002100, 370002100, 1710),
+    # Одна точка - фейковый трек
+    (1, 2000, 500, 550003000, 370003000, 1800),
+    # Медленный трек (max_speed < MIN_SPEED) отбрасывается
+    (2, 0, 1, 560000000, 380000000, 100),
+    (2, 30, 2, 560000100, 380000100, 110),
+    # Трек 2-1
+    (2, 1000, 300, 560001000, 380001000, 200),
+    (2, 1100, 500, 560001100, 380001100, 210),
+]
+
+def _at(seconds):
+    return pd.Timestamp(T0 + timedelta(seconds=seconds))
+
+# Ожидаемые треки по правилам SQL-разметки (_TRACKS_SQL): новый трек при
+# разрыве > MAX_TIME_DIFF или при начале движения после разрыва >= MAX_TIME_DIFF;
+# крайние координаты - первые и последние непустые, число точек - COUNT(speed)
+EXPECTED = pd.DataFrame([
+    ('1-1', 1, _at(0), _at(180), '0:03:00', 180.0, 3.25, 8.0, 0.0, 55.0, 37.0, 0.00015, 55.00003, 37.00003, 0.000153, 4),
+    ('1-2', 1, _at(580), _at(700), '0:02:00', 120.0, 3.01, 6.0, 0.02, 55.0001, 37.0001, 0.00016, 55.00012, 37.00012, 0.000162, 2),
+    ('1-3', 1, _at(1000), _at(1060), '0:01:00', 60.0, 8.0, 9.0, 7.0, 55.0002, 37.0002, 0.00017, 55.00021, 37.00021, 0.000171, 2),
+    ('2-1', 2, _at(1000), _at(1100), '0:01:40', 100.0, 4.0, 5.0, 3.0, 56.0001, 38.0001, 0.00002, 56.00011, 38.00011, 0.000021, 2),
+], columns=[
+    'track_id', 'device_id', 'track_start_time', 'track_end_time', 'track_duration',
+    'track_duration_seconds', 'avg_speed', 'max_speed', 'min_speed', 'latitude_start',
+    'longitude_start', 'altitude_start', 'latitude_end', 'longitude_end', 'altitude_end',
+    'points_in_track'
+])
+
+def _points_frame(device_offset=0):
+    df = pd.DataFrame(POINTS, columns=['device_id', 'seconds', 'speed', 'latitude', 'longitude', 'altitude'])
+    df['device_id'] += device_offset
+    df.insert(1, 'device_time', [T0 + timedelta(seconds=seconds) for seconds in df.pop('seconds')])
+    df['event_id'] = 2
+    return df.astype({'speed': 'float64', 'latitude': 'float64', 'longitude': 'float64', 'altitude': 'float64'})
+
+def _assert_tracks_equal(result, expected):
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False, rtol=1e-9
+    )
+
+def test_pandas_segmentation_matches_sql_semantics():
+    df = _segment_points(_points_frame(), MIN_SPEED, MAX_TIME_DIFF)
+    tracks = _finalize_tracks(_aggregate_tracks(df), MIN_SPEED)
+    _assert_tracks_equal(tracks, EXPECTED)
+
+def test_track_flags():
+    df = _segment_points(_points_frame(), MIN_SPEED, MAX_TIME_DIFF)
+    device = df[df['device_id'] == 1]
+    assert device['new_track_flag'].tolist() == [1, 0, 0, 0, 1, 0, 0, 1, 0, 1]
+    assert np.array_equal(device['temp_track_id'], [1, 1, 1, 1, 2, 2, 2, 3, 3, 4])
+
+@pytest.fixture
+def conn():
+    try:
+        connection = psycopg2.connect('', connect_timeout=3)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"БД недоступна: {e}")
+    try:
+        yield connection
+    finally:
+        connection.rollback()
+        connection.close()
+
+def test_backends_match(conn):
+    # Отрицательные device_id не пересекаются с реальными устройствами
+    points = _points_frame(device_offset=-1000)
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            '''
+                INSERT INTO raw_telematics_data.tracking_data_core
+                    (device_id, device_time, speed, latitude, longitude, altitude, event_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ''',
+            [
+                tuple(None if pd.isna(value) else value for value in row)
+                for row in points[['device_id', 'device_time', 'speed', 'latitude', 'longitude', 'altitude', 'event_id']]
+                .astype(object).itertuples(index=False)
+            ]
+        )
+    device_ids = sorted(points['device_id'].unique().tolist())
+    start_date, end_date = T0 - timedelta(hours=1), T0 + timedelta(hours=1)
+    results = {
+        backend: get_shifts_data(
+            conn, start_date, end_date, min_speed=MIN_SPEED, max_time_diff=MAX_TIME_DIFF,
+            device_ids=device_ids, backend=backend, workers=1
+        )
+        for backend in ('pandas', 'sql')
+    }
+    _assert_tracks_equal(results['sql'], results['pandas'])
+
+    expected = EXPECTED.copy()
+    expected['device_id'] -= 1000
+    expected['track_id'] = expected['device_id'].astype(str) + '-' + expected['track_id'].str.split('-').str[1]
+    _assert_tracks_equal(results['pandas'], expected)
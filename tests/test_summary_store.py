@@ -0,0 +1,27 @@
+"""
+Сводки по дням из хранилища против расчета без хранилищ на тестовой БД (см.
+conftest.py) на тех же запросах, что и для хранилища треков
+"""
+import pandas as pd
+import pytest
+from datasets.shifts import get_shifts_summary
+from datasets.summary_store import ShiftSummaryStore
+from datasets.track_store import TrackStore
+from tests.conftest import generate_points
+from tests.test_track_store import MAX_TIME_DIFF, MIN_SPEED, requests
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_stored_summary_matches_direct(fake_db, tmp_path, seed):
+    fake_db.points = generate_points(seed)
+    store = TrackStore(str(tmp_path / 'tracks.sqlite3'))
+    summary_store = ShiftSummaryStore(str(tmp_path / 'summary.sqlite3'))
+    for clock, start, end in requests():
+        fake_db.clock = clock
+        expected = get_shifts_summary(None, start, end, min_speed=MIN_SPEED, max_time_diff=MAX_TIME_DIFF, workers=1)
+        result = get_shifts_summary(
+            None, start, end, min_speed=MIN_SPEED, max_time_diff=MAX_TIME_DIFF, store=store, summary_store=summary_store
+        )
+        pd.testing.assert_frame_equal(
+            result.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False, rtol=1e-9,
+            obj=f'{start}..{end} при времени БД {clock}'
+        )
@@ -0,0 +1,58 @@
+"""
+Хранилище треков против расчета без хранилища на тестовой БД (см.
+conftest.py): повторные запросы с пересекающимися диапазонами, опоздавшие
+точки и конец диапазона раньше уже размеченного
+"""
+import pandas as pd
+import pytest
+from datasets.shifts import get_shifts_data
+from datasets.track_store import TrackStore
+from tests.conftest import generate_points
+
+MIN_SPEED = 3
+MAX_TIME_DIFF = 300
+
+# (время БД, начало, конец запроса)
+REQUESTS = [
+    # Разметка до времени БД, а не до конца запроса: трек через полночь
+    # дозаписывается целиком и затем обрезается по концу следующего запроса
+    ('2026-10-11 04:00', '2026-10-09', '2026-10-12'),
+    ('2026-10-11 05:00', '2026-10-08', '2026-10-11'),
+    # Конец раньше размеченного, начало не в полночь
+    ('2026-10-11 05:30', '2026-10-09 13:17', '2026-10-10 03:05'),
+    ('2026-10-11 06:00', '2026-10-10', '2026-10-10 00:20'),
+    # Опоздавшие точки появляются между запросами
+    ('2026-10-11 06:40', '2026-10-10', '2026-10-11 06:40'),
+    ('2026-10-11 07:10', '2026-10-11', '2026-10-11 07:10'),
+    ('2026-10-11 09:00', '2026-10-09', '2026-10-12'),
+    ('2026-10-11 23:50', '2026-10-10 22:00', '2026-10-11 23:50'),
+    ('2026-10-12 03:00', '2026-10-08', '2026-10-12'),
+    ('2026-10-12 06:00', '2026-10-08', '2026-10-12 06:00'),
+]
+
+def requests():
+    for clock, start, end in REQUESTS:
+        yield pd.Timestamp(clock), pd.Timestamp(start), pd.Timestamp(end)
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_stored_tracks_match_direct(fake_db, tmp_path, seed):
+    fake_db.points = generate_points(seed)
+    store = TrackStore(str(tmp_path / 'tracks.sqlite3'))
+    for clock, start, end in requests():
+        fake_db.clock = clock
+        expected = get_shifts_data(None, start, end, min_speed=MIN_SPEED, max_time_diff=MAX_TIME_DIFF, workers=1)
+        result = get_shifts_data(None, start, end, min_speed=MIN_SPEED, max_time_diff=MAX_TIME_DIFF, store=store)
+        pd.testing.assert_frame_equal(
+            result.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False, rtol=1e-9,
+            obj=f'{start}..{end} при времени БД {clock}'
+        )
+
+def test_store_keeps_later_horizon(fake_db, tmp_path):
+    store = TrackStore(str(tmp_path / 'tracks.sqlite3'))
+    fake_db.clock = pd.Timestamp('2026-10-11 05:00')
+    get_shifts_data(None, '2026-10-09', '2026-10-10', min_speed=MIN_SPEED, max_time_diff=MAX_TIME_DIFF, store=store)
+    assert store.horizon(MIN_SPEED, MAX_TIME_DIFF) == fake_db.clock
+    # Разметка по более раннему времени БД (отставшая реплика) не записывается
+    fake_db.clock = pd.Timestamp('2026-10-11 03:00')
+    get_shifts_data(None, '2026-10-09', '2026-10-10', min_speed=MIN_SPEED, max_time_diff=MAX_TIME_DIFF, store=store)
+    assert store.horizon(MIN_SPEED, MAX_TIME_DIFF) == pd.Timestamp('2026-10-11 05:00')